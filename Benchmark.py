@@ -0,0 +1,317 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import Sim
+import Render
+
+
+# default file the results of every benchmark run are appended to
+HISTORY = 'benchmarks.json'
+
+# whether a larger value of each metric is better, used by compare()
+METRICS = {
+    'steps_per_s': True,
+    'first_frame_s': False,
+    'lattice_s': False,
+    'peak_mb': False,
+    'stats_calls_per_s': True,
+    'frames_per_s': True,
+    'repeats_per_s': True,
+}
+
+# parameters every case starts from, each case changes one of them
+DEFAULTS = dict(p=0.8, l=5, dist=(0.7, 0.15, 0.1, 0.05), shape=(500, 500), engine='vectorized')
+
+SIZES = (100, 500, 1000, 2000, 4000)
+DENSITIES = (0.3, 0.6, 0.9)
+COOLDOWNS = (1, 5, 20)
+DISTRIBUTIONS = ((1, 0, 0, 0), (0.7, 0.15, 0.1, 0.05), (0.25, 0.25, 0.25, 0.25))
+
+
+def simulation_cases(quick=False):
+    """
+    the single simulation cases: every lattice size, and at the default size
+    every density, cooldown and distribution, for the vectorized and frontier engines
+
+    Args:
+        quick (bool, optional): leave out the lattices larger than 1000x1000. Defaults to False.
+
+    Returns:
+        list: dicts of case parameters
+    """
+    cases = []
+    for engine in ('vectorized', 'frontier'):
+        for size in SIZES:
+            if quick and size > 1000:
+                continue
+            cases.append(dict(DEFAULTS, shape=(size, size), engine=engine))
+        cases += [dict(DEFAULTS, p=p, engine=engine) for p in DENSITIES if p != DEFAULTS['p']]
+        cases += [dict(DEFAULTS, l=l, engine=engine) for l in COOLDOWNS if l != DEFAULTS['l']]
+        cases += [dict(DEFAULTS, dist=dist, engine=engine) for dist in DISTRIBUTIONS if dist != DEFAULTS['dist']]
+    return cases
+
+
+def case_name(case):
+    """a name which identifies a case across runs"""
+    shape = 'x'.join(str(side) for side in case['shape'])
+    dist = '-'.join(str(round(s, 2)) for s in case['dist'])
+    return f"simulation/{case['engine']}/{shape}/p{case['p']}/l{case['l']}/s{dist}"
+
+
+def new_simulation(case, iterations, seed=0):
+    return Sim.Simulation(case['p'], case['l'], *case['dist'], iterations, case['shape'],
+                          engine=case['engine'], seed=seed, early_stop=False)
+
+
+def bench_simulation(case, min_time=1.0, max_steps=200):
+    """
+    measures a single simulation: the time to create its lattice, the time until
+    the first frame is rendered as the GUI renders it, the steps run per second
+    and the peak memory allocated while creating it and running a few steps
+
+    Args:
+        case (dict): the case parameters
+        min_time (float, optional): seconds to keep stepping for. Defaults to 1.0.
+        max_steps (int, optional): largest number of steps timed. Defaults to 200.
+
+    Returns:
+        dict: the case's metrics
+    """
+    start = time.perf_counter()
+    simulation = new_simulation(case, max_steps)
+    lattice_s = time.perf_counter() - start
+    simulation.simulate_step()
+    Render.png_bytes(Render.render(Render.frame_values(simulation.lattice, 'cooldown'), 'cooldown'))
+    first_frame_s = time.perf_counter() - start
+
+    steps = 0
+    start = time.perf_counter()
+    while steps < max_steps-1 and (steps == 0 or time.perf_counter() - start < min_time):
+        simulation.simulate_step()
+        steps += 1
+    steps_per_s = steps / (time.perf_counter() - start)
+
+    # get_stats is called after every step by the GUI
+    calls = 10000
+    start = time.perf_counter()
+    for i in range(calls):
+        simulation.get_stats()
+    stats_calls_per_s = calls / (time.perf_counter() - start)
+
+    del simulation
+    tracemalloc.start()
+    simulation = new_simulation(case, 5)
+    for i in range(5):
+        simulation.simulate_step()
+    peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+    tracemalloc.stop()
+
+    return dict(lattice_s=lattice_s, first_frame_s=first_frame_s, steps_per_s=steps_per_s,
+                stats_calls_per_s=stats_calls_per_s, peak_mb=peak_mb)
+
+
+def bench_render(size=(100, 100), frames=50):
+    """
+    measures how many frames per second are colored, scaled and encoded
+    as png, the work Gui.draw_frame does for every iteration
+
+    Args:
+        size (tuple, optional): shape of the lattice. Defaults to (100, 100).
+        frames (int, optional): number of frames rendered. Defaults to 50.
+    """
+    simulation = new_simulation(dict(DEFAULTS, shape=size), frames)
+    values = []
+    for i in range(frames):
+        simulation.simulate_step()
+        values.append(Render.frame_values(simulation.lattice, 'got_rumour').copy())
+    start = time.perf_counter()
+    for frame in values:
+        Render.png_bytes(Render.render(frame, 'got_rumour'))
+    return dict(frames_per_s=frames / (time.perf_counter() - start))
+
+
+def bench_statistics(repeats=4, workers=1):
+    """
+    measures the repeat based statistics of main.py, generate_dist_stats and
+    generate_L_stats, in replicas per second, without the result cache. graphs are drawn without a display.
+
+    Args:
+        repeats (int, optional): replicas per parameter set. Defaults to 4.
+        workers (int, optional): number of worker processes. Defaults to 1.
+    """
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import main
+
+    results = {}
+    distributions = [list(dist) for dist in DISTRIBUTIONS]
+    start = time.perf_counter()
+    main.generate_dist_stats(distributions, 0.8, 5, repeats=repeats, seed=0, workers=workers, cache=False)
+    results['statistics/distributions'] = dict(
+        repeats_per_s=len(distributions) * repeats / (time.perf_counter() - start))
+    plt.close('all')
+
+    upper_limit = 5
+    start = time.perf_counter()
+    main.generate_L_stats(upper_limit, 0.8, DEFAULTS['dist'], repeats=repeats, seed=0, workers=workers, cache=False)
+    # generate_L_stats runs every L from 2 up to, but not including, the upper limit
+    results['statistics/cooldowns'] = dict(
+        repeats_per_s=len(range(2, upper_limit)) * repeats / (time.perf_counter() - start))
+    plt.close('all')
+    return results
+
+
+def environment():
+    """describes the machine and code the benchmarks ran on"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return dict(commit=commit or None, python=platform.python_version(), numpy=np.__version__,
+                machine=platform.machine(), processor=platform.processor(), cpus=os.cpu_count())
+
+
+def run(quick=False, label=None, min_time=1.0, workers=1):
+    """
+    runs the whole suite, printing each result as it finishes
+
+    Args:
+        quick (bool, optional): leave out the largest lattices. Defaults to False.
+        label (str, optional): name of the run in the history. Defaults to None.
+        min_time (float, optional): seconds each simulation case keeps stepping for. Defaults to 1.0.
+        workers (int, optional): worker processes of the statistics benchmarks. Defaults to 1.
+
+    Returns:
+        dict: the run, with its time, environment and results by benchmark name
+    """
+    results = {}
+    def report(name, metrics):
+        results[name] = metrics
+        print(name, ' '.join(f"{key}={value:.4g}" for key, value in metrics.items()), flush=True)
+
+    for case in simulation_cases(quick):
+        report(case_name(case), bench_simulation(case, min_time))
+    for size in ((100, 100), (1000, 1000)):
+        report(f"render/{size[0]}x{size[1]}", bench_render(size))
+    for name, metrics in bench_statistics(workers=workers).items():
+        report(name, metrics)
+
+    return dict(time=datetime.datetime.now().isoformat(timespec='seconds'), label=label,
+                environment=environment(), results=results)
+
+
+def load_history(path):
+    """
+    Returns:
+        list: the runs stored in a history file, oldest first
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_run(path, result):
+    """appends a run to a history file"""
+    history = load_history(path)
+    history.append(result)
+    with open(path, 'w') as file:
+        json.dump(history, file, indent=1)
+
+
+def find_run(history, key):
+    """
+    Args:
+        history (list): runs from load_history()
+        key (str): a run's label, or its index in the history, negative from the newest
+
+    Returns:
+        dict: the run
+    """
+    for result in reversed(history):
+        if result.get('label') == key:
+            return result
+    try:
+        return history[int(key)]
+    except (ValueError, IndexError):
+        raise ValueError(f"no run labelled or numbered '{key}' in the history")
+
+
+def compare(base, head, threshold=0.1):
+    """
+    compares every metric two runs share
+
+    Args:
+        base (dict): the run compared against
+        head (dict): the newer run
+        threshold (float, optional): relative change beyond which a metric
+        counts as a slowdown. Defaults to 0.1.
+
+    Returns:
+        list: (benchmark, metric, base value, head value, change, slowdown) tuples, where change is
+        the relative improvement, negative when the head is worse
+    """
+    rows = []
+    for name in sorted(set(base['results']) & set(head['results'])):
+        for metric, higher_better in METRICS.items():
+            before = base['results'][name].get(metric)
+            after = head['results'][name].get(metric)
+            if not before or after is None:
+                continue
+            change = (after - before) / before
+            if not higher_better:
+                change = -change
+            rows.append((name, metric, before, after, change, change < -threshold))
+    return rows
+
+
+def cli(argv=None):
+    """
+    command line entry point:
+        Benchmark.py run      runs the suite and appends its results to the history
+        Benchmark.py compare  compares two runs of the history, exiting with 1 on a slowdown
+    """
+    parser = argparse.ArgumentParser(prog='Benchmark.py', description='Rumour spreading simulator benchmarks')
+    parser.add_argument('--history', default=HISTORY, help='history file of benchmark runs')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = commands.add_parser('run', help='run the benchmark suite')
+    run_parser.add_argument('--quick', action='store_true', help='leave out lattices larger than 1000x1000')
+    run_parser.add_argument('--label', help='name of the run, to compare it by')
+    run_parser.add_argument('--min-time', type=float, default=1.0, help='seconds each simulation case steps for')
+    run_parser.add_argument('--workers', type=int, default=1, help='worker processes of the statistics benchmarks')
+
+    compare_parser = commands.add_parser('compare', help='compare two runs')
+    compare_parser.add_argument('base', nargs='?', default='-2', help='label or index of the base run, defaults to the one before last')
+    compare_parser.add_argument('head', nargs='?', default='-1', help='label or index of the new run, defaults to the last')
+    compare_parser.add_argument('--threshold', type=float, default=0.1, help='relative slowdown which is flagged')
+
+    args = parser.parse_args(argv)
+    if args.command == 'run':
+        result = run(args.quick, args.label, args.min_time, args.workers)
+        save_run(args.history, result)
+        print(f"saved to {args.history}")
+        return 0
+
+    history = load_history(args.history)
+    base, head = find_run(history, args.base), find_run(history, args.head)
+    slowdowns = 0
+    for name, metric, before, after, change, slowdown in compare(base, head, args.threshold):
+        slowdowns += slowdown
+        flag = 'SLOWER' if slowdown else ''
+        print(f"{name:60} {metric:18} {before:12.4g} {after:12.4g} {change*100:+7.1f}% {flag}")
+    print(f"{slowdowns} slowdowns beyond {args.threshold*100:g}%")
+    return 1 if slowdowns else 0
+
+
+if __name__ == '__main__':
+    sys.exit(cli())
@@ -0,0 +1,201 @@
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import numpy as np
+import Sim
+
+try:
+    import fcntl
+except ImportError:
+    # without file locks, as on windows, writes are still atomic and the last one wins
+    fcntl = None
+
+
+# default directory of the cache
+DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'rumour')
+
+# default size limit of the cache, in bytes
+MAX_BYTES = 256 << 20
+
+
+def canonical(value):
+    """
+    converts a value into plain json types which describe it fully, so that
+    equal parameters always give the same text. strategies are described by
+    their class and attributes, and functions by their module and name,
+    so lambdas and nested functions can not be described.
+
+    Args:
+        value: a parameter value, a dict of them, or a random stream
+
+    Returns:
+        the description, or raises TypeError when the value can not be described
+    """
+    if isinstance(value, dict):
+        return {str(key): canonical(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, np.ndarray):
+        # nan is not valid json, tiles use it where no one is placed
+        return dict(array=[None if item != item else item for item in value.ravel().tolist()], shape=value.shape)
+    if isinstance(value, np.generic):
+        return value.item()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.random.SeedSequence):
+        return dict(entropy=canonical(value.entropy), spawn_key=canonical(value.spawn_key))
+    if hasattr(value, '__qualname__'):
+        if '<' in value.__qualname__:
+            raise TypeError(f"can not describe {value!r} for the cache")
+        return dict(function=f"{value.__module__}.{value.__qualname__}")
+    if hasattr(value, '__dict__'):
+        return dict({'class': f"{type(value).__module__}.{type(value).__qualname__}"}, **canonical(vars(value)))
+    raise TypeError(f"can not describe {value!r} for the cache")
+
+
+def result_key(params, stats_sr, stream=None):
+    """
+    the key of the replicas of a parameter set
+
+    Args:
+        params (dict): Simulation arguments, as in Sweep.sweep()
+        stats_sr (int): number of iterations between spread samples
+        stream (SeedSequence, optional): the random stream the replicas are seeded from,
+        None for replicas from fresh entropy, which any unseeded study may reuse. Defaults to None.
+
+    Returns:
+        str: a hash of the parameters, stream and Sim.VERSION, or None if a parameter can not be described
+    """
+    try:
+        description = canonical(dict(params=params, stats_sr=stats_sr, stream=stream, version=Sim.VERSION))
+    except TypeError:
+        return None
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+
+class ResultCache:
+
+    def __init__(self, directory=DIRECTORY, max_bytes=MAX_BYTES):
+        """
+        an on disk cache of the spread curves of the replicas of parameter sets,
+        one file per key, see result_key(). a study which asks for more replicas than
+        are cached only runs the missing ones and stores them all.
+        the least recently used files are removed once the cache grows beyond max_bytes.
+        files are replaced atomically and changes are made under a file lock, so
+        several processes may share a cache.
+
+        Args:
+            directory (str, optional): directory of the cache's files. Defaults to DIRECTORY.
+            max_bytes (int, optional): size limit of the cache. Defaults to MAX_BYTES.
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    @contextlib.contextmanager
+    def locked(self):
+        """holds the cache's lock, between processes, while the cache is changed"""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, 'lock'), 'w') as file:
+            fcntl.flock(file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file, fcntl.LOCK_UN)
+
+    def load(self, key):
+        """
+        Args:
+            key (str): key of the replicas
+
+        Returns:
+            (ndarray, ndarray): the spread curve of every cached replica, shaped (replicas, samples),
+            and the iteration each one's spread stopped at, or None if none are cached
+        """
+        path = self.path(key)
+        try:
+            with np.load(path) as file:
+                spread, termination = file['spread'], file['termination']
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError):
+            # a file left broken by a crash is a miss
+            return None
+        # the file's modification time is its last use
+        with contextlib.suppress(OSError):
+            os.utime(path)
+        return spread, termination
+
+    def store(self, key, spread, termination):
+        """
+        stores the replicas of a key, unless more of them are already cached,
+        and evicts the least recently used files beyond the size limit
+
+        Args:
+            key (str): key of the replicas
+            spread (ndarray): the spread curve of every replica, shaped (replicas, samples)
+            termination (ndarray): the iteration each replica's spread stopped at
+        """
+        with self.locked():
+            cached = self.load(key)
+            if cached is not None and len(cached[0]) >= len(spread):
+                return
+            with tempfile.NamedTemporaryFile(dir=self.directory, suffix='.tmp', delete=False) as file:
+                np.savez_compressed(file, spread=spread, termination=termination)
+            os.replace(file.name, self.path(key))
+            self.evict()
+
+    def entries(self):
+        """
+        Returns:
+            list: (last use, size, path) of every file in the cache
+        """
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz'):
+                with contextlib.suppress(OSError):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def size(self):
+        """total bytes of the cache's files"""
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """removes the least recently used files until the cache fits its size limit"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for used, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            with contextlib.suppress(OSError):
+                os.remove(path)
+            total -= size
+
+    def clear(self):
+        """removes every file of the cache"""
+        with self.locked():
+            for used, size, path in self.entries():
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+
+
+def get_cache(cache):
+    """
+    Args:
+        cache (bool or ResultCache): a cache, True for one in DIRECTORY or False for none
+
+    Returns:
+        ResultCache: the cache, or None
+    """
+    if cache is True:
+        return ResultCache()
+    return cache or None
@@ -0,0 +1,457 @@
+import collections
+import numpy as np
+from scipy import sparse
+from Lattice import SUS_LEVELS
+
+
+def neighbour_count(spreaders):
+    """
+    counts for every cell how many of its 4 neighbours (above, below,
+    left and right) are spreading the rumour, using shifted slices of
+    the whole lattice. cells at the lattice's edge have no neighbours
+    beyond it, there is no wraparound.
+    the last two axes are the lattice, any leading axes are kept as is.
+
+    Args:
+        spreaders (ndarray): boolean array, true where a cell spreads the rumour
+
+    Returns:
+        ndarray: uint8 array of the same shape with the number of spreading neighbours
+    """
+    counts = np.zeros(spreaders.shape, dtype=np.uint8)
+    counts[..., 1:, :] += spreaders[..., :-1, :]
+    counts[..., :-1, :] += spreaders[..., 1:, :]
+    counts[..., :, 1:] += spreaders[..., :, :-1]
+    counts[..., :, :-1] += spreaders[..., :, 1:]
+    return counts
+
+
+def neighbour_cells(cells, shape):
+    """
+    finds the 4 neighbours of the given cells, without wraparound
+
+    Args:
+        cells (ndarray): row major indices of cells
+        shape (tuple): shape of the array the cells are in, the last two axes are the lattice
+
+    Returns:
+        ndarray: row major indices of every neighbour, once per cell it neighbours
+    """
+    height, width = shape[-2:]
+    rows, cols = np.divmod(cells, width)
+    rows %= height
+    return np.concatenate((cells[rows > 0] - width, cells[rows < height-1] + width,
+                           cells[cols > 0] - 1, cells[cols < width-1] + 1))
+
+
+def per_lattice(flat_indices, shape):
+    """
+    counts how many of the given cells fall in each lattice of a stacked array
+
+    Args:
+        flat_indices (ndarray): row major indices of cells in an array of the given shape
+        shape (tuple): shape of the array, the last two axes are the lattice
+
+    Returns:
+        ndarray: number of cells per lattice, shaped like the leading axes
+    """
+    lattices = shape[:-2]
+    counts = np.bincount(flat_indices // (shape[-2] * shape[-1]), minlength=int(np.prod(lattices)))
+    return counts.reshape(lattices)
+
+
+def vectorized_step(lattice, l, rng, profiler=None, draw=None):
+    """
+    run one iteration of the simulation on the whole lattice at once.
+    follows the same rules as Simulation.loop_step, and draws one random
+    number per deciding cell in the same (row major) order, so given the
+    same random generator both produce the same lattice.
+
+    Args:
+        lattice (CellLattice): a lattice of cells, updated in place
+        l (int): number of iterations cooldown on spreading a rumour
+        rng (Generator): the simulation's random number generator
+        profiler (Profiler, optional): records the time of each phase. Defaults to None.
+        draw (function, optional): called with the row major indices of the deciding people, in order,
+        returns a uniform random number for each. Defaults to None, drawing them all from rng.
+
+    Returns:
+        (ndarray, ndarray): number of people who heard the rumour for the first time,
+        and number of people who decided to spread it, per lattice
+    """
+    exists = lattice.exists
+    cooldown = lattice.cooldown
+
+    # people who decided to spread the rumour last iteration
+    # pass it on to all existing neighbours
+    spreaders = exists & (cooldown == l)
+    heard = neighbour_count(spreaders)
+    heard *= exists
+    lattice.heard_rumour = heard
+    reached = np.flatnonzero(heard)
+    got_rumour = lattice.got_rumour.ravel()
+    newly_reached = reached[got_rumour[reached] == 0]
+    got_rumour[reached] += heard.ravel()[reached]
+    if profiler:
+        profiler.mark('spread')
+
+    # current iteration counts towards the cooldown of
+    # everyone who has spread the rumour in the last l iterations
+    np.subtract(cooldown, 1, out=cooldown, where=exists & (cooldown > 0))
+    if profiler:
+        profiler.mark('cooldown')
+
+    # decide whether or not to pass on the rumour, hearing it
+    # at least twice adds 1/3 to the susceptibility level.
+    # flat indices keep the deciding cells in row major order
+    deciding = np.flatnonzero((cooldown == 0) & (heard > 0))
+    threshold = SUS_LEVELS[lattice.sus_index.ravel()[deciding]] + (heard.ravel()[deciding] > 1) / 3
+    if profiler:
+        profiler.mark('decide')
+    draws = rng.random(threshold.size) if draw is None else draw(deciding)
+    if profiler:
+        profiler.mark('rng')
+    decided = deciding[draws < threshold]
+    cooldown.ravel()[decided] = l
+
+    if profiler:
+        profiler.mark('apply')
+        # every cell is visited by the whole lattice operations
+        profiler.count('spreads', int(heard.sum(dtype=np.int64)))
+        profiler.count('draws', draws.size)
+        profiler.count('visited', cooldown.size)
+    return per_lattice(newly_reached, lattice.shape), per_lattice(decided, lattice.shape)
+
+
+class FrontierEngine:
+
+    def __init__(self, lattice, l):
+        """
+        an engine which only visits the cells taking part in the spread:
+        the people spreading the rumour, their neighbours and the people in cooldown.
+        people in cooldown are kept in a timing wheel of l buckets, one per iteration
+        in which they decided to spread, so the bucket to expire is always the oldest.
+        it keeps row major order wherever it draws random numbers, so given the same
+        random generator it produces the same lattice as vectorized_step.
+        the lattice must only be changed through step() once the engine is created.
+
+        Args:
+            lattice (CellLattice): the lattice to run on, with its initial spreaders set
+            l (int): number of iterations cooldown on spreading a rumour
+        """
+        self.l = l
+        self.shape = lattice.shape
+        exists = lattice.exists.ravel()
+        cooldown = lattice.cooldown.ravel()
+
+        # bucket i holds the people whose cooldown is i+1, oldest first
+        self.wheel = collections.deque(
+            (np.flatnonzero(exists & (cooldown == c)) for c in range(1, l+1)), maxlen=l)
+        self.last_heard = np.flatnonzero(lattice.heard_rumour)
+
+    def neighbours(self, cells):
+        """finds the 4 neighbours of the given cells, see neighbour_cells"""
+        return neighbour_cells(cells, self.shape)
+
+    def step(self, lattice, rng, profiler=None):
+        """
+        run one iteration of the simulation on the active cells
+
+        Args:
+            lattice (CellLattice): the lattice the engine was created for, updated in place
+            rng (Generator): the simulation's random number generator
+            profiler (Profiler, optional): records the time of each phase. Defaults to None.
+
+        Returns:
+            (ndarray, ndarray): number of people who heard the rumour for the first time,
+            and number of people who decided to spread it, per lattice
+        """
+        heard_rumour = lattice.heard_rumour.ravel()
+        got_rumour = lattice.got_rumour.ravel()
+        cooldown = lattice.cooldown.ravel()
+        heard_rumour[self.last_heard] = 0
+        if profiler:
+            profiler.mark('reset')
+
+        # people who decided to spread the rumour last iteration
+        # pass it on to all existing neighbours
+        targets = self.neighbours(self.wheel[-1])
+        targets = targets[lattice.exists_flat(targets)]
+        reached, heard = np.unique(targets, return_counts=True)
+        heard_rumour[reached] = heard
+        newly_reached = reached[got_rumour[reached] == 0]
+        got_rumour[reached] += heard.astype(got_rumour.dtype)
+        if profiler:
+            profiler.mark('spread')
+
+        # current iteration counts towards the cooldown of everyone in the wheel,
+        # the oldest bucket reaches 0 and leaves it when the new one is added
+        for bucket in self.wheel:
+            cooldown[bucket] -= 1
+        if profiler:
+            profiler.mark('cooldown')
+
+        # decide whether or not to pass on the rumour, reached is
+        # sorted so the deciding cells are in row major order
+        ready = cooldown[reached] == 0
+        deciding = reached[ready]
+        threshold = SUS_LEVELS[lattice.sus_index.ravel()[deciding]] + (heard[ready] > 1) / 3
+        if profiler:
+            profiler.mark('decide')
+        draws = rng.random(threshold.size)
+        if profiler:
+            profiler.mark('rng')
+        decided = deciding[draws < threshold]
+        cooldown[decided] = self.l
+
+        if profiler:
+            profiler.mark('apply')
+            # the spreaders' neighbours and everyone in the wheel are visited
+            profiler.count('spreads', len(targets))
+            profiler.count('draws', draws.size)
+            profiler.count('visited', len(targets) + sum(len(bucket) for bucket in self.wheel))
+        self.wheel.append(decided)
+        self.last_heard = reached
+
+        return per_lattice(newly_reached, lattice.shape), per_lattice(decided, lattice.shape)
+
+
+def stripe_step(lattice, start, stop, exists, cooldown, spreaders, above, below, l, draw, profiler=None):
+    """
+    runs one iteration on a block of whole rows of a 2d lattice, the rows from start to stop,
+    following the rules of vectorized_step. the spreaders of the rows just above and below
+    the block are given as they were before the iteration, so the rumour crosses into the
+    block exactly however the rest of the lattice is updated.
+
+    Args:
+        lattice (CellLattice): the lattice, its heard_rumour, got_rumour and cooldown rows are updated
+        start (int): first row of the block
+        stop (int): row after the block's last row
+        exists (ndarray): the block's mask of existing people
+        cooldown (ndarray): a copy of the block's cooldowns, updated and written back to the lattice
+        spreaders (ndarray): the block's people who spread the rumour this iteration
+        above (ndarray): spreaders of the row above the block, None at the lattice's edge
+        below (ndarray): spreaders of the row below the block, None at the lattice's edge
+        l (int): number of iterations cooldown on spreading a rumour
+        draw (function): called with the row major indices within the block of the deciding people,
+        in order, returns a uniform random number for each
+        profiler (Profiler, optional): records the time of each phase. Defaults to None.
+
+    Returns:
+        (int, ndarray, int): number of people who heard the rumour for the first time, row major
+        indices within the block of the people who decided to spread it, and number of people who heard it
+    """
+    width = lattice.shape[-1]
+    halo = np.zeros((stop - start + 2, width), dtype=bool)
+    halo[1:-1] = spreaders
+    if above is not None:
+        halo[0] = above
+    if below is not None:
+        halo[-1] = below
+    heard = neighbour_count(halo)[1:-1]
+    heard *= exists
+    lattice.heard_rumour[start:stop] = heard
+    reached = np.flatnonzero(heard)
+    reached_count = reached.size
+    newly_reached = 0
+    if reached_count:
+        got_rumour = np.array(lattice.got_rumour[start:stop]).ravel()
+        newly_reached = np.count_nonzero(got_rumour[reached] == 0)
+        got_rumour[reached] += heard.ravel()[reached]
+        lattice.got_rumour[start:stop] = got_rumour.reshape(stop - start, width)
+        del got_rumour
+    # freed before the decisions, whose temporaries take the most memory
+    del reached
+    if profiler:
+        profiler.mark('spread')
+
+    np.subtract(cooldown, 1, out=cooldown, where=exists & (cooldown > 0))
+    if profiler:
+        profiler.mark('cooldown')
+
+    deciding = np.flatnonzero((cooldown == 0) & (heard > 0))
+    sus_index = lattice.sus_index[start:stop].ravel()
+    threshold = SUS_LEVELS[sus_index[deciding]]
+    threshold += (heard.ravel()[deciding] > 1) / 3
+    if profiler:
+        profiler.mark('decide')
+    draws = draw(deciding)
+    if profiler:
+        profiler.mark('rng')
+    decided = deciding[draws < threshold]
+    cooldown.ravel()[decided] = l
+    lattice.cooldown[start:stop] = cooldown
+    if profiler:
+        profiler.mark('apply')
+        profiler.count('spreads', int(heard.sum(dtype=np.int64)))
+        profiler.count('draws', draws.size)
+    return newly_reached, decided, reached_count
+
+
+class TiledEngine:
+
+    # bytes a cell of a block may take while the block is processed, in the worst case of every
+    # cell hearing the rumour and deciding: about 6 for the block's masks, copied counters and
+    # neighbour counts, and 32 for the 8 byte arrays of the deciding cells, their indices,
+    # thresholds and draws and the indices of the decided ones, 38 as measured, rounded up
+    BYTES_PER_CELL = 40
+
+    def __init__(self, lattice, l, tile_budget=64<<20):
+        """
+        an engine for lattices kept in memory mapped files, see CellLattice, which may be
+        larger than the memory. the lattice is processed one tile, a block of whole rows,
+        at a time from top to bottom, so the deciding people draw their random numbers in
+        the same row major order as in vectorized_step, and both produce the same lattice.
+        each tile also reads the spreaders of the rows just above and below it, a one cell
+        halo, so the rumour crosses between tiles exactly. tiles in which nothing can change,
+        with no one in cooldown, no one who heard the rumour last iteration and no spreader
+        in them or the tiles next to them, are skipped without being read.
+        the lattice must only be changed through step() once the engine is created.
+
+        Args:
+            lattice (CellLattice): the lattice to run on, with its initial spreaders set
+            l (int): number of iterations cooldown on spreading a rumour
+            tile_budget (int, optional): bytes of memory a tile may take while it is processed. Defaults to 64MB.
+        """
+        self.l = l
+        self.shape = lattice.shape
+        height, width = self.shape
+        self.rows = max(1, min(height, tile_budget // (width * self.BYTES_PER_CELL)))
+        self.starts = range(0, height, self.rows)
+
+        # activity of every tile: people in cooldown, people about to
+        # spread the rumour, and whether anyone heard it last iteration
+        self.in_cooldown = np.zeros(len(self.starts), dtype=np.int64)
+        self.spreading = np.zeros(len(self.starts), dtype=np.int64)
+        self.heard = np.zeros(len(self.starts), dtype=bool)
+        for tile, start in enumerate(self.starts):
+            exists = lattice.exists_rows(start, start + self.rows)
+            cooldown = lattice.cooldown[start:start + self.rows]
+            self.in_cooldown[tile] = np.count_nonzero(exists & (cooldown > 0))
+            self.spreading[tile] = np.count_nonzero(exists & (cooldown == l))
+            self.heard[tile] = lattice.heard_rumour[start:start + self.rows].any()
+
+    def step(self, lattice, rng, profiler=None):
+        """
+        run one iteration of the simulation, one tile at a time
+
+        Args:
+            lattice (CellLattice): the lattice the engine was created for, updated in place
+            rng (Generator): the simulation's random number generator
+            profiler (Profiler, optional): records the time of each phase. Defaults to None.
+
+        Returns:
+            (int, int): number of people who heard the rumour for the first time,
+            and number of people who decided to spread it
+        """
+        height = self.shape[0]
+        newly_reached = 0
+        decided_count = 0
+        visited = 0
+        # spreaders before this iteration, the tiles above are updated before the ones below them
+        spreading = self.spreading.copy()
+        above = None
+
+        for tile, start in enumerate(self.starts):
+            stop = min(start + self.rows, height)
+            near = spreading[max(tile-1, 0):tile+2].any()
+            if not (near or self.in_cooldown[tile] or self.heard[tile]):
+                # a skipped tile has no spreaders, so its last row has none for the next tile
+                above = None
+                continue
+
+            exists = lattice.exists_rows(start, stop)
+            cooldown = np.array(lattice.cooldown[start:stop])
+            spreaders = exists & (cooldown == self.l)
+            below = None
+            if stop < height:
+                below = lattice.exists_rows(stop, stop+1)[0] & (lattice.cooldown[stop] == self.l)
+            newly, decided, reached = stripe_step(lattice, start, stop, exists, cooldown, spreaders,
+                                                  above, below, self.l, lambda deciding: rng.random(deciding.size), profiler)
+            above = spreaders[-1]
+
+            self.in_cooldown[tile] = np.count_nonzero(cooldown)
+            self.spreading[tile] = len(decided)
+            self.heard[tile] = reached > 0
+            newly_reached += newly
+            decided_count += len(decided)
+            visited += cooldown.size
+
+        if profiler:
+            profiler.count('visited', visited)
+        return newly_reached, decided_count
+
+
+class GraphEngine:
+
+    def __init__(self, lattice, graph, l):
+        """
+        an engine for people joined by an arbitrary contact graph rather than the grid.
+        cells of the lattice are the graph's nodes in row major order, and the rumour
+        passes along the graph's edges: the number of times each person hears it is
+        the product of the incoming adjacency matrix with the vector of spreaders.
+        the decisions follow the rules of vectorized_step and draw in the same order,
+        so on Graph.grid_graph it produces the same lattice as the other engines.
+
+        Args:
+            lattice (CellLattice): the lattice to run on, with its initial spreaders set
+            graph (csr_matrix): the contact graph, graph[u, v] nonzero when u passes the rumour to v
+            l (int): number of iterations cooldown on spreading a rumour
+        """
+        self.l = l
+        exists = lattice.exists.ravel()
+        graph = graph.tocsr()
+        # only edges between existing people pass the rumour
+        sources = np.repeat(np.arange(graph.shape[0]), np.diff(graph.indptr))
+        keep = exists[sources] & exists[graph.indices]
+        indptr = np.concatenate(([0], np.cumsum(np.bincount(sources[keep], minlength=graph.shape[0]))))
+        graph = sparse.csr_matrix((np.ones(np.count_nonzero(keep), dtype=np.int32), graph.indices[keep], indptr),
+                                  shape=graph.shape)
+        # the transpose is a csc view of the same arrays, whose rows are the incoming edges
+        self.incoming = graph.T
+
+    def step(self, lattice, rng, profiler=None):
+        """
+        run one iteration of the simulation along the graph's edges
+
+        Args:
+            lattice (CellLattice): the lattice the engine was created for, updated in place
+            rng (Generator): the simulation's random number generator
+            profiler (Profiler, optional): records the time of each phase. Defaults to None.
+
+        Returns:
+            (int, int): number of people who heard the rumour for the first time,
+            and number of people who decided to spread it
+        """
+        cooldown = lattice.cooldown.reshape(-1)
+        spreaders = (cooldown == self.l).astype(np.int32)
+        heard = self.incoming @ spreaders
+        lattice.heard_rumour.reshape(-1)[...] = heard
+        reached = np.flatnonzero(heard)
+        got_rumour = lattice.got_rumour.reshape(-1)
+        newly_reached = np.count_nonzero(got_rumour[reached] == 0)
+        got_rumour[reached] += heard[reached].astype(got_rumour.dtype)
+        if profiler:
+            profiler.mark('spread')
+
+        # only people ever have a cooldown
+        np.subtract(cooldown, 1, out=cooldown, where=cooldown > 0)
+        if profiler:
+            profiler.mark('cooldown')
+
+        deciding = np.flatnonzero((cooldown == 0) & (heard > 0))
+        threshold = SUS_LEVELS[lattice.sus_index.reshape(-1)[deciding]] + (heard[deciding] > 1) / 3
+        if profiler:
+            profiler.mark('decide')
+        draws = rng.random(threshold.size)
+        if profiler:
+            profiler.mark('rng')
+        decided = deciding[draws < threshold]
+        cooldown[decided] = self.l
+
+        if profiler:
+            profiler.mark('apply')
+            profiler.count('spreads', int(heard.sum(dtype=np.int64)))
+            profiler.count('draws', draws.size)
+            profiler.count('visited', cooldown.size)
+        return newly_reached, len(decided)
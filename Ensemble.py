@@ -0,0 +1,154 @@
+import numpy as np
+import Engine
+from Lattice import CellLattice, random_lattice
+
+
+class Ensemble:
+
+    def __init__(self, p, l, s1, s2, s3, s4, iterations=100, shape=(100,100), strategy=None, replicas=15, seed=None, early_stop=True,
+                 seeds=None):
+        """
+        runs several independent replicas of the same simulation together,
+        stacked on the leading axis of one (replicas, *shape) lattice, so
+        every iteration advances all of them with a single vectorized step.
+        every replica draws from its own random number generator, in the order
+        a Simulation would, so a replica is the very simulation a vectorized
+        Simulation with the replica's seed runs, whichever replicas it is stacked with.
+
+        Args:
+            p (float): portion of existing cells
+            l (int): number of iterations cooldown on spreading a rumour
+            s1 (float): level one susceptibility portion
+            s2 (float): level two susceptibility portion
+            s3 (float): level three susceptibility portion
+            s4 (float): level four susceptibility portion
+            iterations (int, optional): number of iterations. Defaults to 100.
+            shape (tuple, optional): shape of each replica's lattice. Defaults to (100,100).
+            strategy (function, optional): a strategy, called once per replica with the shape
+            and the replica's random number generator, which returns a predefined lattice.
+            replicas (int, optional): number of replicas. Defaults to 15.
+            seed (int, SeedSequence or Generator, optional): seed the replicas' random number
+            generators are spawned from. Defaults to fresh entropy.
+            early_stop (bool, optional): if true, run() stops as soon as no replica can spread
+            the rumour anymore and fills the remaining samples with the final spread. Defaults to True.
+            seeds (list, optional): the seed of every replica's generator, which replaces
+            replicas and seed. Defaults to None.
+        """
+        if p == 0 :
+            exit(-1)
+        if seeds == None:
+            self.rngs = np.random.default_rng(seed).spawn(replicas)
+        else:
+            self.rngs = [np.random.default_rng(replica_seed) for replica_seed in seeds]
+            replicas = len(seeds)
+        self.p = p
+        self.distribution = (s1, s2, s3, s4)
+
+        self.l = l
+        self.shape = shape
+        self.iterations = iterations
+        self.replicas = replicas
+        self.early_stop = early_stop
+        lattice_shape = (replicas, *shape)
+
+        self.lattice = CellLattice(lattice_shape, self.l, self.iterations)
+        for replica, rng in enumerate(self.rngs):
+            # every replica gets its own lattice, as separate simulations would
+            if strategy == None:
+                single = random_lattice(shape, self.p, self.distribution, rng, self.l, self.iterations)
+            else:
+                single = strategy(shape, rng)
+                if not isinstance(single, CellLattice):
+                    single = CellLattice.from_records(single, self.l, self.iterations)
+            self.lattice.exists_bits[replica] = single.exists_bits
+            self.lattice.sus_index[replica] = single.sus_index
+
+            # set the initial spreader at a random cell where a person exists
+            exists = single.exists
+            while True:
+                x = rng.integers(low=0, high=shape[0])
+                y = rng.integers(low=0, high=shape[1])
+                if exists[x, y]:
+                    break
+            self.lattice.cooldown[replica, x, y] = self.l
+
+        # people reached so far, kept up to date by every step
+        self.population = np.count_nonzero(self.lattice.exists.reshape(replicas, -1), axis=-1)
+        self.reached = np.zeros(replicas, dtype=int)
+        # people about to spread the rumour, and the number of iterations
+        # each replica ran until no one was left to spread it
+        self.spreading = np.ones(replicas, dtype=int)
+        self.termination = np.full(replicas, self.iterations)
+        self.iteration = 0
+
+    def draw(self, deciding):
+        """
+        Args:
+            deciding (ndarray): row major indices of the deciding people of every replica, in order
+
+        Returns:
+            ndarray: a uniform random number for each, from its replica's generator
+        """
+        draws = np.empty(deciding.size)
+        replicas, firsts = np.unique(deciding // (self.shape[0] * self.shape[1]), return_index=True)
+        lasts = np.append(firsts[1:], deciding.size)
+        for replica, first, last in zip(replicas, firsts, lasts):
+            draws[first:last] = self.rngs[replica].random(last - first)
+        return draws
+
+    def simulate_step(self):
+        """
+        run one iteration of every replica
+        """
+        newly_reached, decided = Engine.vectorized_step(self.lattice, self.l, None, draw=self.draw)
+        self.reached += newly_reached
+        self.iteration += 1
+        stopped = (decided == 0) & (self.spreading > 0)
+        self.termination[stopped] = self.iteration
+        self.spreading = decided
+
+    @property
+    def quiescent(self):
+        """true when no replica has anyone about to spread the rumour"""
+        return not self.spreading.any()
+
+    def run(self, stats_sr=5):
+        """
+        runs all replicas for the set number of iterations, sampling
+        the spread of each one every stats_sr iterations.
+
+        Args:
+            stats_sr (int, optional): number of iterations between spread samples. Defaults to 5.
+
+        Returns:
+            (ndarray, ndarray): the spread of every replica, shaped (replicas, iterations//stats_sr),
+            and the spread averaged over all replicas
+        """
+        stats = np.zeros((self.replicas, self.iterations//stats_sr))
+        for i in range (self.iterations):
+            self.simulate_step()
+            if i % stats_sr == 0:
+                index = (i//stats_sr)
+                if index < stats.shape[1]:
+                    stats[:, index] = self.get_stats()
+            if self.early_stop and self.quiescent:
+                break
+
+        # the spread of every replica is final, fill the skipped samples
+        # and count down the remaining cooldowns as the iterations would
+        remaining = min(self.iterations - self.iteration, self.l)
+        stats[:, -(-self.iteration // stats_sr):] = self.get_stats()[:, np.newaxis]
+        if remaining > 0:
+            cooldown = self.lattice.cooldown
+            np.maximum(cooldown, remaining, out=cooldown)
+            cooldown -= remaining
+            self.lattice.heard_rumour[...] = 0
+
+        return stats, stats.mean(axis=0)
+
+    def get_stats(self):
+        """
+        Returns:
+            ndarray: portion of the population which has heard the rumour, per replica
+        """
+        return self.reached / self.population
@@ -0,0 +1,228 @@
+import io
+import shutil
+import struct
+import subprocess
+import numpy as np
+from PIL import Image
+import Render
+import Trajectory
+
+
+# animation formats, by file extension
+FORMATS = ('.gif', '.mp4')
+
+
+def simulation_frames(simulation, visuals):
+    """
+    runs the simulation, yielding the values shown for each iteration.
+    when the simulation stops early, its final state is shown as the last iteration
+
+    Args:
+        simulation (Sim.Simulation): the simulation to run
+        visuals (str): the visualisation type
+
+    Yields:
+        (int, ndarray, float): iteration number, frame values and spread
+    """
+    for i, lattice in simulation.steps():
+        yield i, Render.frame_values(lattice, visuals), simulation.get_stats()
+    if simulation.termination < simulation.iterations:
+        yield simulation.iterations-1, Render.frame_values(simulation.lattice, visuals), simulation.get_stats()
+
+
+def palette_size(flags):
+    """
+    Args:
+        flags (int): flags byte of a gif screen or image descriptor
+
+    Returns:
+        int: size in bytes of the palette which follows the descriptor, 0 if it has none
+    """
+    return (3 << ((flags & 7) + 1)) if flags & 0x80 else 0
+
+
+def skip_sub_blocks(data, position):
+    """
+    Args:
+        data (bytes): a gif
+        position (int): position of the first of a chain of data sub-blocks
+
+    Returns:
+        int: position after the chain's terminator
+    """
+    while data[position]:
+        position += data[position] + 1
+    return position + 1
+
+
+class GifWriter:
+
+    def __init__(self, path, lut, fps=10, loop=0):
+        """
+        writes a gif one frame at a time. every frame is an index into the same
+        colormap, which is the gif's global palette, so frames are written as they
+        come without quantizing or keeping them.
+
+        Args:
+            path (str): path of the gif to write
+            lut (ndarray): (256, 3) uint8 colormap lookup table
+            fps (float, optional): frames per second. Defaults to 10.
+            loop (int, optional): number of times the animation repeats, 0 repeats it forever. Defaults to 0.
+        """
+        self.file = open(path, 'wb')
+        self.palette = lut.tobytes()
+        self.duration = int(1000 / fps)
+        self.loop = loop
+        self.started = False
+
+    def write_header(self, height, width):
+        """writes the screen size, the global palette and the number of loops"""
+        self.file.write(b'GIF89a' + struct.pack('<HHBBB', width, height, 0xF7, 0, 0) + self.palette)
+        self.file.write(b'!\xff\x0bNETSCAPE2.0\x03\x01' + struct.pack('<H', self.loop) + b'\x00')
+
+    def frame_blocks(self, index):
+        """
+        encodes a frame as a gif of its own, and cuts out the blocks
+        between its header and trailer, which are the frame itself
+
+        Args:
+            index (ndarray): 2d uint8 array of colormap indices
+
+        Returns:
+            bytes: the frame's control extension, image descriptor and data
+        """
+        image = Image.fromarray(index, 'P')
+        image.putpalette(self.palette)
+        buffer = io.BytesIO()
+        image.save(buffer, format='GIF', duration=self.duration, disposal=1, optimize=False)
+        data = buffer.getvalue()
+        # the blocks are walked rather than assumed, PIL may add extensions or a local palette
+        blocks = []
+        position = 13 + palette_size(data[10])
+        while data[position] != 0x3B:
+            start = position
+            if data[position] == 0x21:
+                # an extension, only the graphic control one belongs to the frame
+                keep = data[position+1] == 0xF9
+                position = skip_sub_blocks(data, position+2)
+            elif data[position] == 0x2C:
+                # the image descriptor, its palette, the lzw code size and the image data
+                keep = True
+                position = skip_sub_blocks(data, position + 10 + palette_size(data[position+9]) + 1)
+            else:
+                raise ValueError(f"unexpected gif block 0x{data[position]:02x} at byte {position}")
+            if keep:
+                blocks.append(data[start:position])
+        return b''.join(blocks)
+
+    def write(self, index):
+        """
+        Args:
+            index (ndarray): 2d uint8 array of colormap indices
+        """
+        if not self.started:
+            self.write_header(*index.shape)
+            self.started = True
+        self.file.write(self.frame_blocks(index))
+
+    def close(self):
+        # gif trailer
+        self.file.write(b';')
+        self.file.close()
+
+
+class Mp4Writer:
+
+    def __init__(self, path, lut, fps=10):
+        """
+        pipes raw rgb frames into an ffmpeg process which encodes them as h264
+
+        Args:
+            path (str): path of the mp4 to write
+            lut (ndarray): (256, 3) uint8 colormap lookup table
+            fps (float, optional): frames per second. Defaults to 10.
+        """
+        if shutil.which('ffmpeg') is None:
+            raise RuntimeError("exporting mp4 needs ffmpeg on the PATH, export a .gif instead")
+        self.path = path
+        self.lut = lut
+        self.fps = fps
+        self.process = None
+
+    def write(self, index):
+        """
+        Args:
+            index (ndarray): 2d uint8 array of colormap indices
+        """
+        # h264 needs an even width and height, the last row or column is repeated
+        height, width = index.shape
+        index = np.pad(index, ((0, height % 2), (0, width % 2)), mode='edge')
+        if self.process is None:
+            self.process = subprocess.Popen(
+                ['ffmpeg', '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+                 '-s', f'{index.shape[1]}x{index.shape[0]}', '-r', str(self.fps), '-i', '-',
+                 '-vcodec', 'libx264', '-pix_fmt', 'yuv420p', self.path],
+                stdin=subprocess.PIPE)
+        self.process.stdin.write(self.lut[index].tobytes())
+
+    def close(self):
+        if self.process is None:
+            return
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to write '{self.path}'")
+
+
+def export(source, path, visuals='cooldown', stride=1, size=(500, 500), fps=10):
+    """
+    streams the frames of a simulation or of a saved trajectory into an animation,
+    colored the way the GUI shows them. only one frame is kept at a time,
+    so the memory used does not depend on the number of iterations.
+
+    Args:
+        source (Sim.Simulation, Trajectory.Trajectory or str): a simulation before it runs,
+        a trajectory, or the path of a trajectory file
+        path (str): path of the animation to write, .gif or .mp4
+        visuals (str, optional): 'cooldown', 'heard rumour' or 'got_rumour'. Defaults to 'cooldown'.
+        stride (int, optional): number of iterations between frames, the last one is always shown. Defaults to 1.
+        size (tuple, optional): largest (height, width) of a frame, None keeps a pixel per cell. Defaults to (500, 500).
+        fps (float, optional): frames per second. Defaults to 10.
+
+    Returns:
+        int: number of frames written
+    """
+    if visuals not in Render.VISUALS:
+        raise ValueError(f"unknown visualisation type '{visuals}', expected one of {Render.VISUALS}")
+    if not path.endswith(FORMATS):
+        raise ValueError(f"unknown animation format of '{path}', expected one of {FORMATS}")
+
+    # a trajectory opened here is closed here, one passed in is the caller's
+    opened = isinstance(source, str)
+    if opened:
+        # frames are read in order, so no state is kept to seek back to
+        source = Trajectory.Trajectory(source, keyframes=None)
+    if isinstance(source, Trajectory.Trajectory):
+        frames = source.frames(visuals)
+    else:
+        frames = simulation_frames(source, visuals)
+    last = source.iterations-1
+
+    written = 0
+    writer = None
+    try:
+        lut = Render.frame_colormap(visuals)
+        writer = GifWriter(path, lut, fps) if path.endswith('.gif') else Mp4Writer(path, lut, fps)
+        for i, frame, stats in frames:
+            if i % stride and i != last:
+                continue
+            index = Render.color_index(frame, len(lut))
+            if size is not None:
+                index = Render.scale_frame(index, size)
+            writer.write(index)
+            written += 1
+    finally:
+        if writer is not None:
+            writer.close()
+        if opened:
+            source.close()
+    return written
@@ -0,0 +1,127 @@
+import numpy as np
+from scipy import sparse
+
+
+def adjacency(sources, targets, nodes, directed=False):
+    """
+    builds the adjacency matrix of a contact graph from its edges.
+    self loops are dropped and repeated edges are kept once.
+
+    Args:
+        sources (ndarray): the node each edge starts at
+        targets (ndarray): the node each edge ends at
+        nodes (int): number of nodes
+        directed (bool, optional): edges only pass the rumour from source to target,
+        otherwise they pass it both ways. Defaults to False.
+
+    Returns:
+        csr_matrix: int32 matrix, graph[u, v] is 1 when u passes the rumour to v
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    keep = sources != targets
+    sources, targets = sources[keep], targets[keep]
+    if not directed:
+        sources, targets = np.concatenate((sources, targets)), np.concatenate((targets, sources))
+    if len(sources) and (min(sources.min(), targets.min()) < 0 or max(sources.max(), targets.max()) >= nodes):
+        raise ValueError(f"edges must join nodes between 0 and {nodes-1}")
+    graph = sparse.csr_matrix((np.ones(len(sources), dtype=np.int32), (sources, targets)), shape=(nodes, nodes))
+    graph.sum_duplicates()
+    graph.data[:] = 1
+    return graph
+
+
+def grid_graph(shape):
+    """
+    the lattice the other engines run on, each cell joined to the cells
+    above, below, left and right of it, with nodes in row major order
+
+    Args:
+        shape (tuple): shape of the lattice
+
+    Returns:
+        csr_matrix: the adjacency matrix
+    """
+    height, width = shape
+    index = np.arange(height * width).reshape(height, width)
+    sources = np.concatenate((index[:, :-1].ravel(), index[:-1, :].ravel()))
+    targets = np.concatenate((index[:, 1:].ravel(), index[1:, :].ravel()))
+    return adjacency(sources, targets, height * width)
+
+
+def small_world(nodes, k=4, beta=0.1, rng=None):
+    """
+    a Watts-Strogatz small world graph: a ring on which every node is joined to its
+    k nearest nodes, with every edge's far end moved to a random node with probability beta
+
+    Args:
+        nodes (int): number of nodes
+        k (int, optional): number of neighbours of each node on the ring, an even number. Defaults to 4.
+        beta (float, optional): probability of rewiring each edge. Defaults to 0.1.
+        rng (Generator, optional): random number generator. Defaults to fresh entropy.
+
+    Returns:
+        csr_matrix: the adjacency matrix
+    """
+    rng = np.random.default_rng(rng)
+    sources = np.repeat(np.arange(nodes), k // 2)
+    targets = (sources + np.tile(np.arange(1, k // 2 + 1), nodes)) % nodes
+    rewire = rng.random(len(targets)) < beta
+    targets[rewire] = rng.integers(0, nodes, np.count_nonzero(rewire))
+    return adjacency(sources, targets, nodes)
+
+
+def scale_free(nodes, exponent=2.5, min_degree=2, rng=None):
+    """
+    a scale free graph from the configuration model: every node draws a degree from
+    a power law, and the ends of all edges are paired at random. self loops and
+    repeated edges are dropped, which slightly lowers the degrees of the largest hubs.
+
+    Args:
+        nodes (int): number of nodes
+        exponent (float, optional): exponent of the power law of the degrees, above 2. Defaults to 2.5.
+        min_degree (int, optional): smallest degree. Defaults to 2.
+        rng (Generator, optional): random number generator. Defaults to fresh entropy.
+
+    Returns:
+        csr_matrix: the adjacency matrix
+    """
+    rng = np.random.default_rng(rng)
+    # pareto distributed degrees, by inverting their distribution function
+    degrees = np.floor(min_degree * (1 - rng.random(nodes)) ** (-1 / (exponent - 1)))
+    degrees = np.minimum(degrees, nodes - 1).astype(np.int64)
+    if degrees.sum() % 2:
+        degrees[rng.integers(nodes)] += 1
+    stubs = rng.permutation(np.repeat(np.arange(nodes), degrees))
+    return adjacency(stubs[0::2], stubs[1::2], nodes)
+
+
+def read_graph(path, nodes=None, directed=False):
+    """
+    reads a contact graph: a scipy sparse matrix saved with save_npz, or a text edge list
+    with a pair of node numbers per line, separated by commas in a .csv file and by
+    whitespace otherwise. lines starting with # are comments.
+
+    Args:
+        path (str): path of the file
+        nodes (int, optional): number of nodes of an edge list. Defaults to the largest node number plus one.
+        directed (bool, optional): an edge list's edges only pass the rumour from the first
+        node to the second. Defaults to False.
+
+    Returns:
+        csr_matrix: the adjacency matrix
+    """
+    if path.endswith('.npz'):
+        return sparse.csr_matrix(sparse.load_npz(path))
+    edges = np.loadtxt(path, dtype=np.int64, comments='#', delimiter=',' if path.endswith('.csv') else None,
+                       usecols=(0, 1), ndmin=2)
+    if nodes is None:
+        nodes = int(edges.max()) + 1 if len(edges) else 0
+    return adjacency(edges[:, 0], edges[:, 1], nodes, directed)
+
+
+# graphs the command line can generate, by name, called with the number of nodes
+MODELS = {
+    'small-world': small_world,
+    'scale-free': scale_free,
+}
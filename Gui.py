@@ -1,9 +1,12 @@
 import PySimpleGUI as sg
-import numpy as np
-import matplotlib.pyplot as plt
 import Sim
-import time
-import os
+import Sweep
+import Render
+import Playback
+import Trajectory
+import Export
+import Profile
+import Cache
 
 
 class Gui:
@@ -20,9 +23,11 @@ class Gui:
         
         self.AppFont = 'Any 14' # font
         self.shape = (500, 500) # size of simulation presented to user, not simulation dimensions!
-        self.matrix_shape = (100,100)
         self.visuals = 'cooldown' # visualisation type, default is cooldown
         self.strategy = strategy
+        self.stats_job = None # statistics generated in the background
+        self.cache = None # results of earlier statistics, reused by later ones, opened with the first job
+        self.profile = False # show where the simulation's time went once its window closes
 
         # set main window's layout
         self.main_layout = [
@@ -51,15 +56,25 @@ class Gui:
               sg.Button('None', font=self.AppFont)],
             
             # run different kinds of simulation
-            [sg.Button('Start Simulation', font=self.AppFont)],
+            [sg.Button('Start Simulation', font=self.AppFont),
+             sg.Checkbox('Profile', key='profile', font=self.AppFont)],
 
             [sg.Text('Generate Statistics:', font='Any 18')],
             [sg.Text('Number of Repeats:',font=self.AppFont),
-             sg.Input(key='repeats', size=(15,1), font=self.AppFont, default_text='30')],
-            [sg.Button('Generate Statistics', font=self.AppFont)],
+             sg.Input(key='repeats', size=(15,1), font=self.AppFont, default_text='30'),
+             sg.Text('Target ±%:',font=self.AppFont),
+             sg.Input(key='target', size=(8,1), font=self.AppFont, tooltip='keep adding repeats until the spread is this precise, empty for a fixed number')],
+            [sg.Button('Generate Statistics', font=self.AppFont), sg.Button('Cancel', font=self.AppFont, disabled=True)],
+            [sg.ProgressBar(max_value=1, orientation='h', size=(30, 20), key='progress'),
+             sg.Text(key='running_stats', font=self.AppFont)],
 
             
             [sg.Button('Strategic Simulation', font=self.AppFont)],
+
+            [sg.Text('Trajectories:', font='Any 18')],
+            [sg.Input(key='trajectory', size=(30,1), font=self.AppFont),
+             sg.FileBrowse(file_types=(('Trajectory', '*.npz'),), font=self.AppFont),
+             sg.Button('Replay', font=self.AppFont), sg.Button('Save Trajectory', font=self.AppFont)],
             [sg.Button('Exit', font=self.AppFont)]
             ]
         
@@ -77,11 +92,16 @@ Visualisation types:
 * Rumour Heard - Colors cells by whether or not they have heard the rumour.
 * Times Rumour Heard - Colors cells by how many times they have heard the rumour throughout the simulation.
 * None - the simulation will run in the background and only present the last frame when it finishes.
+Checking Profile shows how long each phase of the simulation's iterations took once its window is closed.
 Generate Statistics:
 Set the number of repetitions, the simulation the runs for that number of times without visualisation, and then writes the average spread in a popup window.
+The repetitions follow the strategy of the Strategic Simulation when the simulator has one. They run in the background, the progress bar and the running average with its 95% confidence interval update as they finish, and Cancel stops the remaining ones.
 
 Strategic Simulation:
 Runs the simulation with a predefined strategy.
+
+Trajectories:
+Save Trajectory runs the simulation with the current parameters and saves its trajectory to a file, Replay shows a saved trajectory with the current visualisation type without simulating again. Drag the slider to go to any iteration.
 """
         
     def create_sim_layout(self):
@@ -94,57 +114,92 @@ Runs the simulation with a predefined strategy.
         """
         fresh_layout = [
                     [sg.Text(key="show_iter", font='any 18'), sg.Text(key="stats", font='any 18')],
-                    [sg.Image(key='frame')]
+                    [sg.Image(key='frame')],
+                    [sg.Button('Pause', font=self.AppFont), sg.Button('Step', font=self.AppFont, disabled=True),
+                     sg.Text('Frames per second:', font=self.AppFont),
+                     sg.Slider(key='fps', range=(1, 60), default_value=30, orientation='h', enable_events=True)]
                     ]
         
         return fresh_layout
+
+    def create_replay_layout(self, iterations):
+        """
+        generates a replay screen layout, a simulation screen
+        with a slider to go to any iteration
+
+        Args:
+            iterations (int): number of iterations in the trajectory
+        """
+        fresh_layout = self.create_sim_layout()
+        fresh_layout.append([sg.Text('Iteration:', font=self.AppFont),
+                             sg.Slider(key='seek', range=(1, iterations), default_value=1, orientation='h',
+                                       size=(40, 15), enable_events=True)])
+        return fresh_layout
         
            
-    def draw_frame(self, window, frame, iteration, stats):
+    def render_frame(self, iteration, frame, stats):
         """
-        function resizes the given frame to be bigger, saves it
-        as an image and then shows it on the GUI for 0.05 of a second
+        colors the given frame and resizes it to be bigger, then encodes
+        it as a png in memory. safe to call from a background thread.
 
         Args:
-            window (sg.Window): a pysimplegui window
-            frame (ndarray): a simulation lattice
             iteration (int): current iteration number
+            frame (ndarray): a simulation lattice
             stats (float): percentage of population which has heard the rumour
-        """        
-        
-        resized_frame = np.ndarray(shape=self.shape)
-        horizental_side = int(self.shape[0]/self.matrix_shape[0])
-        vercitcal_side = int(self.shape[1]/self.matrix_shape[1])
-        
-        for i in range(0, self.shape[0]-horizental_side, horizental_side ):
-            for j in range(0, self.shape[1]-vercitcal_side, vercitcal_side):
-                # Draw the matrix on the graph
-                resized_frame[i:i+horizental_side, j:j+vercitcal_side] = frame[int(i/horizental_side), int(j/vercitcal_side)]
-        
-        if self.visuals == 'heard rumour':
-            vis_colors = 'seismic'
-        else:
-            vis_colors = 'magma'
-        plt.imsave("frame.png", resized_frame, cmap=vis_colors)
 
+        Returns:
+            tuple: the png bytes, iteration and stats, as show_frame takes them
+        """
+        image = Render.render(frame, self.visuals, self.shape)
+        return Render.png_bytes(image), iteration, stats
+
+    def show_frame(self, window, png, iteration, stats):
+        """
+        shows a rendered frame on the GUI
+
+        Args:
+            window (sg.Window): a pysimplegui window
+            png (bytes): the frame encoded as png
+            iteration (int): current iteration number
+            stats (float): percentage of population which has heard the rumour
+        """
         try:
             window['show_iter'].update(f"Iteration number: {iteration+1}")
             window['stats'].update(f"Percent heard: {round(stats*100, 2)}%")
-            window['frame'].update("frame.png")
+            window['frame'].update(data=png)
             # set window to middle of screen
             screen_width, screen_height = window.get_screen_dimensions()
             win_width, win_height = window.size
             x, y = (screen_width - win_width)//2, (screen_height - win_height)//2
             window.move(x, y)
         except:
-            # delete frame file
-            try:
-                os.remove("frame.png")
-            except:
-                pass
+            # window was closed while drawing
+            pass
 
+    def draw_frame(self, window, frame, iteration, stats):
+        """
+        renders the given frame and shows it on the GUI
 
-    def start_simulation(self, sim_values, strategy):
+        Args:
+            window (sg.Window): a pysimplegui window
+            frame (ndarray): a simulation lattice
+            iteration (int): current iteration number
+            stats (float): percentage of population which has heard the rumour
+        """        
+        self.show_frame(window, *self.render_frame(iteration, frame, stats))
+
+    def live_frames(self, simulation):
+        """
+        runs the simulation, yielding the values shown for each iteration
+        with the current visualisation type, see Export.simulation_frames
+
+        Args:
+            simulation (Sim.Simulation): the simulation to run
+        """
+        return Export.simulation_frames(simulation, self.visuals)
+
+
+    def start_simulation(self, sim_values, strategy=None):
         """
         creates the new simulation window, runs the simulation
         to get all itertion frames, and then show each one
@@ -161,83 +216,144 @@ Runs the simulation with a predefined strategy.
                                     resizable=True,
                                     element_justification="left")
         
-        simulation = Sim.Simulation(*sim_values, strategy=strategy)
+        profiler = Profile.Profiler() if self.profile else None
+        simulation = Sim.Simulation(*sim_values, strategy=strategy, profiler=profiler)
         iterations = sim_values[-1]
         event = 'initial value'
 
         if self.visuals == 'None':
-            frames = simulation.run(preprocess=True)
+            # only the last frame is shown, so no frames are kept
+            simulation.run_stats()
             stats = simulation.get_stats()
-            self.draw_frame(window, frames[iterations-1]['got_rumour'], iterations-1, stats)
+            self.draw_frame(window, simulation.lattice['got_rumour'], iterations-1, stats)
 
             while event != sg.WIN_CLOSED:
                 event, values = window.read(timeout=200)
 
             window.close()
+            self.show_profile(profiler)
 
-            # delete frame file
-            try:
-                os.remove("frame.png")
-            except:
-                pass
-            # sim closed and frame deleted, stop function
+            # sim closed, stop function
             return
 
 
-        # draw first frame and then move the
-        # window to the middle of the screen
-        frame = simulation.run()
+        # the simulation runs and renders in a background thread,
+        # this loop only shows its frames and handles the controls
+        producer = Playback.FrameProducer(self.live_frames(simulation), self.render_frame)
+        playback = Playback.Playback(producer)
+        producer.start()
 
-        if self.visuals == 'heard rumour':
-            frame = (frame['got_rumour']>=1)*1
-        else:
-            frame = frame[self.visuals]
-        
-        stats = 0
-        self.draw_frame(window, frame, 0, stats)
-        event, values = window.read(timeout=2)
+        while True:
+            event, values = window.read(timeout=5)
+            if event == sg.WIN_CLOSED:
+                producer.stop()
+                window.close()
+                self.show_profile(profiler)
+                # sim closed, stop function
+                return
 
-        # draw the simulation frames
-        for i in range(1, iterations):
-            frame = simulation.run()
+            if event == 'Pause':
+                playback.toggle_pause()
+                window['Pause'].update('Resume' if playback.paused else 'Pause')
+                window['Step'].update(disabled=not playback.paused)
+            if event == 'Step':
+                playback.step()
+            if event == 'fps':
+                playback.fps = values['fps']
 
-            if self.visuals == 'heard rumour':
-                frame = (frame['got_rumour']>=1)*1
-            else:
-                frame = frame[self.visuals]
+            frame = playback.next_frame()
+            if frame is not None:
+                self.show_frame(window, *frame)
 
 
-            if i % 5 == 0 or i == (iterations-1):
-                # update every 5 steps and at the end to speed the sim up
-                stats = simulation.get_stats()
-            
-            # if rendering is fast, prevent instant presentation of all frames
-            time.sleep(0.03)
-            self.draw_frame(window, frame, i, stats)
-            event, values = window.read(timeout=2)
+    def show_profile(self, profiler):
+        """
+        shows where a profiled simulation spent its time, and prints it for copying
+
+        Args:
+            profiler (Profile.Profiler): the simulation's profiler, or None if it was not profiled
+        """
+        if profiler == None:
+            return
+        profiler.close()
+        report = profiler.report()
+        print(report)
+        sg.popup_scrolled(report, title='Simulation Profile', font='Courier 12', size=(50, 15))
+
+    def start_replay(self, path):
+        """
+        creates a new replay window, which shows the iterations of a saved
+        trajectory in turn, rebuilding each one from the file
+
+        Args:
+            path (str): path of a trajectory file
+        """
+        try:
+            trajectory = Trajectory.Trajectory(path)
+        except (OSError, ValueError, KeyError) as error:
+            sg.popup(f'Error reading trajectory: {error}')
+            return
+
+        # with no visualisation the replay shows how many times the rumour was heard
+        visuals = 'got_rumour' if self.visuals == 'None' else self.visuals
+        window = sg.Window('Rumour Spreading Replay',
+                                    self.create_replay_layout(trajectory.iterations),
+                                    finalize=True,
+                                    resizable=True,
+                                    element_justification="left")
+        iteration = 0
+        shown = None
+        playing = True
+        fps = 30
+
+        while True:
+            if iteration != shown:
+                self.draw_frame(window, trajectory.frame(iteration, visuals), iteration, trajectory.stats(iteration))
+                window['seek'].update(value=iteration+1)
+                shown = iteration
+
+            event, values = window.read(timeout=int(1000/fps))
             if event == sg.WIN_CLOSED:
-                window.close()
-                # delete frame file
-                try:
-                    os.remove("frame.png")
-                except:
-                    pass
-                # sim closed and frame deleted, stop function
-                return
-            
+                break
 
-        while event != sg.WIN_CLOSED:
-            event, values = window.read(timeout=200)
+            last = trajectory.iterations-1
+            if event == 'Pause':
+                playing = not playing
+                if playing and iteration == last:
+                    # play again from the start
+                    iteration = 0
+            if event == 'Step':
+                iteration = min(iteration+1, last)
+            if event == 'fps':
+                fps = values['fps']
+            if event == 'seek':
+                iteration = int(values['seek']) - 1
+            if event == sg.TIMEOUT_EVENT and playing:
+                iteration = min(iteration+1, last)
+                if iteration == last:
+                    playing = False
+                    event = 'Pause'
+            if event == 'Pause':
+                window['Pause'].update('Pause' if playing else 'Resume')
+                window['Step'].update(disabled=playing)
 
         window.close()
+        trajectory.close()
 
-        # delete frame file
-        try:
-            os.remove("frame.png")
-        except:
-            pass
+    def save_trajectory(self, sim_values, path):
+        """
+        runs a simulation without showing it and saves its trajectory
+
+        Args:
+            sim_values (nparray): array of the simulation parameters
+            path (str): path of the trajectory file to write
+        """
+        if not path.endswith('.npz'):
+            path += '.npz'
+        simulation = Sim.Simulation(*sim_values)
+        Trajectory.record(simulation, path)
+        sg.popup(f"Saved trajectory to {path}, spread: {round(simulation.get_stats()*100, 2)}%", font=self.AppFont)
 
-        
     def process_values(self, values):
         """_summary_
 
@@ -278,6 +394,32 @@ Runs the simulation with a predefined strategy.
         
 
 
+    def update_stats_job(self):
+        """
+        collects the finished repeats of the statistics job, shows the progress
+        and the running average, and the final result once the job is done
+        """
+        job = self.stats_job
+        if job.poll() or job.done:
+            mean, half_width = job.mean_ci()
+            # with a target precision, more repeats may have been added
+            self.window['progress'].update(current_count=job.completed, max=job.repeats)
+            if job.completed:
+                self.window['running_stats'].update(
+                    f"{job.completed}/{job.repeats}: {round(mean*100, 2)}% ± {round(half_width*100, 2)}%")
+
+        if job.done:
+            self.stats_job = None
+            self.window['Generate Statistics'].update(disabled=False)
+            self.window['Cancel'].update(disabled=True)
+            if job.cancelled:
+                sg.popup(f"Cancelled after {job.completed} of {job.repeats} repeats", font=self.AppFont)
+            else:
+                result = f"Average Spread: {round(mean*100, 2)}% ± {round(half_width*100, 2)}% over {job.completed} repeats"
+                if job.target != None and not job.converged:
+                    result += f", the target of ± {round(job.target*100, 2)}% was not reached"
+                sg.popup(result, font=self.AppFont)
+
     def start(self):
         """
         starts the main window in which the parameters are set,
@@ -294,6 +436,9 @@ Runs the simulation with a predefined strategy.
             event, values = self.window.read(timeout=200)
            
             if event == sg.WIN_CLOSED or event == 'Exit':
+                if self.stats_job != None:
+                    # the running replicas would otherwise keep the program from exiting until they finish
+                    self.stats_job.cancel(terminate=True)
                 break
 
             if event == 'Spread Cooldown':
@@ -327,24 +472,53 @@ Runs the simulation with a predefined strategy.
                 self.window['Rumour Heard'].update(disabled=False)
                 self.window['Spread Cooldown'].update(disabled=False)
                 
-            if event == 'Generate Statistics':
+            if event == 'Generate Statistics' and self.stats_job == None:
                 # generate the average spread for reapets of the simulation
-                # given the current parameters
-                average_spread = 0
-                repeats = int(values['repeats'])
+                # given the current parameters, on worker processes
                 sim_values = self.process_values(values)
-                for i in range(repeats):
-                    simulation = Sim.Simulation(*sim_values, self.strategy)
-                    simulation.run(preprocess=True)
-                    average_spread += simulation.get_stats()
+                if sim_values == None:
+                    continue
+                try:
+                    repeats = int(values['repeats'])
+                except ValueError:
+                    repeats = 0
+                if repeats < 1:
+                    sg.popup('Number of repeats must be a positive integer')
+                    continue
+                try:
+                    target = float(values['target'])/100 if values['target'].strip() else None
+                except ValueError:
+                    target = 0
+                if target != None and target <= 0:
+                    sg.popup('Target must be a positive percentage, or empty')
+                    continue
 
-                average_spread = average_spread/repeats
-                sg.popup(f"Average Spread: {round(average_spread*100, 2)}%", font=self.AppFont)
+                params = dict(zip(('p', 'l', 's1', 's2', 's3', 's4', 'iterations'), sim_values))
+                if self.strategy != None:
+                    params['strategy'] = self.strategy
+                if self.cache == None:
+                    self.cache = Cache.ResultCache()
+                # runs shorter than the default sample rate still sample their final spread
+                stats_sr = min(5, params['iterations'])
+                self.stats_job = Sweep.StatsJob(params, repeats, stats_sr=stats_sr, cache=self.cache, target=target)
+                self.window['Generate Statistics'].update(disabled=True)
+                self.window['Cancel'].update(disabled=False)
+                self.window['progress'].update(current_count=0, max=repeats)
+                self.window['running_stats'].update('')
+
+            if event == 'Cancel' and self.stats_job != None:
+                self.stats_job.cancel()
+
+            if self.stats_job != None:
+                self.update_stats_job()
 
             if event == 'Information':
                 # start a popup window with information about the program
                 sg.popup(self.infotext, font=self.AppFont)
 
+            if event in ('Start Simulation', 'Strategic Simulation'):
+                self.profile = values['profile']
+
             if event == 'Start Simulation':
                 # process user entered parameters
                 sim_values = self.process_values(values)
@@ -364,6 +538,22 @@ Runs the simulation with a predefined strategy.
                     continue
 
                 self.start_simulation(sim_values, self.strategy)
+
+            if event == 'Replay':
+                if not values['trajectory']:
+                    sg.popup('Choose a trajectory file to replay')
+                    continue
+                self.start_replay(values['trajectory'])
+
+            if event == 'Save Trajectory':
+                sim_values = self.process_values(values)
+                if sim_values == None:
+                    continue
+                path = sg.popup_get_file('Save trajectory as', save_as=True,
+                                         file_types=(('Trajectory', '*.npz'),), font=self.AppFont)
+                if path:
+                    self.save_trajectory(sim_values, path)
+                    self.window['trajectory'].update(path)
                 
                 
         self.window.close()
\ No newline at end of file
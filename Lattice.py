@@ -0,0 +1,274 @@
+import os
+import numpy as np
+
+
+# susceptibility value of each level, a cell stores the index of its level
+SUS_LEVELS = np.array([1, 2/3, 1/3, 0])
+
+# record layout of a single cell, used for whole lattice frames
+# and by strategy functions which build a lattice themselves
+FEATURES = np.dtype([('exists', 'bool'), ('sus_level', 'f8'), ('heard_rumour','i4'),('cooldown','i4'),('got_rumour', 'i4')])
+
+
+def counter_dtype(max_value):
+    """
+    returns the narrowest unsigned integer type able to hold max_value
+
+    Args:
+        max_value (int): largest value the counter will have to hold
+    """
+    return np.min_scalar_type(max(int(max_value), 1))
+
+
+def sus_level_index(sus_level):
+    """
+    converts susceptibility values to the index of their level in SUS_LEVELS
+
+    Args:
+        sus_level (ndarray): susceptibility values, each one must be one of SUS_LEVELS
+
+    Returns:
+        ndarray: uint8 array of level indices
+    """
+    sus_level = np.asarray(sus_level, dtype='f8')
+    distance = np.abs(sus_level[..., np.newaxis] - SUS_LEVELS)
+    index = distance.argmin(axis=-1).astype(np.uint8)
+    if not np.allclose(SUS_LEVELS[index], sus_level):
+        raise ValueError(f"susceptibility levels must be one of {SUS_LEVELS.round(2).tolist()}")
+    return index
+
+
+def random_lattice(shape, p, distribution, rng, l=255, iterations=100, chunk=1<<20, directory=None):
+    """
+    creates a lattice of randomly placed people with random susceptibility levels.
+    a person exists where a uniform draw falls below p, and its level is picked by
+    looking up a second uniform draw in the cumulative distribution of levels.
+    shape may have leading axes to create many lattices at once, for ensembles.
+    the draws are made chunk cells at a time to bound the temporary memory.
+
+    Args:
+        shape (tuple): shape of the lattice, its last two axes are the lattice
+        p (float): portion of existing cells
+        distribution (sequence): portion of each susceptibility level, s1 to s4
+        rng (Generator): random number generator to draw from
+        l (int, optional): largest cooldown the lattice will hold. Defaults to 255.
+        iterations (int, optional): number of iterations the counters must survive. Defaults to 100.
+        chunk (int, optional): number of cells drawn at a time. Defaults to 2**20.
+        directory (str, optional): keep the lattice's arrays in memory mapped files
+        in this directory, see CellLattice. Defaults to None, keeping them in memory.
+
+    Returns:
+        CellLattice: the new lattice, with all counters at zero
+    """
+    lattice = CellLattice(shape, l, iterations, directory)
+    # the last level takes whatever floating point error the sum has
+    cdf = np.cumsum(distribution)[:-1]
+
+    width = lattice.shape[-1]
+    exists_bits = lattice.exists_bits.reshape(-1, lattice.exists_bits.shape[-1])
+    sus_index = lattice.sus_index.reshape(-1, width)
+    rows = max(1, chunk // width)
+    for start in range(0, len(sus_index), rows):
+        block = slice(start, start + rows)
+        size = sus_index[block].shape
+        exists_bits[block] = np.packbits(rng.random(size) < p, axis=-1)
+        sus_index[block] = np.searchsorted(cdf, rng.random(size), side='right')
+
+    return lattice
+
+
+class CellLattice:
+
+    # fields which are stored as they are, as unsigned counters
+    COUNTERS = ('heard_rumour', 'cooldown', 'got_rumour')
+
+    def __init__(self, shape, l=255, iterations=100, directory=None):
+        """
+        a lattice of cells stored as one contiguous array per feature,
+        each with the narrowest type it needs:
+        exists as a bitmask packed along the rows, susceptibility as a uint8
+        index into SUS_LEVELS, and unsigned counters for the rest.
+        the last two axes are the lattice, any leading axes hold separate lattices.
+        indexing with a feature name, as in lattice['cooldown'], gives the same
+        values a FEATURES record array would.
+        with a directory, every array is a memory mapped .npy file in it, so the
+        lattice may be larger than the memory, as long as it is only worked on
+        a block of rows at a time, see Engine.TiledEngine.
+
+        Args:
+            shape (tuple): shape of the lattice
+            l (int, optional): largest cooldown the lattice will hold. Defaults to 255.
+            iterations (int, optional): number of iterations the counters must survive. Defaults to 100.
+            directory (str, optional): directory of the memory mapped files. Defaults to None, keeping the arrays in memory.
+        """
+        self.shape = tuple(shape)
+        self.directory = directory
+        bits_shape = (*self.shape[:-1], -(-self.shape[-1] // 8))
+        self.exists_bits = self.new_array('exists_bits', bits_shape, np.uint8)
+        self.sus_index = self.new_array('sus_index', self.shape, np.uint8)
+        # a cell hears the rumour from at most 4 neighbours per iteration
+        self.heard_rumour = self.new_array('heard_rumour', self.shape, np.uint8)
+        self.cooldown = self.new_array('cooldown', self.shape, counter_dtype(l))
+        self.got_rumour = self.new_array('got_rumour', self.shape, counter_dtype(4 * iterations))
+
+    def new_array(self, name, shape, dtype):
+        """
+        Returns:
+            ndarray: an array of zeros, memory mapped to name.npy in the lattice's directory if it has one
+        """
+        if self.directory is None:
+            return np.zeros(shape, dtype=dtype)
+        return np.lib.format.open_memmap(os.path.join(self.directory, name + '.npy'), mode='w+',
+                                         dtype=dtype, shape=shape)
+
+    @classmethod
+    def from_records(cls, records, l=255, iterations=100):
+        """
+        builds a compact lattice from a FEATURES record array
+
+        Args:
+            records (ndarray): a lattice of cells with the FEATURES fields
+            l (int, optional): largest cooldown the lattice will hold. Defaults to 255.
+            iterations (int, optional): number of iterations the counters must survive. Defaults to 100.
+        """
+        lattice = cls(records.shape, l, iterations)
+        for field in ('exists', 'sus_level') + cls.COUNTERS:
+            lattice[field] = records[field]
+        return lattice
+
+    def to_records(self):
+        """
+        returns:
+            ndarray: a copy of the lattice as a FEATURES record array
+        """
+        records = np.zeros(self.shape, dtype=FEATURES)
+        for field in ('exists', 'sus_level') + self.COUNTERS:
+            records[field] = self[field]
+        return records
+
+    def fit_counters(self, l, iterations, degree=4):
+        """
+        widens the counters if they are too narrow for the given cooldown,
+        number of iterations and number of neighbours of a cell
+
+        Args:
+            l (int): largest cooldown the lattice will hold
+            iterations (int): number of iterations the counters must survive
+            degree (int, optional): most neighbours a cell hears the rumour from, 4 on the grid
+            and the largest degree of a contact graph. Defaults to 4.
+        """
+        for field, needed in (('heard_rumour', counter_dtype(degree)), ('cooldown', counter_dtype(l)),
+                              ('got_rumour', counter_dtype(degree * iterations))):
+            counter = getattr(self, field)
+            if np.promote_types(counter.dtype, needed) != counter.dtype:
+                widened = self.new_array(field + '_widened', counter.shape, needed) if self.directory else None
+                setattr(self, field, counter.astype(needed) if widened is None else widened)
+                if widened is not None:
+                    widened[...] = counter
+        return self
+
+    def copy(self):
+        """a copy of the lattice, in memory"""
+        lattice = CellLattice.__new__(CellLattice)
+        lattice.shape = self.shape
+        lattice.directory = None
+        for field in ('exists_bits', 'sus_index') + self.COUNTERS:
+            setattr(lattice, field, np.array(getattr(self, field)))
+        return lattice
+
+    def to_directory(self, directory):
+        """
+        copies the lattice into memory mapped files
+
+        Args:
+            directory (str): directory of the files
+
+        Returns:
+            CellLattice: the copy
+        """
+        lattice = CellLattice.__new__(CellLattice)
+        lattice.shape = self.shape
+        lattice.directory = directory
+        for field in ('exists_bits', 'sus_index') + self.COUNTERS:
+            array = getattr(self, field)
+            setattr(lattice, field, lattice.new_array(field, array.shape, array.dtype))
+            getattr(lattice, field)[...] = array
+        return lattice
+
+    def exists_rows(self, start, stop):
+        """
+        unpacks the mask of a block of rows only
+
+        Args:
+            start (int): first row
+            stop (int): row after the last one
+
+        Returns:
+            ndarray: boolean mask of the rows, true where a person exists
+        """
+        return np.unpackbits(self.exists_bits[..., start:stop, :], axis=-1, count=self.shape[-1]).view(bool)
+
+    @property
+    def exists(self):
+        """boolean mask of the cells in which a person exists"""
+        return np.unpackbits(self.exists_bits, axis=-1, count=self.shape[-1]).view(bool)
+
+    @exists.setter
+    def exists(self, mask):
+        mask = np.broadcast_to(np.asarray(mask, dtype=bool), self.shape)
+        # written in place, so a memory mapped mask stays in its file
+        self.exists_bits[...] = np.packbits(mask, axis=-1)
+
+    def exists_at(self, index):
+        """
+        checks a single cell without unpacking the whole mask
+
+        Args:
+            index (tuple): the cell's full index, its column last
+        """
+        *row, j = index
+        return bool(self.exists_bits[(*row, j >> 3)] >> (7 - (j & 7)) & 1)
+
+    def exists_flat(self, flat_indices):
+        """
+        checks many cells at once without unpacking the whole mask
+
+        Args:
+            flat_indices (ndarray): row major indices of the cells
+
+        Returns:
+            ndarray: boolean array, true where a person exists
+        """
+        rows, cols = np.divmod(flat_indices, self.shape[-1])
+        bits = self.exists_bits.reshape(-1, self.exists_bits.shape[-1])[rows, cols >> 3]
+        return (bits >> (7 - (cols & 7)) & 1).astype(bool)
+
+    @property
+    def sus_level(self):
+        """susceptibility value of every cell"""
+        return SUS_LEVELS[self.sus_index]
+
+    @property
+    def nbytes(self):
+        """memory used by the lattice's arrays"""
+        return (self.exists_bits.nbytes + self.sus_index.nbytes +
+                sum(getattr(self, field).nbytes for field in self.COUNTERS))
+
+    def __getitem__(self, field):
+        if field == 'exists':
+            return self.exists
+        if field == 'sus_level':
+            return self.sus_level
+        if field in self.COUNTERS:
+            return getattr(self, field)
+        raise KeyError(field)
+
+    def __setitem__(self, field, value):
+        if field == 'exists':
+            self.exists = value
+        elif field == 'sus_level':
+            self.sus_index[...] = sus_level_index(value)
+        elif field in self.COUNTERS:
+            getattr(self, field)[...] = value
+        else:
+            raise KeyError(field)
@@ -0,0 +1,289 @@
+import itertools
+import os
+import numpy as np
+import Strategy
+import Sweep
+from Lattice import SUS_LEVELS
+
+
+# layouts the search starts from, each orders the cells of every period of the tile by their
+# distance from the period's centre: square and diamond blocks, and horizontal and vertical stripes
+LAYOUTS = ('squares', 'diamonds', 'rows', 'columns')
+
+
+def level_counts(distribution, cells):
+    """
+    splits a number of cells between the susceptibility levels, by largest remainders,
+    so the counts add up to the cells and are as close to the distribution as they can be
+
+    Args:
+        distribution (sequence): portion of each susceptibility level, s1 to s4
+        cells (int): number of cells
+
+    Returns:
+        ndarray: number of cells of each level
+    """
+    exact = np.asarray(distribution, dtype='f8') / np.sum(distribution) * cells
+    counts = np.floor(exact).astype(int)
+    remainders = np.argsort(counts - exact, kind='stable')
+    counts[remainders[:cells - counts.sum()]] += 1
+    return counts
+
+
+def budget_tile(priority, counts, rng):
+    """
+    gives the most susceptible levels to the cells of highest priority, so that every
+    tile built from the same counts holds the same people, whatever its layout
+
+    Args:
+        priority (ndarray): 2d array, the priority of each cell of the tile
+        counts (ndarray): number of cells of each level, from level_counts()
+        rng (Generator): breaks ties between cells of equal priority
+
+    Returns:
+        ndarray: 2d uint8 array, the index of each cell's level in SUS_LEVELS
+    """
+    order = np.lexsort((rng.random(priority.size), -priority.ravel()))
+    tile = np.empty(priority.size, dtype=np.uint8)
+    tile[order] = np.repeat(np.arange(len(counts), dtype=np.uint8), counts)
+    return tile.reshape(priority.shape)
+
+
+def layout_priority(layout, tile, period):
+    """
+    Args:
+        layout (str): one of LAYOUTS
+        tile (tuple): shape of the tile
+        period (int): side of the blocks, or spacing of the stripes, in cells
+
+    Returns:
+        ndarray: priority of every cell of the tile, highest at the centre of each period
+    """
+    centre = (period - 1) / 2
+    rows, cols = np.indices(tile)
+    rows = np.abs(rows % period - centre)
+    cols = np.abs(cols % period - centre)
+    if layout == 'squares':
+        return -np.maximum(rows, cols)
+    if layout == 'diamonds':
+        return -(rows + cols)
+    if layout == 'rows':
+        return -rows
+    if layout == 'columns':
+        return -cols
+    raise ValueError(f"unknown layout '{layout}', expected one of {LAYOUTS}")
+
+
+def layout_tiles(distribution, tile=(12, 12), seed=0):
+    """
+    every parameterised layout, with the given susceptibility budget: each layout at every
+    period which divides the tile, with the most susceptible people at the centre of
+    each period or, inverted, at its edges, and a well mixed tile for reference
+
+    Args:
+        distribution (sequence): portion of each susceptibility level, s1 to s4
+        tile (tuple, optional): shape of every tile. Defaults to (12, 12).
+        seed (int, optional): seed of the ties between cells of equal priority. Defaults to 0.
+
+    Returns:
+        list: (name, tile) of every layout, tiles as from budget_tile()
+    """
+    rng = np.random.default_rng(seed)
+    counts = level_counts(distribution, tile[0] * tile[1])
+    tiles = [('mixed', budget_tile(np.zeros(tile), counts, rng))]
+    for layout in LAYOUTS:
+        side = tile[1] if layout == 'columns' else tile[0]
+        for period in range(2, side + 1):
+            if tile[0] % period or tile[1] % period:
+                continue
+            priority = layout_priority(layout, tile, period)
+            tiles.append((f'{layout} {period}', budget_tile(priority, counts, rng)))
+            tiles.append((f'{layout} {period} inverted', budget_tile(-priority, counts, rng)))
+    return tiles
+
+
+def mutate(tile, rng, swaps=3):
+    """
+    swaps the levels of random pairs of cells with different levels, which keeps the budget
+
+    Args:
+        tile (ndarray): the tile to change
+        rng (Generator): random number generator
+        swaps (int, optional): most pairs swapped, at least one is. Defaults to 3.
+
+    Returns:
+        ndarray: the changed copy of the tile
+    """
+    tile = tile.copy()
+    flat = tile.reshape(-1)
+    for swap in range(rng.integers(1, swaps + 1)):
+        first = rng.integers(flat.size)
+        others = np.flatnonzero(flat != flat[first])
+        if len(others) == 0:
+            break
+        second = others[rng.integers(len(others))]
+        flat[first], flat[second] = flat[second], flat[first]
+    return tile
+
+
+class Optimizer:
+
+    def __init__(self, distribution, l, iterations=100, shape=(100,100), p=None, repeats=20, race_batch=5,
+                 seed=None, workers=None, maximize=False, level=0.95):
+        """
+        searches for the placement of a fixed budget of susceptibility levels, a tile repeated
+        across the lattice, which gives the least, or the most, final spread.
+        every candidate runs the same replicas, seeded the same way, so the
+        differences between candidates are not hidden by the noise of separate draws.
+        candidates run a batch of replicas at a time, all of them together on a pool of
+        worker processes, and a candidate stops running once its spread is worse than
+        the best one's beyond the confidence interval of their differences.
+
+        Args:
+            distribution (sequence): portion of each susceptibility level, s1 to s4, the budget of every tile
+            l (int): number of iterations cooldown on spreading a rumour
+            iterations (int, optional): number of iterations. Defaults to 100.
+            shape (tuple, optional): shape of the lattice. Defaults to (100,100).
+            p (float, optional): portion of cells a person is kept in, at random. Defaults to None, keeping everyone.
+            repeats (int, optional): replicas each candidate runs. Defaults to 20.
+            race_batch (int, optional): replicas run by every candidate before the worse ones are pruned. Defaults to 5.
+            seed (int, optional): seed of the replicas and of the search. Defaults to fresh entropy.
+            workers (int, optional): number of worker processes. Defaults to the number of cores.
+            maximize (bool, optional): search for the most spread, rather than the least. Defaults to False.
+            level (float, optional): confidence level of the pruning. Defaults to 0.95.
+        """
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.distribution = tuple(distribution)
+        self.l = l
+        self.iterations = iterations
+        self.shape = shape
+        self.p = p
+        self.repeats = repeats
+        self.race_batch = max(2, race_batch)
+        self.seed = seed
+        self.workers = workers or os.cpu_count()
+        self.sign = -1 if maximize else 1
+        self.level = level
+        self.rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(2,)))
+        self.simulations = 0
+        self.pruned = 0
+
+    def params(self, tile):
+        """
+        Returns:
+            dict: Simulation arguments of the lattice built from a tile
+        """
+        s1, s2, s3, s4 = self.distribution
+        return dict(p=self.p or 1, l=self.l, s1=s1, s2=s2, s3=s3, s4=s4, iterations=self.iterations,
+                    shape=self.shape, strategy=Strategy.custom(SUS_LEVELS[tile], self.p))
+
+    def run(self, tiles, replicas, stream=0):
+        """
+        runs replicas of every tile, all on the worker pool at once
+
+        Args:
+            tiles (list): the tiles
+            replicas (range): numbers of the replicas, the same replica gets the same seed for every tile
+            stream (int, optional): 0 for the replicas candidates are compared on,
+            1 for the ones validating the result. Defaults to 0.
+
+        Returns:
+            list: for every tile, the final spread of each replica
+        """
+        # a tile's replicas share their parameters, so they run stacked in ensembles
+        tasks = [(params, Sweep.task_seed(self.seed, stream, replica), 1, False)
+                 for params, replica in itertools.product([self.params(tile) for tile in tiles], replicas)]
+        results = Sweep.run_tasks(tasks, self.workers)
+        self.simulations += len(tasks)
+        finals = np.array([stats[-1] for stats, _, _ in results]).reshape(len(tiles), len(replicas))
+        return list(finals)
+
+    def race(self, tiles, incumbent=None):
+        """
+        runs the candidates a batch of replicas at a time, pruning every candidate whose
+        spread is clearly worse than the incumbent's on the same replicas
+
+        Args:
+            tiles (list): the candidate tiles
+            incumbent (ndarray, optional): final spread of every replica of the incumbent.
+            Defaults to None, comparing the candidates with the best one so far.
+
+        Returns:
+            list: the final spread of every replica of each candidate, None for the pruned ones
+        """
+        finals = [np.zeros(0) for tile in tiles]
+        alive = list(range(len(tiles)))
+        for start in range(0, self.repeats, self.race_batch):
+            replicas = range(start, min(start + self.race_batch, self.repeats))
+            for index, spread in zip(alive, self.run([tiles[index] for index in alive], replicas)):
+                finals[index] = np.concatenate((finals[index], spread))
+
+            done = replicas.stop
+            best = incumbent
+            if best is None:
+                best = finals[min(alive, key=lambda index: self.sign * finals[index].mean())]
+            for index in list(alive):
+                # positive differences are worse than the incumbent
+                mean, half_width = Sweep.confidence_interval(self.sign * (finals[index] - best[:done]), self.level)
+                if mean - half_width > 0:
+                    alive.remove(index)
+                    finals[index] = None
+                    self.pruned += 1
+        return finals
+
+    def score(self, finals):
+        """the mean of the final spreads, lower is better whichever way the search goes"""
+        return self.sign * np.mean(finals)
+
+    def search(self, generations=20, mutants=8, swaps=3, tile=(12, 12), validate=True, callback=None):
+        """
+        races every parameterised layout of layout_tiles(), and then improves the best one
+        generation by generation: mutants of the incumbent, each a few swaps of its cells,
+        race against it, and the best one which ran every replica replaces it if it did better
+
+        Args:
+            generations (int, optional): number of generations of mutants. Defaults to 20.
+            mutants (int, optional): mutants raced in every generation. Defaults to 8.
+            swaps (int, optional): most pairs of cells swapped by a mutation. Defaults to 3.
+            tile (tuple, optional): shape of every tile. Defaults to (12, 12).
+            validate (bool, optional): run the best tile again on replicas it was not chosen on,
+            whose spread is not biased by the selection. Defaults to True.
+            callback (function, optional): called with the generation, the incumbent's name and
+            its mean spread after the layouts and after every generation. Defaults to None.
+
+        Returns:
+            dict: the best tile, as levels and as susceptibility values, its name, its mean spread
+            and confidence interval, the validated ones, the number of simulations run and of
+            candidates pruned, and the history of incumbents
+        """
+        layouts = layout_tiles(self.distribution, tile, self.rng.integers(2**32))
+        finals = self.race([levels for name, levels in layouts])
+        survivors = [index for index, spread in enumerate(finals) if spread is not None]
+        best = min(survivors, key=lambda index: self.score(finals[index]))
+        name, incumbent = layouts[best]
+        incumbent_finals = finals[best]
+        history = [(0, name, float(np.mean(incumbent_finals)))]
+        if callback:
+            callback(*history[-1])
+
+        for generation in range(1, generations + 1):
+            candidates = [mutate(incumbent, self.rng, swaps) for mutant in range(mutants)]
+            finals = self.race(candidates, incumbent_finals)
+            survivors = [index for index, spread in enumerate(finals) if spread is not None]
+            if survivors:
+                best = min(survivors, key=lambda index: self.score(finals[index]))
+                if self.score(finals[best]) < self.score(incumbent_finals):
+                    incumbent, incumbent_finals = candidates[best], finals[best]
+                    name = f'{history[0][1]} mutated {generation}'
+            history.append((generation, name, float(np.mean(incumbent_finals))))
+            if callback:
+                callback(*history[-1])
+
+        mean, half_width = Sweep.confidence_interval(incumbent_finals, self.level)
+        result = dict(name=name, levels=incumbent, tile=SUS_LEVELS[incumbent], spread=mean, half_width=half_width,
+                      simulations=self.simulations, pruned=self.pruned, history=history)
+        if validate:
+            result['validated'], result['validated_half_width'] = Sweep.confidence_interval(
+                self.run([incumbent], range(self.repeats), stream=1)[0], self.level)
+        return result
@@ -0,0 +1,311 @@
+import multiprocessing
+import multiprocessing.connection
+import os
+import threading
+import time
+import weakref
+from multiprocessing import shared_memory
+import numpy as np
+import Engine
+from Lattice import CellLattice
+
+
+# seconds the workers are given to exit once told to, before they are terminated
+STOP_TIMEOUT = 10
+
+
+def share_lattice(lattice):
+    """
+    copies a lattice into shared memory blocks, one per array
+
+    Args:
+        lattice (CellLattice): the lattice to copy
+
+    Returns:
+        (CellLattice, list, dict): the copy, whose arrays are views of the blocks, the blocks,
+        and the name, shape and type of each array's block, to attach to it with attach_lattice()
+    """
+    shared = CellLattice.__new__(CellLattice)
+    shared.shape = lattice.shape
+    shared.directory = None
+    blocks = []
+    layout = {}
+    for field in ('exists_bits', 'sus_index') + CellLattice.COUNTERS:
+        array = getattr(lattice, field)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        view = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+        view[...] = array
+        setattr(shared, field, view)
+        blocks.append(block)
+        layout[field] = (block.name, array.shape, array.dtype.str)
+    return shared, blocks, layout
+
+
+def attach_lattice(shape, layout):
+    """
+    Args:
+        shape (tuple): shape of the lattice
+        layout (dict): the layout given by share_lattice()
+
+    Returns:
+        (CellLattice, list): the lattice whose arrays are views of the shared blocks, and the blocks
+    """
+    lattice = CellLattice.__new__(CellLattice)
+    lattice.shape = tuple(shape)
+    lattice.directory = None
+    blocks = []
+    for field, (name, array_shape, dtype) in layout.items():
+        block = shared_memory.SharedMemory(name=name)
+        setattr(lattice, field, np.ndarray(array_shape, dtype=dtype, buffer=block.buf))
+        blocks.append(block)
+    return lattice, blocks
+
+
+def row_streams(entropy, start, stop):
+    """
+    Returns:
+        list: an independent random number generator for each row from start to stop,
+        the same for a row whichever worker owns it
+    """
+    return [np.random.default_rng(np.random.SeedSequence(entropy, spawn_key=(row,))) for row in range(start, stop)]
+
+
+def stripe_worker(shape, layout, shared, index, bounds, l, entropy, connection, halo_barrier):
+    """
+    the loop of a worker process, which runs an iteration on its stripe of the lattice every time
+    the engine tells it to. each iteration it publishes the spreaders of its first and last rows as
+    its halo, waits for every worker to do the same and runs Engine.stripe_step with its neighbours'
+    halos, and then tells the engine it is done.
+    a stripe in which nothing can change is skipped, see Engine.TiledEngine.
+
+    Args:
+        shape (tuple): shape of the lattice
+        layout (dict): the lattice's shared blocks, from share_lattice()
+        shared (dict): names of the 'halo' and 'counts' blocks
+        index (int): number of the worker's stripe
+        bounds (list): first row of every stripe, and the lattice's height
+        l (int): number of iterations cooldown on spreading a rumour
+        entropy (int): entropy of the per row random number generators
+        connection (Connection): the worker's end of its pipe to the engine, which sends True
+        to run an iteration and False to exit, and gets True back after every iteration
+        halo_barrier (Barrier): the barrier the workers wait at once their halos are published
+    """
+    lattice, blocks = attach_lattice(shape, layout)
+    workers = len(bounds) - 1
+    width = shape[1]
+    halo_block = shared_memory.SharedMemory(name=shared['halo'])
+    counts_block = shared_memory.SharedMemory(name=shared['counts'])
+    blocks += [halo_block, counts_block]
+    halo = np.ndarray((workers, 2, width), dtype=bool, buffer=halo_block.buf)
+    counts = np.ndarray((workers, 3), dtype=np.int64, buffer=counts_block.buf)
+
+    start, stop = bounds[index], bounds[index+1]
+    exists = lattice.exists_rows(start, stop)
+    streams = row_streams(entropy, start, stop)
+    in_cooldown = np.count_nonzero(exists & (lattice.cooldown[start:stop] > 0))
+    heard = bool(lattice.heard_rumour[start:stop].any())
+
+    def draw(deciding):
+        # deciding is in row major order, each row draws from its own stream
+        draws = np.empty(deciding.size)
+        rows, firsts = np.unique(deciding // width, return_index=True)
+        lasts = np.append(firsts[1:], deciding.size)
+        for row, first, last in zip(rows, firsts, lasts):
+            draws[first:last] = streams[row].random(last - first)
+        return draws
+
+    try:
+        # the engine closing its end of the pipe, as when it dies, also stops the worker
+        while connection.recv():
+            # the neighbours' spreaders are read before the halo barrier, after which they are overwritten
+            near = counts[max(index-1, 0):index+2, 1].any()
+            active = near or in_cooldown or heard
+            if active:
+                cooldown = np.array(lattice.cooldown[start:stop])
+                spreaders = exists & (cooldown == l)
+                halo[index] = spreaders[[0, -1]]
+            else:
+                halo[index] = False
+            halo_barrier.wait()
+
+            if active:
+                above = halo[index-1, 1] if index > 0 else None
+                below = halo[index+1, 0] if index < workers-1 else None
+                newly, decided, reached = Engine.stripe_step(lattice, start, stop, exists, cooldown, spreaders,
+                                                             above, below, l, draw)
+                in_cooldown = np.count_nonzero(cooldown)
+                heard = reached > 0
+                counts[index] = newly, len(decided), cooldown.size
+            else:
+                counts[index] = 0
+            connection.send(True)
+    except EOFError:
+        pass
+    except threading.BrokenBarrierError:
+        # another worker failed, this one stays until the engine, which sees that one exit, stops it
+        try:
+            connection.recv()
+        except EOFError:
+            pass
+    except BaseException:
+        # the other workers are not left waiting for this one's halo
+        halo_barrier.abort()
+        raise
+    finally:
+        del lattice, halo, counts
+        for block in blocks:
+            block.close()
+
+
+def stop_workers(processes, connections, blocks):
+    """
+    stops the worker processes of a ParallelEngine and frees its shared memory
+
+    Args:
+        processes (list): the worker processes
+        connections (list): the engine's ends of the workers' pipes
+        blocks (list): the engine's shared memory blocks
+    """
+    for connection in connections:
+        try:
+            connection.send(False)
+        except OSError:
+            # the worker already exited
+            pass
+    for process in processes:
+        process.join(timeout=STOP_TIMEOUT)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+    for connection in connections:
+        connection.close()
+    for block in blocks:
+        try:
+            block.close()
+        except BufferError:
+            # views of the block are still held, it is freed with them
+            pass
+        block.unlink()
+
+
+class ParallelEngine:
+
+    def __init__(self, lattice, l, entropy, workers=None, timeout=None):
+        """
+        an engine which splits the lattice into stripes of whole rows, each advanced by
+        its own worker process. the lattice is copied into shared memory, which the workers
+        and this process all work on, and the workers only exchange the spreaders of the
+        rows at the edges of their stripes, a one row halo, every iteration, waiting for
+        each other between the halo exchange and the update.
+        every row draws its random numbers from its own generator, derived from the entropy,
+        so a simulation gives the same lattice whatever the number of workers, although not
+        the one the other engines give for the same seed.
+        the lattice must only be changed through step() once the engine is created,
+        and the engine must be closed to stop the workers and free the shared memory.
+        the engine waits for the workers on pipes, together with their processes, so a worker
+        which fails or is killed fails the iteration with a RuntimeError instead of a hang.
+
+        Args:
+            lattice (CellLattice): the lattice to run on, with its initial spreaders set
+            l (int): number of iterations cooldown on spreading a rumour
+            entropy (int): entropy of the per row random number generators
+            workers (int, optional): number of worker processes, at most one per row. Defaults to the number of CPUs.
+            timeout (float, optional): seconds an iteration may take before the workers are taken
+            to be stuck. Defaults to None, no limit, dead workers are still detected.
+        """
+        height, width = lattice.shape
+        workers = max(1, min(workers or os.cpu_count() or 1, height))
+        bounds = [height * worker // workers for worker in range(workers + 1)]
+        self.workers = workers
+        self.timeout = timeout
+        self.lattice, self.blocks, layout = share_lattice(lattice)
+
+        halo_block = shared_memory.SharedMemory(create=True, size=workers * 2 * width)
+        counts_block = shared_memory.SharedMemory(create=True, size=workers * 3 * 8)
+        self.blocks += [halo_block, counts_block]
+        self.counts = np.ndarray((workers, 3), dtype=np.int64, buffer=counts_block.buf)
+        # the spreaders of every stripe, which tell the workers which stripes can be skipped,
+        # counted a block of rows at a time so the whole lattice is never unpacked
+        self.counts[:] = 0
+        rows = max(1, (1<<20) // width)
+        for worker in range(workers):
+            for start in range(bounds[worker], bounds[worker+1], rows):
+                stop = min(start + rows, bounds[worker+1])
+                exists = self.lattice.exists_rows(start, stop)
+                self.counts[worker, 1] += np.count_nonzero(exists & (self.lattice.cooldown[start:stop] == l))
+
+        context = multiprocessing.get_context()
+        halo_barrier = context.Barrier(workers)
+        shared = dict(halo=halo_block.name, counts=counts_block.name)
+        self.connections = []
+        self.processes = []
+        for worker in range(workers):
+            connection, worker_connection = context.Pipe()
+            self.connections.append(connection)
+            self.processes.append(context.Process(target=stripe_worker, daemon=True,
+                                                  args=(lattice.shape, layout, shared, worker, bounds, l, entropy,
+                                                        worker_connection, halo_barrier)))
+        for process in self.processes:
+            process.start()
+        # an engine which is never closed is stopped when it is collected, or when the program exits
+        self.finalizer = weakref.finalize(self, stop_workers, self.processes, self.connections, self.blocks)
+
+    def step(self, lattice, rng, profiler=None):
+        """
+        run one iteration of the simulation, every stripe in its own process
+
+        Args:
+            lattice (CellLattice): the engine's lattice, updated in place
+            rng (Generator): unused, the workers draw from their rows' generators
+            profiler (Profiler, optional): records the time of the iteration, as a whole, as spreading. Defaults to None.
+
+        Returns:
+            (int, int): number of people who heard the rumour for the first time,
+            and number of people who decided to spread it
+        """
+        deadline = None if self.timeout == None else time.monotonic() + self.timeout
+        for connection in self.connections:
+            connection.send(True)
+        # waits for every worker to be done, or for any of them to exit, which a process
+        # killed by a signal or by the out of memory killer does without a word
+        pending = list(self.connections)
+        sentinels = [process.sentinel for process in self.processes]
+        while pending:
+            remaining = None if deadline == None else max(deadline - time.monotonic(), 0)
+            ready = multiprocessing.connection.wait(pending + sentinels, remaining)
+            if not ready or any(sentinel in ready for sentinel in sentinels):
+                self.fail([process for process in self.processes if process.sentinel in ready])
+            for connection in ready:
+                connection.recv()
+                pending.remove(connection)
+        newly_reached, decided, visited = self.counts.sum(axis=0)
+        if profiler:
+            profiler.mark('spread')
+            profiler.count('visited', int(visited))
+        return newly_reached, decided
+
+    def fail(self, exited):
+        """
+        stops the workers after some of them exited, or the iteration timed out, and raises RuntimeError
+
+        Args:
+            exited (list): the processes which exited, none when the iteration timed out
+        """
+        # a process's sentinel is ready as it exits, slightly before its exit code is
+        for process in exited:
+            process.join()
+        exited = [f"worker {self.processes.index(process)} exited with code {process.exitcode}" for process in exited]
+        # killed rather than terminated, a stuck worker may be stopped, or ignoring signals
+        for process in self.processes:
+            process.kill()
+        for process in self.processes:
+            process.join()
+        self.close()
+        raise RuntimeError("a worker process of the parallel engine failed: " +
+                           (', '.join(exited) or f"the iteration took longer than {self.timeout} seconds"))
+
+    def close(self):
+        """stops the workers and frees the shared memory, after which the engine's lattice must not be used"""
+        self.lattice = None
+        self.counts = None
+        self.finalizer()
@@ -0,0 +1,129 @@
+import queue
+import threading
+import time
+
+
+class FrameProducer:
+
+    def __init__(self, frames, render, maxsize=8):
+        """
+        runs a frame source in a background thread, rendering every frame
+        and pushing it into a bounded queue. when the queue is full the
+        producer waits, so a paused or slow consumer also pauses the simulation.
+
+        Args:
+            frames (iterable): yields (iteration, frame, stats) tuples, usually from Simulation.steps()
+            render (function): called with each tuple's items, returns what the consumer shows
+            maxsize (int, optional): number of rendered frames the queue holds. Defaults to 8.
+        """
+        self.queue = queue.Queue(maxsize)
+        self.stopped = threading.Event()
+        self.finished = threading.Event()
+        self.error = None
+        self.thread = threading.Thread(target=self.produce, args=(frames, render), daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def produce(self, frames, render):
+        try:
+            for item in frames:
+                rendered = render(*item)
+                while not self.stopped.is_set():
+                    try:
+                        self.queue.put(rendered, timeout=0.05)
+                        break
+                    except queue.Full:
+                        continue
+                if self.stopped.is_set():
+                    return
+        except Exception as error:
+            # raised again in the consumer's thread by get()
+            self.error = error
+        finally:
+            self.finished.set()
+
+    def get(self):
+        """
+        Returns:
+            the next rendered frame, or None if none is ready yet
+        """
+        if self.error is not None:
+            raise self.error
+        try:
+            return self.queue.get_nowait()
+        except queue.Empty:
+            return None
+
+    @property
+    def done(self):
+        """true once every frame has been produced and taken"""
+        return self.finished.is_set() and self.queue.empty()
+
+    def stop(self):
+        """
+        cancels the producer and waits for its thread to end. the thread only sees the cancel
+        between frames, so this waits for the iteration it is in, after which the frame source,
+        the simulation, may be used again
+        """
+        self.stopped.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+
+class Playback:
+
+    def __init__(self, producer, fps=30):
+        """
+        takes frames from a producer at a target frame rate. when showing frames
+        falls behind the schedule the frames in between are dropped, and when the
+        producer is slow the frames are shown as they arrive.
+
+        Args:
+            producer (FrameProducer): the source of rendered frames
+            fps (float, optional): target number of frames shown per second. Defaults to 30.
+        """
+        self.producer = producer
+        self.fps = fps
+        self.paused = False
+        self.pending_steps = 0
+        self.next_due = time.perf_counter()
+
+    def toggle_pause(self):
+        self.paused = not self.paused
+        self.next_due = time.perf_counter()
+
+    def step(self):
+        """shows exactly one more frame while paused"""
+        self.pending_steps += 1
+
+    def next_frame(self):
+        """
+        Returns:
+            the frame to show now, or None if no frame is due or ready
+        """
+        now = time.perf_counter()
+        if self.paused:
+            if self.pending_steps == 0:
+                return None
+            frame = self.producer.get()
+            if frame is not None:
+                self.pending_steps -= 1
+            return frame
+
+        if now < self.next_due:
+            return None
+        frame = self.producer.get()
+        if frame is None:
+            return None
+
+        # drop the frames which should have been shown already
+        interval = 1 / self.fps
+        behind = int((now - self.next_due) / interval)
+        for i in range(behind):
+            newer = self.producer.get()
+            if newer is None:
+                break
+            frame = newer
+        self.next_due = max(self.next_due + interval * (behind + 1), now)
+        return frame
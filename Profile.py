@@ -0,0 +1,128 @@
+import time
+import numpy as np
+
+
+# phases of an iteration, in the order they run: clearing heard_rumour,
+# passing the rumour to the spreaders' neighbours, counting down cooldowns,
+# finding the deciding people and their thresholds, drawing random numbers,
+# starting the cooldown of the people who decided, updating the metrics
+# and computing the spread with get_stats
+PHASES = ('reset', 'spread', 'cooldown', 'decide', 'rng', 'apply', 'metrics', 'stats')
+
+# operations counted in every iteration: rumours passed from a spreader
+# to an existing neighbour, random numbers drawn and cells visited
+COUNTERS = ('spreads', 'draws', 'visited')
+
+# per iteration record of a profiled simulation, seconds spent in each phase and operation counts
+PROFILE = np.dtype([('iteration', 'i4')] + [(f'{phase}_s', 'f8') for phase in PHASES] +
+                   [(counter, 'i8') for counter in COUNTERS])
+
+
+class Profiler:
+
+    def __init__(self, callback=None):
+        """
+        collects the wall time of each phase and counts of operations of every
+        iteration of a simulation. engines call mark() at the end of each phase
+        and count() for the operations, only when a profiler is given, so an
+        unprofiled simulation pays a single check per phase.
+
+        Args:
+            callback (function, optional): called after every iteration with its PROFILE record. Defaults to None.
+        """
+        self.callback = callback
+        self.records = []
+        self.current = None
+        self.last = 0.0
+
+    def begin(self, iteration):
+        """
+        starts the record of an iteration, closing the previous one
+
+        Args:
+            iteration (int): number of the iteration
+        """
+        self.close()
+        self.current = np.zeros((), dtype=PROFILE)
+        self.current['iteration'] = iteration
+        self.last = time.perf_counter()
+
+    def resume(self):
+        """restarts the clock, so the time since the last phase is not counted in the next one"""
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        """
+        adds the time since the last mark to a phase of the current iteration
+
+        Args:
+            phase (str): one of PHASES
+        """
+        now = time.perf_counter()
+        if self.current is not None:
+            self.current[f'{phase}_s'] += now - self.last
+        self.last = now
+
+    def count(self, counter, n):
+        """
+        Args:
+            counter (str): one of COUNTERS
+            n (int): number of operations to add
+        """
+        if self.current is not None:
+            self.current[counter] += n
+
+    def close(self):
+        """ends the current iteration's record, and passes it to the callback"""
+        if self.current is None:
+            return
+        record = self.current
+        self.current = None
+        self.records.append(record)
+        if self.callback is not None:
+            self.callback(record)
+
+    def get_records(self):
+        """
+        Returns:
+            ndarray: a PROFILE record for every closed iteration
+        """
+        return np.array(self.records, dtype=PROFILE)
+
+    def summary(self):
+        """
+        Returns:
+            dict: total seconds of each phase and total count of each operation, over every iteration
+        """
+        records = self.get_records()
+        totals = {name: records[name].sum().item() for name in PROFILE.names[1:]}
+        totals['iterations'] = len(records)
+        return totals
+
+    def report(self):
+        """
+        Returns:
+            str: the summary as a table, with each phase's share of the total time
+        """
+        return format_summary(self.summary())
+
+
+def format_summary(summary):
+    """
+    formats a summary of phase times and operation counts, from Profiler.summary()
+    or summed over many simulations
+
+    Args:
+        summary (dict): seconds of each phase as '<phase>_s', counts of each counter and 'iterations'
+
+    Returns:
+        str: a table with each phase's share of the total time
+    """
+    total = sum(summary[f'{phase}_s'] for phase in PHASES) or 1
+    lines = [f"{summary['iterations']} iterations, {total:.4g}s"]
+    for phase in PHASES:
+        seconds = summary[f'{phase}_s']
+        lines.append(f"  {phase:10} {seconds:10.4g}s {seconds/total*100:6.1f}%")
+    for counter in COUNTERS:
+        lines.append(f"  {counter:10} {summary[counter]:>11}")
+    return '\n'.join(lines)
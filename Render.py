@@ -0,0 +1,138 @@
+import io
+import functools
+import numpy as np
+import matplotlib
+from PIL import Image
+
+
+# visualisation types which show the lattice's values
+VISUALS = ('cooldown', 'heard rumour', 'got_rumour')
+
+# colormap of each visualisation type, any other type uses DEFAULT_COLORMAP
+COLORMAPS = {'heard rumour': 'seismic'}
+DEFAULT_COLORMAP = 'magma'
+
+
+@functools.lru_cache(maxsize=None)
+def colormap_lut(name, colors=256):
+    """
+    samples a matplotlib colormap once into a lookup table
+
+    Args:
+        name (str): name of the colormap
+        colors (int, optional): number of colors in the table. Defaults to 256.
+
+    Returns:
+        ndarray: (colors, 3) uint8 array of rgb values
+    """
+    lut = matplotlib.colormaps[name](np.linspace(0, 1, colors), bytes=True)[:, :3]
+    lut.flags.writeable = False
+    return lut
+
+
+def frame_values(lattice, visuals):
+    """
+    picks the values shown for a visualisation type
+
+    Args:
+        lattice (CellLattice or ndarray): a simulation lattice or a recorded frame
+        visuals (str): 'cooldown', 'heard rumour' or 'got_rumour'
+
+    Returns:
+        ndarray: the values to color
+    """
+    if visuals == 'heard rumour':
+        return (lattice['got_rumour']>=1)*1
+    return lattice[visuals]
+
+
+def scale_frame(frame, size):
+    """
+    resizes a frame to fit in size, repeating each cell as a block of pixels
+    when the frame is small, or keeping every few cells when it is large
+
+    Args:
+        frame (ndarray): 2d array of values
+        size (tuple): largest (height, width) of the result
+
+    Returns:
+        ndarray: the resized frame
+    """
+    factor = min(size[0] // frame.shape[0], size[1] // frame.shape[1])
+    if factor >= 1:
+        return np.repeat(np.repeat(frame, factor, axis=0), factor, axis=1)
+    stride = max(-(-frame.shape[0] // size[0]), -(-frame.shape[1] // size[1]))
+    return frame[::stride, ::stride]
+
+
+def frame_colormap(visuals):
+    """
+    Returns:
+        ndarray: the lookup table of the visualisation type's colormap
+    """
+    return colormap_lut(COLORMAPS.get(visuals, DEFAULT_COLORMAP))
+
+
+def color_index(frame, colors=256):
+    """
+    stretches a frame's values between their minimum and maximum over
+    the entries of a colormap lookup table, the way plt.imsave does
+
+    Args:
+        frame (ndarray): 2d array of values
+        colors (int, optional): number of colors in the table. Defaults to 256.
+
+    Returns:
+        ndarray: uint8 index of each value's color
+    """
+    low, high = frame.min(), frame.max()
+    if high > low:
+        index = (frame - low) * (colors / (high - low))
+        return np.minimum(index, colors - 1).astype(np.uint8)
+    return np.zeros(frame.shape, dtype=np.uint8)
+
+
+def colorize(frame, visuals):
+    """
+    colors a frame the way plt.imsave does, see color_index
+
+    Args:
+        frame (ndarray): 2d array of values
+        visuals (str): the visualisation type, which picks the colormap
+
+    Returns:
+        ndarray: (height, width, 3) uint8 rgb image
+    """
+    lut = frame_colormap(visuals)
+    return lut[color_index(frame, len(lut))]
+
+
+def png_bytes(image):
+    """
+    encodes an rgb image as png in memory
+
+    Args:
+        image (ndarray): (height, width, 3) uint8 rgb image
+
+    Returns:
+        bytes: the png file's content
+    """
+    buffer = io.BytesIO()
+    Image.fromarray(image).save(buffer, format='PNG', compress_level=1)
+    return buffer.getvalue()
+
+
+def render(frame, visuals, size=(500, 500)):
+    """
+    colors a frame and scales it to fit in size, the image the Gui shows
+
+    Args:
+        frame (ndarray): 2d array of values
+        visuals (str): the visualisation type, which picks the colormap
+        size (tuple, optional): largest (height, width) of the image. Defaults to (500, 500).
+
+    Returns:
+        ndarray: (height, width, 3) uint8 rgb image
+    """
+    # color before scaling, so each cell is only looked up once
+    return scale_frame(colorize(frame, visuals), size)
@@ -1,11 +1,32 @@
-import matplotlib.pyplot as plt
+import copy
+import json
+import os
+import tempfile
 import numpy as np
-from scipy.stats import rv_discrete
+from scipy import sparse
+import Engine
+import Parallel
+import Graph
+from Lattice import CellLattice, FEATURES, SUS_LEVELS, random_lattice
+
+
+# version of the simulation's rules and of the order of its random draws, the results
+# of a seed only change with it. results cached by other versions are not reused
+VERSION = 1
+
+# ways of computing an iteration, see Simulation.simulate_step
+ENGINES = ('vectorized', 'loop', 'frontier', 'tiled', 'parallel', 'graph')
+
+# per iteration counters kept up to date while the rumour spreads:
+# people who have heard the rumour so far, people who heard it for the first time,
+# people who spread it during the iteration and people in cooldown after it
+METRICS = np.dtype([('reached', 'i8'), ('newly_reached', 'i8'), ('spreaders', 'i8'), ('in_cooldown', 'i8')])
 
 
 class Simulation:
     
-    def __init__(self, p, l, s1, s2, s3, s4, iterations=100, shape=(100,100), strategy=None):
+    def __init__(self, p, l, s1, s2, s3, s4, iterations=100, shape=(100,100), strategy=None, engine='vectorized', seed=None, early_stop=True, profiler=None,
+                 tile_budget=64<<20, directory=None, workers=None, graph=None):
         """        
         sets parameters to board, create a lattice graph of
         people represented by a tuple of:
@@ -21,36 +42,96 @@ class Simulation:
             s4 (float): level four susceptibility portion
             iterations (int, optional): number of iterations. Defaults to 100.
             shape (tuple, optional): shape of the lattice. Defaults to (100,100).
-            lattice (ndarry, optional): a predefined lattice to use in the simulation.
+            strategy (function, optional): a strategy, called with the shape and the simulation's
+            random number generator, which returns a predefined lattice. see the Strategy module.
+            engine (str, optional): how each iteration is computed, 'vectorized' updates the whole
+            lattice with array operations, 'frontier' only updates the cells taking part in the spread,
+            'tiled' keeps the lattice in memory mapped files and updates it a block of rows at a time,
+            'parallel' splits it into stripes of rows, each updated by its own process,
+            'graph' passes the rumour along the edges of a contact graph, and 'loop' visits every cell.
+            Defaults to 'vectorized'.
+            seed (int, SeedSequence or Generator, optional): seed of the simulation's random
+            number generator, or the generator itself. Defaults to fresh entropy.
+            early_stop (bool, optional): if true, a full run stops as soon as no one can spread
+            the rumour anymore and fills the remaining iterations with the final state. Defaults to True.
+            profiler (Profile.Profiler, optional): records the time of each phase of every iteration
+            and counts its operations. Defaults to None, which adds next to no cost.
+            tile_budget (int, optional): bytes of memory the tiled engine may use for a block of rows. Defaults to 64MB.
+            directory (str, optional): directory of the tiled engine's lattice files. Defaults to a
+            temporary directory, removed with the simulation.
+            workers (int, optional): number of processes of the parallel engine. Defaults to the number of CPUs.
+            graph (sparse matrix, optional): contact graph of the graph engine, whose nodes are the cells of the
+            lattice in row major order, see the Graph module. the lattice keeps the given shape when it has as many
+            cells as the graph has nodes, so a grid can be shown, and is a single row otherwise. giving a graph
+            selects the graph engine. Defaults to Graph.grid_graph(shape).
         """
 
         if p == 0 :
             exit(-1)
-        self.p_dist = rv_discrete(values=([False, True], [(1-p), p]))
-        self.sus_dist = rv_discrete(values=([1, 2/3, 1/3, 0 ], [s1, s2, s3, s4]))
+        if engine not in ENGINES:
+            raise ValueError(f"unknown engine '{engine}', expected one of {ENGINES}")
+        if graph is not None:
+            if engine not in ('vectorized', 'graph'):
+                raise ValueError(f"only the graph engine runs on a contact graph, not '{engine}'")
+            engine = 'graph'
+            graph = sparse.csr_matrix(graph)
+            if graph.shape[0] != np.prod(shape):
+                shape = (1, graph.shape[0])
+        elif engine == 'graph':
+            graph = Graph.grid_graph(shape)
+        self.engine = engine
+        self.graph = graph
+        self.early_stop = early_stop
+        self.profiler = profiler
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.p = p
+        self.distribution = (s1, s2, s3, s4)
 
         self.l = l
         self.shape = shape
         self.iterations = iterations
-        self.features = np.dtype([('exists', 'bool'), ('sus_level', 'f8'), ('heard_rumour','i4'),('cooldown','i4'),('got_rumour', 'i4')])
+        self.features = FEATURES
+        self.directory = None
+        if self.engine == 'tiled':
+            if directory == None:
+                self.temporary_directory = tempfile.TemporaryDirectory(prefix='rumour-')
+                directory = self.temporary_directory.name
+            self.directory = directory
         if strategy == None:
             self.create_cell_lattice()
         else:
-            self.lattice = strategy()
+            self.lattice = strategy(self.shape, self.rng)
+            if isinstance(self.lattice, CellLattice):
+                self.lattice.fit_counters(self.l, self.iterations)
+            else:
+                self.lattice = CellLattice.from_records(self.lattice, self.l, self.iterations)
+            if self.directory != None:
+                self.lattice = self.lattice.to_directory(self.directory)
+        if self.graph is not None:
+            # a person hears the rumour at most once from each of their contacts
+            degree = np.bincount(self.graph.indices, minlength=1).max()
+            self.lattice.fit_counters(self.l, self.iterations, degree)
         
-        initial_x = np.random.randint(low=0, high=self.shape[0])
-        initial_y = np.random.randint(low=0, high=self.shape[1])
+        initial_x = self.rng.integers(low=0, high=self.shape[0])
+        initial_y = self.rng.integers(low=0, high=self.shape[1])
 
         # get random indices within the matrix, where a preson exists
-        while not self.lattice[initial_x, initial_y]['exists']:
-            initial_x = np.random.randint(low=0, high=self.shape[0])
-            initial_y = np.random.randint(low=0, high=self.shape[1])
+        while not self.lattice.exists_at((initial_x, initial_y)):
+            initial_x = self.rng.integers(low=0, high=self.shape[0])
+            initial_y = self.rng.integers(low=0, high=self.shape[1])
 
         # initial_x = self.shape[0]//2
         # initial_y = self.shape[1]//2
 
         # set initial spreader
-        self.lattice[initial_x, initial_y]['cooldown'] = self.l
+        self.lattice.cooldown[initial_x, initial_y] = self.l
+
+        self.init_metrics()
+        self.tile_budget = tile_budget
+        self.workers = workers
+        self.parallel = None
+        self.create_engine()
         
     
     def run(self, preprocess = False, stats_sr = 5):
@@ -63,46 +144,383 @@ class Simulation:
         Args:
             preprocess (bool, optional): if true, runs the whole simulation and then returns
             an array of all iterations. Defaults to False.
+            stats_sr (int, optional): number of iterations between spread samples. Defaults to 5.
 
         Returns:
             the simulation's lattice, or an array of all lattices throughout the simulation
+            and the sampled spread
         """
         if preprocess:
-            frames = np.ndarray(shape=(self.iterations,100,100), dtype=self.features)
-            stats = np.zeros(self.iterations//stats_sr)
-            for i in range (self.iterations):
-                self.simulate_step()
+            frames = np.zeros(shape=(self.iterations, *self.shape), dtype=self.features)
+            stats = self.new_stats(stats_sr)
+            for i, lattice in self.steps():
                 # save rumour spreading matrix 
-                frames[i] = self.lattice
-                if i % stats_sr == 0:
-                    index = (i//stats_sr)
-                    stats[index] = self.get_stats() 
+                frames[i] = lattice.to_records()
+                self.sample_stats(stats, i, stats_sr)
                 
                 # this is used to check the sim without the gui:
                 # plt.title(f"iteration number {i}")
                 # plt.imshow(self.lattice['got_rumour'])
                 # plt.pause(0.02)
+
+            # iterations after an early stop repeat the final state
+            frames[self.termination:] = self.lattice.to_records()
+            self.pad_stats(stats, stats_sr)
             return frames, stats
         else:
             self.simulate_step()
             return self.lattice
 
+    def steps(self):
+        """
+        runs the simulation one iteration at a time, without keeping
+        any previous frame. a restored simulation carries on from the
+        iteration its snapshot was taken after.
+
+        with early_stop set, it stops once the simulation is quiescent and
+        fast-forwards the lattice and metrics to the last iteration, the
+        iteration it stopped at is kept in self.termination.
+
+        Yields:
+            (int, CellLattice): the iteration number and the simulation's lattice after it,
+            which the next iteration overwrites
+        """
+        done = len(self.history)
+        if self.early_stop and 0 < done < self.iterations and self.quiescent:
+            # a restored simulation which had already stopped spreading
+            self.finish(done - 1)
+        for i in range(len(self.history), self.iterations):
+            self.simulate_step()
+            yield i, self.lattice
+            if self.early_stop and self.quiescent and i < self.iterations-1:
+                self.finish(i)
+                break
+        else:
+            if self.termination == None:
+                self.termination = self.iterations
+        self.close_engine()
+        if self.profiler:
+            self.profiler.close()
+
+    @property
+    def quiescent(self):
+        """
+        true when no one is about to spread the rumour. no one can hear it
+        again, so the spread is final and the following iterations only
+        count down the remaining cooldowns
+        """
+        return self.cooldown_counts[-1] == 0
+
+    def finish(self, iteration):
+        """
+        fast-forwards a quiescent simulation from the given iteration to the last one,
+        leaving the lattice and metrics as running every iteration would
+
+        Args:
+            iteration (int): number of the last iteration which actually ran
+        """
+        self.termination = iteration + 1
+        remaining = self.iterations - self.termination
+        if remaining <= 0:
+            return
+
+        # cooldowns keep counting down and no one hears anything
+        cooldown = self.lattice.cooldown
+        np.maximum(cooldown, min(remaining, self.l), out=cooldown)
+        cooldown -= min(remaining, self.l)
+        self.lattice.heard_rumour[...] = 0
+        for i in range(remaining):
+            self.update_metrics(0, 0)
+        if self.engine == 'parallel':
+            # nothing is left to run, so the workers are stopped rather than restarted
+            self.close_engine()
+        else:
+            self.create_engine()
+
+    def create_engine(self):
+        """creates the state of the engines which keep track of the lattice between iterations"""
+        if self.engine == 'frontier':
+            self.frontier = Engine.FrontierEngine(self.lattice, self.l)
+        elif self.engine == 'tiled':
+            self.tiled = Engine.TiledEngine(self.lattice, self.l, self.tile_budget)
+        elif self.engine == 'graph':
+            self.graph_engine = Engine.GraphEngine(self.lattice, self.graph, self.l)
+        elif self.engine == 'parallel' and self.parallel == None:
+            # the rows' random number generators are derived from the simulation's
+            entropy = int(self.rng.integers(2**63))
+            self.parallel = Parallel.ParallelEngine(self.lattice, self.l, entropy, self.workers)
+            self.lattice = self.parallel.lattice
+
+    def close_engine(self):
+        """
+        stops the worker processes of the parallel engine, moving its lattice
+        from shared memory back into memory of its own. simulating again starts new workers.
+        """
+        if self.parallel != None:
+            self.lattice = self.lattice.copy()
+            self.parallel.close()
+            self.parallel = None
+
+    def run_stats(self, stats_sr = 5, checkpoint=None, checkpoint_every=50):
+        """
+        runs the whole simulation keeping only the sampled spread
+
+        Args:
+            stats_sr (int, optional): number of iterations between spread samples. Defaults to 5.
+            checkpoint (str, optional): path of a file the simulation is saved to every checkpoint_every
+            iterations and at the end, from which an interrupted run carries on with load(). Defaults to None.
+            checkpoint_every (int, optional): number of iterations between checkpoints. Defaults to 50.
+
+        Returns:
+            ndarray: the spread sampled every stats_sr iterations
+        """
+        stats = self.new_stats(stats_sr)
+        for i, lattice in self.steps():
+            self.sample_stats(stats, i, stats_sr)
+            if checkpoint and (i+1) % checkpoint_every == 0 and i < self.iterations-1:
+                self.save(checkpoint)
+        self.pad_stats(stats, stats_sr)
+        if checkpoint:
+            self.save(checkpoint)
+        return stats
+
+    def record(self, path, fields=('got_rumour',), stats_sr = 5):
+        """
+        runs the whole simulation, writing the chosen fields of every frame
+        to a memory mapped .npy file instead of keeping them in memory.
+        the file holds a record array of shape (iterations, *shape) and can be
+        read back lazily with np.load(path, mmap_mode='r').
+
+        Args:
+            path (str): path of the .npy file to write
+            fields (tuple, optional): names of the FEATURES fields to record. Defaults to ('got_rumour',).
+            stats_sr (int, optional): number of iterations between spread samples. Defaults to 5.
+
+        Returns:
+            ndarray: the spread sampled every stats_sr iterations
+        """
+        for field in fields:
+            if field not in self.features.names:
+                raise ValueError(f"unknown field '{field}', expected one of {self.features.names}")
+        # fields keep the lattice's compact types
+        dtype = np.dtype([(field, self.lattice[field].dtype) for field in fields])
+        frames = np.lib.format.open_memmap(path, mode='w+', dtype=dtype,
+                                           shape=(self.iterations, *self.shape))
+        stats = self.new_stats(stats_sr)
+        for i, lattice in self.steps():
+            for field in fields:
+                frames[i][field] = lattice[field]
+            self.sample_stats(stats, i, stats_sr)
+
+        # iterations after an early stop repeat the final state
+        for field in fields:
+            frames[self.termination:][field] = self.lattice[field]
+        self.pad_stats(stats, stats_sr)
+
+        frames.flush()
+        del frames
+        return stats
+
+    def new_stats(self, stats_sr):
+        """
+        returns an array for the spread sampled every stats_sr iterations, holding
+        the samples of any iterations a restored simulation ran before its snapshot
+        """
+        stats = np.zeros(self.iterations//stats_sr)
+        reached = [row[0] for row in self.history[::stats_sr]][:len(stats)]
+        stats[:len(reached)] = np.array(reached) / max(self.population, 1)
+        return stats
+
+    def sample_stats(self, stats, iteration, stats_sr):
+        """
+        stores the current spread in stats if the iteration is a sampled one
+
+        Args:
+            stats (ndarray): array from new_stats()
+            iteration (int): number of the iteration which just ran
+            stats_sr (int): number of iterations between spread samples
+        """
+        if iteration % stats_sr == 0 and iteration//stats_sr < len(stats):
+            stats[iteration//stats_sr] = self.get_stats()
+
+    def pad_stats(self, stats, stats_sr):
+        """
+        fills the samples of the iterations skipped by an early stop with the final spread
+
+        Args:
+            stats (ndarray): array from new_stats()
+            stats_sr (int): number of iterations between spread samples
+        """
+        first = -(-self.termination // stats_sr)
+        stats[first:] = self.get_stats()
 
         
             
+    def snapshot(self, copy=True):
+        """
+        the full state of the simulation between iterations: its parameters, lattice,
+        metrics and the state of its random number generator, as a dict of arrays.
+        restore() continues it exactly as the simulation itself would have continued.
+        the parallel engine's workers are stopped first, and the next iteration starts
+        new ones whose rows' generators are drawn from the simulation's, so a parallel
+        run with snapshots differs from one without, though every run with the same
+        snapshots and seed is the same.
+
+        Args:
+            copy (bool, optional): copy the lattice, otherwise the snapshot holds the
+            lattice's own arrays, which the next iteration changes. Defaults to True.
+
+        Returns:
+            dict: the snapshot, which save() writes to a file
+        """
+        self.close_engine()
+        s1, s2, s3, s4 = self.distribution
+        snapshot = dict(version=VERSION, p=self.p, l=self.l, s1=s1, s2=s2, s3=s3, s4=s4, iterations=self.iterations,
+                        shape=self.shape, engine=self.engine, early_stop=self.early_stop, tile_budget=self.tile_budget,
+                        workers=self.workers or 0, rng=json.dumps(self.rng.bit_generator.state),
+                        population=self.population, reached=self.reached, cooldown_counts=self.cooldown_counts.copy(),
+                        history=self.get_metrics(), termination=-1 if self.termination == None else self.termination)
+        for field in ('exists_bits', 'sus_index') + CellLattice.COUNTERS:
+            array = getattr(self.lattice, field)
+            snapshot[field] = np.array(array) if copy else array
+        if self.graph is not None:
+            snapshot['graph_indptr'] = self.graph.indptr
+            snapshot['graph_indices'] = self.graph.indices
+        return snapshot
+
+    @classmethod
+    def restore(cls, snapshot, seed=None, profiler=None, directory=None):
+        """
+        a simulation in the state of a snapshot, which carries on from the iteration
+        the snapshot was taken after. the frames of earlier iterations are not kept,
+        so run(preprocess=True) leaves them empty, while the metrics and sampled spread
+        cover every iteration.
+
+        Args:
+            snapshot (dict): a snapshot from snapshot(), or read from a file saved by save()
+            seed (int or SeedSequence, optional): seed of a new random number generator for the
+            simulation. Defaults to None, continuing the snapshot's generator.
+            profiler (Profile.Profiler, optional): see Simulation. Defaults to None.
+            directory (str, optional): directory in which a new subdirectory holds the tiled engine's
+            lattice files, so the files of a simulation running in it are never written over.
+            Defaults to a temporary directory.
+
+        Returns:
+            Simulation: the restored simulation
+        """
+        if int(snapshot['version']) != VERSION:
+            raise ValueError(f"the snapshot is of version {int(snapshot['version'])} of the simulation, not {VERSION}")
+        simulation = cls.__new__(cls)
+        simulation.engine = str(snapshot['engine'])
+        simulation.graph = None
+        if 'graph_indices' in snapshot:
+            indptr, indices = np.array(snapshot['graph_indptr']), np.array(snapshot['graph_indices'])
+            nodes = len(indptr) - 1
+            simulation.graph = sparse.csr_matrix((np.ones(len(indices), dtype=np.int32), indices, indptr),
+                                                 shape=(nodes, nodes))
+        simulation.early_stop = bool(snapshot['early_stop'])
+        simulation.profiler = profiler
+        simulation.seed = seed
+        if seed == None:
+            state = json.loads(str(snapshot['rng']))
+            simulation.rng = np.random.Generator(getattr(np.random, state['bit_generator'])())
+            simulation.rng.bit_generator.state = state
+        else:
+            simulation.rng = np.random.default_rng(seed)
+        simulation.p = float(snapshot['p'])
+        simulation.distribution = tuple(float(snapshot[s]) for s in ('s1', 's2', 's3', 's4'))
+        simulation.l = int(snapshot['l'])
+        simulation.shape = tuple(int(side) for side in snapshot['shape'])
+        simulation.iterations = int(snapshot['iterations'])
+        simulation.features = FEATURES
+
+        lattice = CellLattice.__new__(CellLattice)
+        lattice.shape = simulation.shape
+        lattice.directory = None
+        for field in ('exists_bits', 'sus_index') + CellLattice.COUNTERS:
+            setattr(lattice, field, np.array(snapshot[field]))
+        simulation.directory = None
+        if simulation.engine == 'tiled':
+            if directory == None:
+                simulation.temporary_directory = tempfile.TemporaryDirectory(prefix='rumour-')
+                directory = simulation.temporary_directory.name
+            else:
+                # the directory may be the one of the simulation the snapshot was taken from
+                directory = tempfile.mkdtemp(prefix='rumour-', dir=directory)
+            simulation.directory = directory
+            lattice = lattice.to_directory(directory)
+        simulation.lattice = lattice
+
+        simulation.population = int(snapshot['population'])
+        simulation.reached = int(snapshot['reached'])
+        simulation.cooldown_counts = np.array(snapshot['cooldown_counts'], dtype=np.int64)
+        simulation.history = np.asarray(snapshot['history'], dtype=METRICS).tolist()
+        termination = int(snapshot['termination'])
+        simulation.termination = None if termination < 0 else termination
+        simulation.tile_budget = int(snapshot['tile_budget'])
+        simulation.workers = int(snapshot['workers']) or None
+        simulation.parallel = None
+        if simulation.engine != 'parallel':
+            # the parallel engine's workers are started by the first iteration
+            simulation.create_engine()
+        return simulation
+
+    def save(self, path):
+        """
+        writes a snapshot of the simulation to a compressed .npz file, replacing
+        the file atomically so an interrupted save leaves the previous one whole
+
+        Args:
+            path (str): path of the file
+        """
+        snapshot = self.snapshot(copy=False)
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp', delete=False) as file:
+            np.savez_compressed(file, **snapshot)
+        os.replace(file.name, path)
+
+    @classmethod
+    def load(cls, path, seed=None, profiler=None, directory=None):
+        """
+        reads a simulation saved by save(), see restore()
+
+        Args:
+            path (str): path of the file
+
+        Returns:
+            Simulation: the restored simulation
+        """
+        with np.load(path) as file:
+            snapshot = dict(file)
+        return cls.restore(snapshot, seed, profiler, directory)
+
+    def fork(self, branches, seed=None):
+        """
+        continuations of the simulation from its current state, each with its own
+        independent random number generator, which the simulation is not changed by
+
+        Args:
+            branches (int): number of continuations
+            seed (int or SeedSequence, optional): seed the branches' generators are spawned from.
+            Defaults to a number drawn from a copy of the simulation's generator, so the same
+            state always forks the same way.
+
+        Returns:
+            list: the continuations, Simulation objects
+        """
+        snapshot = self.snapshot()
+        if seed == None:
+            seed = int(copy.deepcopy(self.rng).integers(2**63))
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        return [Simulation.restore(snapshot, branch) for branch in seed.spawn(branches)]
+
     def create_cell_lattice(self):
         """
         creates a new lattice graph of people with random assignments according
         to the given distribution parameters
         """
-        self.lattice = np.ndarray(shape=self.shape, dtype=self.features)
-        
-        # generate
-        self.lattice['exists'] = self.p_dist.rvs(size=self.shape)
-        self.lattice['sus_level'] = self.sus_dist.rvs(size=self.shape)
-        self.lattice['heard_rumour'] = np.zeros(self.shape)
-        self.lattice['cooldown'] = np.zeros(self.shape)
-        self.lattice['got_rumour'] = np.zeros(self.shape)
+        self.lattice = random_lattice(self.shape, self.p, self.distribution, self.rng,
+                                      self.l, self.iterations, directory=self.directory)
         
 
     def spread_rumour(self, i, j):
@@ -112,63 +530,101 @@ class Simulation:
         Args:
             i (int): current cell's row
             j (int): current cell's column
+
+        Returns:
+            int: number of neighbours who heard the rumour for the first time
         """        
 
         
         # if is split to prevent errors when at lattice's edge
+        neighbours = []
         if i > 0:
-            if self.lattice[i-1, j]['exists']:
-                self.lattice[i-1, j]['heard_rumour'] += 1
-                self.lattice[i-1, j]['got_rumour'] += 1
-
+            neighbours.append((i-1, j))
         if i < self.shape[0]-1:
-            if self.lattice[i+1, j]['exists']:
-                self.lattice[i+1, j]['heard_rumour'] += 1
-                self.lattice[i+1, j]['got_rumour'] += 1
-
+            neighbours.append((i+1, j))
         if j > 0:
-            if self.lattice[i, j-1]['exists']:
-                self.lattice[i, j-1]['heard_rumour'] += 1
-                self.lattice[i, j-1]['got_rumour'] += 1
-
+            neighbours.append((i, j-1))
         if j < self.shape[1]-1:
-            if self.lattice[i, j+1]['exists']:
-                self.lattice[i, j+1]['heard_rumour'] += 1
-                self.lattice[i, j+1]['got_rumour'] += 1
+            neighbours.append((i, j+1))
+
+        newly_reached = 0
+        for neighbour in neighbours:
+            if self.lattice.exists_at(neighbour):
+                if self.lattice.got_rumour[neighbour] == 0:
+                    newly_reached += 1
+                self.lattice.heard_rumour[neighbour] += 1
+                self.lattice.got_rumour[neighbour] += 1
 
         # self.lattice[i, j]['got_rumour'] += 1
+        return newly_reached
         
     def simulate_step(self):
         """
-        run one iteration of the simulation
+        run one iteration of the simulation using the selected engine
+        """
+        profiler = self.profiler
+        if profiler:
+            profiler.begin(len(self.history))
+        if self.engine == 'loop':
+            newly_reached, decided = self.loop_step()
+        elif self.engine == 'frontier':
+            newly_reached, decided = self.frontier.step(self.lattice, self.rng, profiler)
+        elif self.engine == 'tiled':
+            newly_reached, decided = self.tiled.step(self.lattice, self.rng, profiler)
+        elif self.engine == 'graph':
+            newly_reached, decided = self.graph_engine.step(self.lattice, self.rng, profiler)
+        elif self.engine == 'parallel':
+            if self.parallel == None:
+                self.create_engine()
+            newly_reached, decided = self.parallel.step(self.lattice, self.rng, profiler)
+        else:
+            newly_reached, decided = Engine.vectorized_step(self.lattice, self.l, self.rng, profiler)
+        self.update_metrics(int(newly_reached), int(decided))
+        if profiler:
+            profiler.mark('metrics')
+
+    def loop_step(self):
+        """
+        run one iteration of the simulation, visiting each cell in turn
+
+        Returns:
+            (int, int): number of people who heard the rumour for the first time,
+            and number of people who decided to spread it
         """
         # remove influence of the previous iteration, done
         # here to allow frame to aputre rumour spread
-        self.lattice['heard_rumour'] = np.zeros(self.shape)
+        self.lattice.heard_rumour[...] = 0
+        profiler = self.profiler
+        if profiler:
+            profiler.mark('reset')
+        cooldown = self.lattice.cooldown
+        newly_reached = 0
+        decided = 0
+        draws = 0
         
         # spread rumour and reduce cooldown
         # based on the previous iteration
-        it_spread = np.nditer(self.lattice, flags=['multi_index'], op_flags=['readwrite'])
-        for cell in it_spread:
-            if not cell['exists']:
+        for index in np.ndindex(*self.shape):
+            if not self.lattice.exists_at(index):
             # no person in lattice cell
                 continue
             
             # person has decided to spread the rumour last iteration
-            if cell['cooldown'] == self.l:
-                self.spread_rumour(*it_spread.multi_index)
+            if cooldown[index] == self.l:
+                newly_reached += self.spread_rumour(*index)
                 
                 # current iteration counts towards rumour spreaded
-                cell['cooldown'] -= 1
+                cooldown[index] -= 1
 
             # person has spread the rumour in the last l iterations               
-            elif cell['cooldown'] > 0:
-                cell['cooldown'] -= 1
+            elif cooldown[index] > 0:
+                cooldown[index] -= 1
+        if profiler:
+            profiler.mark('spread')
         
         # decide to spread rumour based on the previous iteration
-        it_decide = np.nditer(self.lattice, flags=['multi_index'], op_flags=['readwrite'])
-        for cell in it_decide:
-            if cell['cooldown'] > 0:
+        for index in np.ndindex(*self.shape):
+            if cooldown[index] > 0:
                 continue
             """
             decide whether or not to pass on the rumour
@@ -177,28 +633,90 @@ class Simulation:
             whether or not the cell heard the rumour at least twice in
             the past iteration
             """
-            if (cell['heard_rumour'] == 1 and
-                                np.random.rand(1) < cell['sus_level']):
-                cell['cooldown'] = self.l
-            elif (cell['heard_rumour'] > 1 and
-                            np.random.rand(1) < cell['sus_level'] + 1/3):
-                cell['cooldown'] = self.l
+            heard = self.lattice.heard_rumour[index]
+            sus_level = SUS_LEVELS[self.lattice.sus_index[index]]
+            draws += heard > 0
+            if (heard == 1 and
+                                self.rng.random() < sus_level):
+                cooldown[index] = self.l
+                decided += 1
+            elif (heard > 1 and
+                            self.rng.random() < sus_level + 1/3):
+                cooldown[index] = self.l
+                decided += 1
             else:
                 # cell has not heard rumour and will not spread it
                 pass
 
+        if profiler:
+            # drawing is part of the decide loop, every cell is visited twice
+            profiler.mark('decide')
+            profiler.count('spreads', int(self.lattice.heard_rumour.sum(dtype=np.int64)))
+            profiler.count('draws', int(draws))
+            profiler.count('visited', 2 * self.lattice.sus_index.size)
+        return newly_reached, decided
+
+    def init_metrics(self):
+        """
+        counts the population and the people who have already heard or are
+        spreading the rumour, once, so that every iteration only has to update
+        the counters with what the engine reports. the lattice is read a block
+        of rows at a time, so it does not need to fit in memory
+        """
+        self.population = 0
+        self.reached = 0
+        # number of people at each cooldown value from 1 to l, a person at
+        # cooldown l spreads the rumour in the next iteration
+        cooldown_counts = np.zeros(self.l+1, dtype=np.int64)
+        rows = max(1, (1<<20) // self.shape[1])
+        for start in range(0, self.shape[0], rows):
+            exists = self.lattice.exists_rows(start, start + rows)
+            self.population += np.count_nonzero(exists)
+            self.reached += np.count_nonzero(self.lattice.got_rumour[start:start + rows][exists])
+            cooldown = np.minimum(self.lattice.cooldown[start:start + rows][exists], self.l)
+            cooldown_counts += np.bincount(cooldown, minlength=self.l+1)
+        self.cooldown_counts = cooldown_counts[1:]
+        self.history = []
+        self.termination = None
+
+    def update_metrics(self, newly_reached, decided):
+        """
+        advances the counters by one iteration
+
+        Args:
+            newly_reached (int): number of people who heard the rumour for the first time
+            decided (int): number of people who decided to spread the rumour
+        """
+        self.reached += newly_reached
+        spreaders = self.cooldown_counts[-1]
+
+        # every cooldown counts down by one, the people
+        # who just decided start at cooldown l
+        self.cooldown_counts[:-1] = self.cooldown_counts[1:].copy()
+        self.cooldown_counts[-1] = decided
+
+        self.history.append((self.reached, newly_reached, spreaders, self.in_cooldown))
+
+    @property
+    def in_cooldown(self):
+        """number of people who have spread the rumour in the last l iterations"""
+        return int(self.cooldown_counts.sum())
+
+    def get_metrics(self):
+        """
+        Returns:
+            ndarray: a METRICS record for every iteration run so far
+        """
+        return np.array(self.history, dtype=METRICS)
+
     def get_stats(self):
-        heard_rumour = 0
-        it_spread = np.nditer(self.lattice)
-        for cell in it_spread:
-            if not cell['exists']:
-            # no person in lattice cell
-                continue
-            if cell['got_rumour'] > 0:
-                heard_rumour += 1
-
-        # divide by dead precent, since the relevant number of cells in the lattice is
-        # that percentage times the total number of cells.
-        dead_percent = self.p_dist.pmf(1)
-        percent_heard = heard_rumour / (self.shape[0] * self.shape[1] * dead_percent)
-        return percent_heard 
+        """
+        Returns:
+            float: portion of the population which has heard the rumour
+        """
+        if self.profiler:
+            self.profiler.resume()
+            stats = self.reached / self.population
+            self.profiler.mark('stats')
+            return stats
+        return self.reached / self.population
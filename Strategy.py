@@ -0,0 +1,168 @@
+import numpy as np
+from Lattice import CellLattice, sus_level_index
+
+
+class Strategy:
+
+    def __init__(self, p=None):
+        """
+        a strategy places people of chosen susceptibility levels on a lattice.
+        strategies are called with the lattice's shape and a random number
+        generator, and are classes rather than closures so that they can be
+        sent to sweep worker processes.
+
+        Args:
+            p (float, optional): portion of cells a person is kept in, at random.
+            Defaults to None, keeping everyone the pattern places.
+        """
+        self.p = p
+
+    def __call__(self, shape, rng=None):
+        """
+        builds a new lattice following the strategy
+
+        Args:
+            shape (tuple): shape of the lattice
+            rng (Generator, optional): random number generator for random patterns. Defaults to fresh entropy.
+
+        Returns:
+            CellLattice: the lattice, with all counters at zero
+        """
+        rng = np.random.default_rng(rng)
+        lattice = CellLattice(shape)
+        exists, sus_index = self.pattern(lattice.shape, rng)
+        if self.p is not None:
+            exists = exists & (rng.random(lattice.shape) < self.p)
+        lattice.exists = exists
+        lattice.sus_index[...] = sus_index
+        return lattice
+
+    def pattern(self, shape, rng):
+        """
+        Returns:
+            (ndarray, ndarray): where people are placed, and the index of each cell's level
+        """
+        raise NotImplementedError
+
+
+class TileStrategy(Strategy):
+
+    def __init__(self, tile, p=None):
+        """
+        repeats a tile across the lattice, cutting it at the lattice's far edges
+
+        Args:
+            tile (ndarray): 2d array of susceptibility values, nan where no one is placed
+            p (float, optional): portion of cells a person is kept in, at random. Defaults to None.
+        """
+        super().__init__(p)
+        tile = np.asarray(tile, dtype='f8')
+        if tile.ndim != 2:
+            raise ValueError("a tile must be a 2d array")
+        self.exists_tile = ~np.isnan(tile)
+        self.sus_tile = sus_level_index(np.where(self.exists_tile, tile, 0))
+
+    def pattern(self, shape, rng):
+        height, width = shape[-2:]
+        reps = (-(-height // self.sus_tile.shape[0]), -(-width // self.sus_tile.shape[1]))
+        exists = np.tile(self.exists_tile, reps)[:height, :width]
+        sus_index = np.tile(self.sus_tile, reps)[:height, :width]
+        return exists, sus_index
+
+
+class ClusterStrategy(Strategy):
+
+    def __init__(self, density, size, level=0, background=1, p=None):
+        """
+        places square clusters of one susceptibility level at random
+        positions on a background of another
+
+        Args:
+            density (float): portion of cells which are the corner of a cluster
+            size (int): side of each cluster
+            level (float, optional): susceptibility of the clusters. Defaults to 0.
+            background (float, optional): susceptibility everywhere else. Defaults to 1.
+            p (float, optional): portion of cells a person is kept in, at random. Defaults to None.
+        """
+        super().__init__(p)
+        self.density = density
+        self.size = size
+        self.level = sus_level_index(level)
+        self.background = sus_level_index(background)
+
+    def pattern(self, shape, rng):
+        corners = rng.random(shape) < self.density
+        clusters = box_dilate(corners, self.size)
+        sus_index = np.where(clusters, self.level, self.background).astype(np.uint8)
+        return np.ones(shape, dtype=bool), sus_index
+
+
+def box_dilate(mask, size):
+    """
+    grows every true cell of a mask into a size by size square below and to its right,
+    using running sums so the cost does not depend on size
+
+    Args:
+        mask (ndarray): 2d boolean array
+        size (int): side of the squares
+
+    Returns:
+        ndarray: boolean array, true inside any square
+    """
+    grown = mask.astype(np.int32)
+    for axis in (0, 1):
+        running = np.cumsum(grown, axis=axis)
+        behind = np.zeros_like(running)
+        if axis == 0:
+            behind[size:] = running[:-size]
+        else:
+            behind[:, size:] = running[:, :-size]
+        grown = running - behind
+    return grown > 0
+
+
+def blocks(size=3, border=2, inner=1, outer=1/3, p=None):
+    """
+    square blocks of one level separated by borders of another,
+    main.strategic_sim is blocks(3, 2, 1, 1/3)
+
+    Args:
+        size (int, optional): side of each block. Defaults to 3.
+        border (int, optional): width of the border between blocks. Defaults to 2.
+        inner (float, optional): susceptibility inside the blocks. Defaults to 1.
+        outer (float, optional): susceptibility of the borders. Defaults to 1/3.
+        p (float, optional): portion of cells a person is kept in, at random. Defaults to None.
+    """
+    tile = np.full((size + border, size + border), outer)
+    tile[:size, :size] = inner
+    return TileStrategy(tile, p)
+
+
+def stripes(width=5, gap=1, level=1, gap_level=2/3, axis=1, p=None):
+    """
+    parallel stripes of one level separated by gaps of another
+
+    Args:
+        width (int, optional): width of each stripe. Defaults to 5.
+        gap (int, optional): width of the gap between stripes. Defaults to 1.
+        level (float, optional): susceptibility of the stripes. Defaults to 1.
+        gap_level (float, optional): susceptibility of the gaps, nan leaves them empty. Defaults to 2/3.
+        axis (int, optional): 1 for vertical stripes, 0 for horizontal ones. Defaults to 1.
+        p (float, optional): portion of cells a person is kept in, at random. Defaults to None.
+    """
+    tile = np.array([[level] * width + [gap_level] * gap])
+    return TileStrategy(tile if axis == 1 else tile.T, p)
+
+
+def random_clusters(density=0.01, size=5, level=0, background=1, p=None):
+    """
+    square clusters of one level at random positions, see ClusterStrategy
+    """
+    return ClusterStrategy(density, size, level, background, p)
+
+
+def custom(tile, p=None):
+    """
+    repeats a user supplied tile of susceptibility values, nan where no one is placed
+    """
+    return TileStrategy(tile, p)
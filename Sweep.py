@@ -0,0 +1,610 @@
+import concurrent.futures
+import os
+import statistics
+import numpy as np
+import Sim
+import Ensemble
+import Profile
+import Cache
+
+
+# simulation parameters recorded in every row of a sweep's results
+PARAMETERS = (('p', 'f8'), ('l', 'i4'), ('s1', 'f8'), ('s2', 'f8'), ('s3', 'f8'), ('s4', 'f8'), ('iterations', 'i4'))
+
+
+# fields added to every row of a profiled sweep, see Profile.Profiler.summary
+PROFILED = Profile.PROFILE.descr[1:]
+
+# Simulation arguments an Ensemble takes too, parameter sets with any other run a Simulation per replica
+ENSEMBLE_PARAMETERS = {'p', 'l', 's1', 's2', 's3', 's4', 'iterations', 'shape', 'strategy'}
+
+# most cells of all the replicas one ensemble stacks, which bounds a task's memory
+ENSEMBLE_CELLS = 1 << 21
+
+
+def task_seed(seed, param_index, replica):
+    """
+    derives the independent random stream of a single task from the sweep's seed.
+    the stream only depends on the seed and the task's position in the sweep,
+    never on which worker runs it or in what order.
+
+    Args:
+        seed (int or sequence of ints): entropy of the whole sweep
+        param_index (int): index of the task's parameter set
+        replica (int): index of the replica within its parameter set
+
+    Returns:
+        SeedSequence: the task's seed
+    """
+    return np.random.SeedSequence(seed, spawn_key=(param_index, replica))
+
+
+def check_stats_sr(param_sets, stats_sr):
+    """
+    raises ValueError unless every parameter set samples its spread at least once,
+    studies read a replica's final spread from the last sample of its curve
+
+    Args:
+        param_sets (list): dicts of Simulation arguments
+        stats_sr (int): number of iterations between spread samples
+    """
+    if stats_sr < 1:
+        raise ValueError("the number of iterations between spread samples must be at least 1")
+    shortest = min((int(params['iterations']) for params in param_sets), default=stats_sr)
+    if stats_sr > shortest:
+        raise ValueError(f"the spread is sampled every {stats_sr} iterations, more than the {shortest} iterations run")
+
+
+def run_task(task):
+    """
+    runs a single replica of a parameter set to the end.
+    a module level function so that worker processes can unpickle it.
+
+    Args:
+        task (tuple): the parameter set as a dict of Simulation arguments,
+        the task's SeedSequence, the number of iterations between spread samples
+        and whether to profile the simulation
+
+    Returns:
+        (ndarray, int, dict): the spread sampled every stats_sr iterations,
+        the number of iterations run before the spread stopped,
+        and the profiler's summary, or None when not profiled
+    """
+    params, seed, stats_sr, profile = task
+    profiler = Profile.Profiler() if profile else None
+    simulation = Sim.Simulation(**params, seed=seed, profiler=profiler)
+    stats = simulation.run_stats(stats_sr)
+    return stats, simulation.termination, profiler.summary() if profile else None
+
+
+def run_replicas(task):
+    """
+    runs a batch of replicas of a parameter set to the end, stacked in one Ensemble,
+    whose replicas are the simulations run_task() would run with the same seeds.
+    profiled batches, and parameter sets with arguments an Ensemble does not take,
+    run one Simulation per replica.
+
+    Args:
+        task (tuple): the parameter set as a dict of Simulation arguments, the SeedSequence
+        of every replica, the number of iterations between spread samples and whether to profile them
+
+    Returns:
+        list: the (spread, termination, summary) result of every replica, as run_task() gives them
+    """
+    params, seeds, stats_sr, profile = task
+    if profile or len(seeds) < 2 or not set(params) <= ENSEMBLE_PARAMETERS:
+        return [run_task((params, seed, stats_sr, profile)) for seed in seeds]
+    ensemble = Ensemble.Ensemble(**params, seeds=seeds)
+    stats, mean = ensemble.run(stats_sr)
+    return [(stats[replica], int(ensemble.termination[replica]), None) for replica in range(len(seeds))]
+
+
+def batch_tasks(tasks, workers, rounds=2):
+    """
+    groups consecutive replicas of the same parameter set into batches for run_replicas(),
+    small enough to give every worker about rounds batches and to fit ENSEMBLE_CELLS
+
+    Args:
+        tasks (list): single replica tasks, as run_task() takes them. replicas belong to
+        the same parameter set when their tasks hold the same dict
+        workers (int): number of worker processes
+        rounds (int, optional): batches per worker. Defaults to 2.
+
+    Returns:
+        list: the batches, as run_replicas() takes them, with the tasks in order
+    """
+    groups = []
+    for params, seed, stats_sr, profile in tasks:
+        if groups and groups[-1][0] is params and groups[-1][2:] == (stats_sr, profile):
+            groups[-1][1].append(seed)
+        else:
+            groups.append((params, [seed], stats_sr, profile))
+    size = max(1, -(-len(tasks) // (workers * rounds)))
+    batches = []
+    for params, seeds, stats_sr, profile in groups:
+        cells = int(np.prod(params.get('shape', (100, 100))))
+        step = max(1, min(size, ENSEMBLE_CELLS // cells))
+        batches += [(params, seeds[start:start + step], stats_sr, profile) for start in range(0, len(seeds), step)]
+    return batches
+
+
+def cached_replicas(cache, params, stats_sr, stream):
+    """
+    Args:
+        cache (Cache.ResultCache): the cache, or None
+        params (dict): Simulation arguments
+        stats_sr (int): number of iterations between spread samples
+        stream (SeedSequence): the stream the replicas are seeded from, None when unseeded
+
+    Returns:
+        (str, list): the parameter set's key in the cache, None if it is not cached,
+        and a (spread, termination, None) result for each cached replica, in order
+    """
+    key = None if cache is None else Cache.result_key(params, stats_sr, stream)
+    if key is None:
+        return None, []
+    cached = cache.load(key)
+    if cached is None:
+        return key, []
+    spread, termination = cached
+    return key, [(spread[replica], int(termination[replica]), None) for replica in range(len(spread))]
+
+
+def store_replicas(cache, key, results):
+    """stores the (spread, termination, summary) results of every replica of a parameter set"""
+    if key is not None:
+        cache.store(key, np.array([stats for stats, _, _ in results]),
+                    np.array([termination for _, termination, _ in results]))
+
+
+def run_branch(task):
+    """
+    runs a single continuation of a snapshot to the end, as run_task() runs a replica
+
+    Args:
+        task (tuple): the snapshot, from Sim.Simulation.snapshot(), the branch's SeedSequence
+        and the number of iterations between spread samples
+
+    Returns:
+        (ndarray, int, None): the spread sampled every stats_sr iterations, from the first
+        iteration before the snapshot, and the number of iterations run before the spread stopped
+    """
+    snapshot, seed, stats_sr = task
+    simulation = Sim.Simulation.restore(snapshot, seed)
+    stats = simulation.run_stats(stats_sr)
+    return stats, simulation.termination, None
+
+
+def run_tasks(tasks, workers, function=run_task):
+    """
+    runs tasks on a pool of worker processes, or in this process with a single worker
+
+    Args:
+        tasks (list): the tasks
+        workers (int): number of worker processes
+        function (function, optional): the function run on every task, run_task or run_branch. Defaults to run_task.
+        the replicas of run_task are run in batches, see batch_tasks().
+
+    Returns:
+        list: the result of every task, in order
+    """
+    if function is run_task:
+        batches = batch_tasks(tasks, workers)
+        return [result for results in run_tasks(batches, workers, run_replicas) for result in results]
+    if workers == 1 or len(tasks) < 2:
+        return list(map(function, tasks))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        chunksize = max(1, len(tasks) // (workers * 4))
+        return list(executor.map(function, tasks, chunksize=chunksize))
+
+
+def results_table(param_sets, results, profile=False):
+    """
+    Args:
+        param_sets (list): dicts of Simulation arguments
+        results (list): for every parameter set, the (spread, termination, summary) result of each replica
+        profile (bool, optional): whether the results hold profiler summaries. Defaults to False.
+
+    Returns:
+        ndarray: a record per replica, as sweep() gives them
+    """
+    samples = max((len(stats) for replicas in results for stats, _, _ in replicas), default=0)
+    profiled = PROFILED if profile else []
+    dtype = np.dtype([('param_set', 'i4'), ('replica', 'i4'), *PARAMETERS,
+                      ('termination', 'i4'), *profiled, ('spread', 'f8', (samples,))])
+    table = np.zeros(sum(len(replicas) for replicas in results), dtype=dtype)
+    table['spread'] = np.nan
+    rows = ((index, replica, params, result) for index, params in enumerate(param_sets)
+            for replica, result in enumerate(results[index]))
+    for row, (index, replica, params, (stats, termination, summary)) in enumerate(rows):
+        table['param_set'][row], table['replica'][row] = index, replica
+        for name, _ in PARAMETERS:
+            table[name][row] = params[name]
+        for name, _ in profiled:
+            table[name][row] = summary[name]
+        table['termination'][row] = termination
+        table['spread'][row, :len(stats)] = stats
+    return table
+
+
+class Replicas:
+
+    def __init__(self, param_sets, seed=None, stats_sr=5, profile=False, cache=None):
+        """
+        the replicas of a study's parameter sets, which may be added to in rounds.
+        replicas are seeded by their parameter set's and their own index, and cached
+        ones are reused in order, so a study's results never depend on the number of
+        workers, on how many rounds it took or on what was cached.
+
+        Args:
+            param_sets (list): dicts of Simulation arguments, as in sweep()
+            seed (int, optional): entropy of the whole study. Defaults to fresh entropy.
+            stats_sr (int, optional): number of iterations between spread samples. Defaults to 5.
+            profile (bool, optional): profile every replica, which is then never cached. Defaults to False.
+            cache (Cache.ResultCache, optional): cache of replica results, see sweep(). Defaults to None.
+        """
+        check_stats_sr(param_sets, stats_sr)
+        seeded = seed is not None
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.param_sets = param_sets
+        self.seed = seed
+        self.stats_sr = stats_sr
+        self.profile = profile
+        self.cache = None if profile else cache
+        self.keys = []
+        self.cached = []
+        for index, params in enumerate(param_sets):
+            stream = np.random.SeedSequence(seed, spawn_key=(index,)) if seeded else None
+            key, cached = cached_replicas(self.cache, params, stats_sr, stream)
+            self.keys.append(key)
+            self.cached.append(cached)
+        self.results = [[] for params in param_sets]
+
+    def extend(self, counts, workers=None):
+        """
+        brings every parameter set up to a number of replicas, running the ones which are
+        neither done nor cached, and stores the parameter sets which ran any in the cache
+
+        Args:
+            counts (list): number of replicas wanted for each parameter set
+            workers (int, optional): number of worker processes, 1 runs every task in this
+            process. Defaults to the number of cores.
+        """
+        tasks = []
+        for index, (params, count) in enumerate(zip(self.param_sets, counts)):
+            results = self.results[index]
+            results += self.cached[index][len(results):count]
+            tasks += [(params, task_seed(self.seed, index, replica), self.stats_sr, self.profile)
+                      for replica in range(len(results), count)]
+
+        # tasks are in the order of their parameter sets and replicas
+        for (params, task, _, _), result in zip(tasks, run_tasks(tasks, workers or os.cpu_count())):
+            self.results[task.spawn_key[0]].append(result)
+        for index in sorted({task.spawn_key[0] for _, task, _, _ in tasks}):
+            store_replicas(self.cache, self.keys[index], self.results[index])
+
+    def table(self):
+        """
+        Returns:
+            ndarray: a record per replica so far, as sweep() gives them
+        """
+        return results_table(self.param_sets, self.results, self.profile)
+
+
+def sweep(param_sets, repeats=15, seed=None, workers=None, stats_sr=5, profile=False, cache=None):
+    """
+    runs every parameter set repeats times, spreading the (parameter set, replica)
+    tasks across a pool of worker processes. every task gets its own random stream
+    derived from seed, so the results are identical for any number of workers.
+
+    Args:
+        param_sets (list): dicts of Simulation arguments, each with at least
+        p, l, s1, s2, s3, s4 and iterations. shape and strategy may also be given,
+        a strategy must be a module level function so it can be sent to the workers.
+        repeats (int, optional): number of replicas per parameter set. Defaults to 15.
+        seed (int, optional): entropy of the whole sweep. Defaults to fresh entropy.
+        workers (int, optional): number of worker processes, 1 runs every task in this
+        process. Defaults to the number of cores.
+        stats_sr (int, optional): number of iterations between spread samples. Defaults to 5.
+        profile (bool, optional): profile every task, adding the seconds of each phase
+        and the operation counts of Profile.Profiler.summary() to its record. Defaults to False.
+        cache (Cache.ResultCache, optional): cache of replica results. a parameter set's cached
+        replicas are reused and only the missing ones run, and all of them are stored. the replicas
+        of a sweep without a seed may come from any earlier unseeded study. profiled sweeps always
+        run every replica. Defaults to None.
+
+    Returns:
+        ndarray: a record per task with its parameter set index, replica index,
+        parameters, the iteration its spread stopped at and spread curve. curves shorter than the longest one are padded with nan.
+    """
+    replicas = Replicas(param_sets, seed, stats_sr, profile, cache)
+    replicas.extend([repeats] * len(param_sets), workers)
+    return replicas.table()
+
+
+def branch_sweep(snapshots, branches=15, seed=None, workers=None, stats_sr=5):
+    """
+    runs independent continuations of every snapshot, each with its own random stream,
+    so the iterations before a snapshot are run once for all of its branches
+
+    Args:
+        snapshots (list): snapshots of simulations, from Sim.Simulation.snapshot() or read from saved files
+        branches (int, optional): number of continuations of every snapshot. Defaults to 15.
+        seed (int, optional): entropy of the branches' streams, branch b of snapshot i gets the stream
+        of task_seed(seed, i, b). Defaults to fresh entropy.
+        workers (int, optional): number of worker processes, 1 runs every branch in this
+        process. Defaults to the number of cores.
+        stats_sr (int, optional): number of iterations between spread samples. Defaults to 5.
+
+    Returns:
+        ndarray: a record per branch, as sweep() gives them, with the snapshot's index as its parameter set.
+        the spread curves start at the first iteration, so branches of a snapshot share their first samples
+    """
+    check_stats_sr(snapshots, stats_sr)
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    tasks = [(snapshot, task_seed(seed, index, branch), stats_sr)
+             for index, snapshot in enumerate(snapshots) for branch in range(branches)]
+    results = run_tasks(tasks, workers or os.cpu_count(), run_branch)
+    param_sets = [{name: snapshot[name] for name, _ in PARAMETERS} for snapshot in snapshots]
+    return results_table(param_sets, [results[index * branches:(index + 1) * branches]
+                                      for index in range(len(snapshots))])
+
+
+# the precision reached by every parameter set of adaptive_sweep(): its number of replicas,
+# the mean final spread, half the width of its confidence interval, half the widest interval
+# of any sample of the spread curve, and whether the target precision was reached
+PRECISION = np.dtype([('param_set', 'i4'), ('replicas', 'i4'), ('mean', 'f8'), ('half_width', 'f8'),
+                      ('curve_half_width', 'f8'), ('converged', '?')])
+
+
+def precision(spread, level=0.95):
+    """
+    Args:
+        spread (ndarray): the spread curves of a parameter set's replicas, shaped (replicas, samples)
+        level (float, optional): confidence level. Defaults to 0.95.
+
+    Returns:
+        (float, float, float): mean final spread, half the width of its confidence interval,
+        and half the width of the widest interval of any sample of the curve
+    """
+    mean, half_width = confidence_interval(spread[:, -1], level)
+    curve_half_width = np.max(confidence_interval(spread, level)[1])
+    return mean, half_width, curve_half_width
+
+
+def adaptive_sweep(param_sets, target, min_repeats=10, max_repeats=200, batch=10, seed=None, workers=None,
+                   stats_sr=5, cache=None, level=0.95, curve=False, profile=False):
+    """
+    sequential sampling: runs min_repeats replicas of every parameter set, and then
+    rounds of batch more replicas of the parameter sets whose confidence interval is
+    still wider than the target, until every one of them reaches it or max_repeats.
+    noisy parameter sets get more replicas than stable ones. the replicas are the
+    first ones sweep() would run, so the results only depend on the seed.
+
+    Args:
+        param_sets (list): dicts of Simulation arguments, as in sweep()
+        target (float): largest half width of the confidence interval, as a portion of the population
+        min_repeats (int, optional): replicas run before the first check. Defaults to 10.
+        max_repeats (int, optional): most replicas of a parameter set. Defaults to 200.
+        batch (int, optional): replicas added to an unconverged parameter set per round. Defaults to 10.
+        seed (int, optional): entropy of the whole sweep. Defaults to fresh entropy.
+        workers (int, optional): number of worker processes. Defaults to the number of cores.
+        stats_sr (int, optional): number of iterations between spread samples. Defaults to 5.
+        cache (Cache.ResultCache, optional): cache of replica results, as in sweep(). Defaults to None.
+        level (float, optional): confidence level. Defaults to 0.95.
+        curve (bool, optional): bound the interval of every sample of the spread curve,
+        rather than of the final spread only. Defaults to False.
+        profile (bool, optional): profile every replica, as in sweep(). Defaults to False.
+
+    Returns:
+        (ndarray, ndarray): a record per replica, as sweep() gives them, and
+        a PRECISION record per parameter set
+    """
+    replicas = Replicas(param_sets, seed, stats_sr, profile, cache)
+    counts = [min(min_repeats, max_repeats)] * len(param_sets)
+    summary = np.zeros(len(param_sets), dtype=PRECISION)
+    summary['param_set'] = np.arange(len(param_sets))
+    pending = list(range(len(param_sets)))
+    while pending:
+        replicas.extend(counts, workers)
+        for index in pending:
+            spread = np.array([stats for stats, _, _ in replicas.results[index]])
+            mean, half_width, curve_half_width = precision(spread, level)
+            reached = (curve_half_width if curve else half_width) <= target
+            summary[index] = index, len(spread), mean, half_width, curve_half_width, reached
+        pending = [index for index in pending if not summary['converged'][index] and counts[index] < max_repeats]
+        for index in pending:
+            counts[index] = min(counts[index] + batch, max_repeats)
+    return replicas.table(), summary
+
+
+def mean_spread(table):
+    """
+    averages the spread curves of all replicas of each parameter set
+
+    Args:
+        table (ndarray): results of sweep()
+
+    Returns:
+        ndarray: the mean spread curve of every parameter set, in order
+    """
+    param_sets = np.unique(table['param_set'])
+    return np.array([table['spread'][table['param_set'] == index].mean(axis=0) for index in param_sets])
+
+
+def profile_summary(table):
+    """
+    sums the phase times and operation counts of every task of a profiled sweep
+
+    Args:
+        table (ndarray): results of sweep(profile=True)
+
+    Returns:
+        dict: totals in the form of Profile.Profiler.summary()
+    """
+    summary = {name: table[name].sum().item() for name, _ in PROFILED}
+    summary['iterations'] = int(table['termination'].sum())
+    return summary
+
+
+def confidence_interval(samples, level=0.95):
+    """
+    normal approximation of the confidence interval of the samples' mean
+
+    Args:
+        samples (sequence): the samples, or rows of samples of several quantities, one per column
+        level (float, optional): confidence level. Defaults to 0.95.
+
+    Returns:
+        (float, float): the mean, and half the interval's width (nan for fewer than 2 samples),
+        or arrays of them for every column
+    """
+    samples = np.asarray(samples, dtype='f8')
+    if len(samples) < 2:
+        return (samples.mean(axis=0) if len(samples) else np.nan), np.nan
+    z = statistics.NormalDist().inv_cdf(0.5 + level/2)
+    return samples.mean(axis=0), z * samples.std(axis=0, ddof=1) / np.sqrt(len(samples))
+
+
+class StatsJob:
+
+    def __init__(self, params, repeats, seed=None, workers=None, stats_sr=5, cache=None, target=None,
+                 max_repeats=200, batch=10, level=0.95):
+        """
+        runs repeats replicas of one parameter set on a pool of worker processes
+        in the background. the caller polls it for completed replicas, so it can
+        show progress and a running mean, and may cancel the outstanding ones.
+        replicas are seeded as in sweep(), by their index. with a target precision,
+        batches of replicas are added, as in adaptive_sweep(), until it is reached.
+
+        Args:
+            params (dict): Simulation arguments, as in sweep()
+            repeats (int): number of replicas, the least number with a target
+            seed (int, optional): entropy of the job. Defaults to fresh entropy.
+            workers (int, optional): number of worker processes. Defaults to the number of cores.
+            stats_sr (int, optional): number of iterations between spread samples. Defaults to 5.
+            cache (Cache.ResultCache, optional): cache of replica results, as in sweep(). cached replicas
+            count as completed from the start, and all of them are stored once the job is done. Defaults to None.
+            target (float, optional): largest half width of the final spread's confidence interval. Defaults to None.
+            max_repeats (int, optional): most replicas run to reach the target. Defaults to 200.
+            batch (int, optional): replicas added while the target is not reached. Defaults to 10.
+            level (float, optional): confidence level of the target. Defaults to 0.95.
+        """
+        check_stats_sr([params], stats_sr)
+        stream = None if seed is None else np.random.SeedSequence(seed, spawn_key=(0,))
+        if seed is None:
+            seed = np.random.SeedSequence().entropy
+        self.params = params
+        self.seed = seed
+        self.workers = workers
+        self.stats_sr = stats_sr
+        self.cache = cache
+        self.target = target
+        self.max_repeats = max(max_repeats, repeats)
+        self.batch = batch
+        self.level = level
+        self.key, self.cached = cached_replicas(cache, params, stats_sr, stream)
+        self.results = {}
+        self.final_spread = {}
+        self.cancelled = False
+        self.executor = None
+        self.futures = {}
+        self.repeats = 0
+        self.extend(repeats)
+        self.advance()
+
+    def extend(self, repeats):
+        """
+        brings the job up to a number of replicas, taking the cached ones first
+
+        Args:
+            repeats (int): number of replicas
+        """
+        tasks = []
+        for replica in range(self.repeats, repeats):
+            if replica < len(self.cached):
+                self.results[replica] = self.cached[replica]
+                self.final_spread[replica] = self.cached[replica][0][-1]
+                continue
+            tasks.append((self.params, task_seed(self.seed, 0, replica), self.stats_sr, False))
+        self.repeats = max(self.repeats, repeats)
+        if not tasks:
+            return
+        if self.executor is None:
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        # small batches, so progress is reported often
+        for batch in batch_tasks(tasks, self.workers or os.cpu_count(), rounds=4):
+            self.futures[self.executor.submit(run_replicas, batch)] = [seed.spawn_key[1] for seed in batch[1]]
+
+    def advance(self):
+        """adds batches of replicas, once the previous ones completed, until the target precision is reached"""
+        while (self.target is not None and not self.futures and not self.cancelled
+               and not self.converged and self.repeats < self.max_repeats):
+            self.extend(min(self.repeats + self.batch, self.max_repeats))
+
+    @property
+    def converged(self):
+        """true when the job has a target precision and reached it"""
+        return self.target is not None and self.mean_ci(self.level)[1] <= self.target
+
+    def poll(self):
+        """
+        collects the replicas which completed since the last call, without waiting
+
+        Returns:
+            int: number of newly completed replicas
+        """
+        completed = [future for future in self.futures if future.done() and not future.cancelled()]
+        newly = 0
+        for future in completed:
+            for replica, result in zip(self.futures.pop(future), future.result()):
+                self.results[replica] = result
+                self.final_spread[replica] = result[0][-1]
+                newly += 1
+        self.advance()
+        if self.done and self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+            # a cancelled job's replicas are the quickest ones, which would bias the cache
+            if not self.cancelled:
+                store_replicas(self.cache, self.key, [self.results[replica] for replica in sorted(self.results)])
+        return newly
+
+    @property
+    def completed(self):
+        return len(self.final_spread)
+
+    @property
+    def done(self):
+        return self.cancelled or not self.futures
+
+    def mean_ci(self, level=0.95):
+        """
+        Returns:
+            (float, float): mean final spread of the completed replicas and
+            half the width of its confidence interval
+        """
+        ordered = [self.final_spread[replica] for replica in sorted(self.final_spread)]
+        return confidence_interval(ordered, level)
+
+    def cancel(self, terminate=False):
+        """
+        cancels the replicas which have not started, running ones are left to finish and ignored
+
+        Args:
+            terminate (bool, optional): terminate the worker processes instead, so the running
+            replicas stop too, as when the program exits. Defaults to False.
+        """
+        self.cancelled = True
+        self.futures.clear()
+        if self.executor is not None:
+            # the executor has no way to stop the tasks which already started but through its processes
+            processes = list((self.executor._processes or {}).values()) if terminate else []
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+            self.executor = None
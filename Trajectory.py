@@ -0,0 +1,302 @@
+import json
+import os
+import zipfile
+import numpy as np
+import Engine
+from Lattice import CellLattice
+
+
+# format version written to every trajectory file's header
+VERSION = 1
+
+# number of iterations whose events are stored together in one entry
+CHUNK = 256
+
+# iterations between the states a replay keeps in memory to seek back to
+KEYFRAMES = 32
+
+
+def write_entry(archive, name, array):
+    """
+    writes an array as a .npy entry of a zip archive, the way np.savez does
+
+    Args:
+        archive (ZipFile): archive open for writing
+        name (str): name of the entry, without the .npy extension
+        array (ndarray): the array to write
+    """
+    with archive.open(name + '.npy', 'w', force_zip64=True) as file:
+        np.lib.format.write_array(file, np.asanyarray(array), allow_pickle=False)
+
+
+class TrajectoryWriter:
+
+    def __init__(self, path, simulation, chunk=CHUNK):
+        """
+        writes a simulation's trajectory to a compressed .npz file: its parameters,
+        seed and initial lattice once, and then only the cells which decide to spread
+        the rumour in each iteration, chunk iterations per entry.
+        the cells of each iteration are stored sorted, as differences between
+        consecutive cells, which compress to a small fraction of their size.
+        everything else a frame holds follows from these events without any
+        random draws, see Trajectory. must be created before the simulation runs.
+
+        Args:
+            path (str): path of the .npz file to write
+            simulation (Sim.Simulation): the simulation to record, before its first iteration
+            chunk (int, optional): number of iterations stored per entry. Defaults to CHUNK.
+        """
+        if simulation.engine == 'graph':
+            raise ValueError("trajectories are replayed on the grid, simulations on a contact graph can not be recorded")
+        self.simulation = simulation
+        self.chunk = chunk
+        self.path = path
+        self.archive = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED)
+
+        lattice = simulation.lattice
+        for field in ('exists_bits', 'sus_index', 'cooldown', 'got_rumour'):
+            write_entry(self.archive, field, getattr(lattice, field))
+
+        # iteration in which each person first heard the rumour, -1 if they never did
+        dtype = np.result_type(np.int8, np.min_scalar_type(simulation.iterations))
+        self.first_reached = np.where(lattice.got_rumour > 0, 0, -1).astype(dtype).ravel()
+        self.spreading = self.decided_cells()
+        self.cells = []
+        self.counts = []
+        self.chunks = 0
+
+    def decided_cells(self):
+        """
+        Returns:
+            ndarray: sorted row major indices of the people who spread the rumour next iteration
+        """
+        simulation = self.simulation
+        if simulation.engine == 'frontier':
+            return simulation.frontier.wheel[-1]
+        if simulation.engine == 'tiled':
+            # only the tiles with spreaders are read
+            engine = simulation.tiled
+            width = simulation.shape[1]
+            cells = [start * width + np.flatnonzero(simulation.lattice.cooldown[start:start + engine.rows] == simulation.l)
+                     for tile, start in enumerate(engine.starts) if engine.spreading[tile]]
+            return np.concatenate(cells) if cells else np.zeros(0, dtype=np.intp)
+        return np.flatnonzero(simulation.lattice.cooldown.ravel() == simulation.l)
+
+    def append(self, iteration):
+        """
+        stores the events of an iteration which just ran
+
+        Args:
+            iteration (int): number of the iteration
+        """
+        lattice = self.simulation.lattice
+        targets = Engine.neighbour_cells(self.spreading, lattice.shape)
+        targets = targets[lattice.exists_flat(targets)]
+        self.first_reached[targets[self.first_reached[targets] < 0]] = iteration
+
+        self.spreading = self.decided_cells()
+        self.cells.append(np.diff(self.spreading, prepend=0).astype(np.uint32))
+        self.counts.append(len(self.spreading))
+        if len(self.counts) == self.chunk:
+            self.flush()
+
+    def flush(self):
+        """writes the events stored so far as the next chunk"""
+        if not self.counts:
+            return
+        write_entry(self.archive, f'cells_{self.chunks:05d}', np.concatenate(self.cells))
+        write_entry(self.archive, f'counts_{self.chunks:05d}', np.array(self.counts, dtype=np.uint32))
+        self.chunks += 1
+        self.cells = []
+        self.counts = []
+
+    def close(self):
+        """writes the last chunk, the per person and per iteration summaries and the header"""
+        self.flush()
+        simulation = self.simulation
+        write_entry(self.archive, 'first_reached', self.first_reached.reshape(simulation.shape))
+        write_entry(self.archive, 'metrics', simulation.get_metrics())
+
+        # only integer seeds can be written down, generators and sequences are not kept
+        seed = simulation.seed if isinstance(simulation.seed, (int, np.integer)) else None
+        header = dict(version=VERSION, p=simulation.p, l=simulation.l, distribution=list(simulation.distribution),
+                      iterations=simulation.iterations, shape=list(simulation.shape), engine=simulation.engine,
+                      seed=None if seed is None else int(seed), chunk=self.chunk,
+                      termination=simulation.termination, population=int(simulation.population))
+        write_entry(self.archive, 'header', np.array(json.dumps(header)))
+        self.archive.close()
+
+    def discard(self):
+        """closes and removes the file of a run which did not finish, which would replay as a run that stopped"""
+        self.archive.close()
+        os.remove(self.path)
+
+
+def record(simulation, path, stats_sr=5, chunk=CHUNK):
+    """
+    runs the whole simulation, writing its trajectory instead of keeping any frame
+
+    Args:
+        simulation (Sim.Simulation): the simulation to run, before its first iteration
+        path (str): path of the .npz file to write
+        stats_sr (int, optional): number of iterations between spread samples. Defaults to 5.
+        chunk (int, optional): number of iterations stored per entry. Defaults to CHUNK.
+
+    Returns:
+        ndarray: the spread sampled every stats_sr iterations
+    """
+    writer = TrajectoryWriter(path, simulation, chunk)
+    stats = simulation.new_stats(stats_sr)
+    try:
+        for i, lattice in simulation.steps():
+            writer.append(i)
+            simulation.sample_stats(stats, i, stats_sr)
+        simulation.pad_stats(stats, stats_sr)
+    except BaseException:
+        writer.discard()
+        raise
+    writer.close()
+    return stats
+
+
+class Trajectory:
+
+    def __init__(self, path, keyframes=KEYFRAMES):
+        """
+        replays a trajectory file without simulating again. the lattice of any
+        iteration is rebuilt by applying the recorded events to the initial lattice,
+        from the nearest earlier state kept in memory, and only the chunks of events
+        which are needed are read from the file.
+
+        Args:
+            path (str): path of a file written by TrajectoryWriter
+            keyframes (int, optional): iterations between the states kept to seek back to, None keeps
+            no state, for replays which only go forward. Defaults to KEYFRAMES.
+        """
+        self.file = np.load(path)
+        header = json.loads(str(self.file['header']))
+        if header['version'] != VERSION:
+            self.file.close()
+            raise ValueError(f"unsupported trajectory version {header['version']}, expected {VERSION}")
+        if header['termination'] is None:
+            self.file.close()
+            raise ValueError(f"'{path}' is the trajectory of a run which did not finish, it can not be replayed")
+        self.p = header['p']
+        self.l = header['l']
+        self.distribution = tuple(header['distribution'])
+        self.iterations = header['iterations']
+        self.shape = tuple(header['shape'])
+        self.engine = header['engine']
+        self.seed = header['seed']
+        self.chunk = header['chunk']
+        self.termination = header['termination']
+        self.population = header['population']
+        self.first_reached = self.file['first_reached']
+        self.metrics = self.file['metrics']
+
+        self.initial = CellLattice(self.shape, self.l, self.iterations)
+        for field in ('exists_bits', 'sus_index', 'cooldown', 'got_rumour'):
+            setattr(self.initial, field, self.file[field])
+        self.initial_spreaders = np.flatnonzero(self.initial.cooldown.ravel() == self.l)
+
+        self.loaded = None
+        self.keyframe_interval = keyframes
+        self.keyframes = {}
+        self.lattice = self.initial.copy()
+        # the replay's lattice is the state before this iteration runs
+        self.iteration = 0
+
+    def close(self):
+        self.file.close()
+
+    def decided(self, iteration):
+        """
+        Args:
+            iteration (int): number of an iteration
+
+        Returns:
+            ndarray: row major indices of the people who decided to spread the rumour in it
+        """
+        if iteration >= self.termination:
+            return np.zeros(0, dtype=np.intp)
+        index, step = divmod(iteration, self.chunk)
+        if self.loaded is None or self.loaded[0] != index:
+            counts = self.file[f'counts_{index:05d}']
+            offsets = np.concatenate(([0], np.cumsum(counts, dtype=np.intp)))
+            self.loaded = (index, self.file[f'cells_{index:05d}'], offsets)
+        index, cells, offsets = self.loaded
+        return np.cumsum(cells[offsets[step]:offsets[step+1]], dtype=np.intp)
+
+    def advance(self):
+        """runs the next iteration on the replay's lattice, from the recorded events"""
+        i = self.iteration
+        lattice = self.lattice
+        spreaders = self.initial_spreaders if i == 0 else self.decided(i-1)
+
+        # the same updates as Engine.vectorized_step, with the decisions read from the file
+        heard_rumour = lattice.heard_rumour.ravel()
+        got_rumour = lattice.got_rumour.ravel()
+        heard_rumour[...] = 0
+        targets = Engine.neighbour_cells(spreaders, self.shape)
+        targets = targets[lattice.exists_flat(targets)]
+        reached, heard = np.unique(targets, return_counts=True)
+        heard_rumour[reached] = heard
+        got_rumour[reached] += heard.astype(got_rumour.dtype)
+
+        cooldown = lattice.cooldown
+        np.subtract(cooldown, 1, out=cooldown, where=cooldown > 0)
+        cooldown.ravel()[self.decided(i)] = self.l
+
+        self.iteration = i + 1
+        if self.keyframe_interval and self.iteration % self.keyframe_interval == 0:
+            self.keyframes.setdefault(self.iteration, lattice.copy())
+
+    def seek(self, iteration):
+        """
+        rebuilds the lattice as it was after the given iteration
+
+        Args:
+            iteration (int): number of the iteration
+
+        Returns:
+            CellLattice: the replay's lattice, which the next seek overwrites
+        """
+        if not 0 <= iteration < self.iterations:
+            raise IndexError(f"iteration {iteration} is out of range, the trajectory has {self.iterations}")
+        target = iteration + 1
+        if target < self.iteration:
+            start = max((k for k in self.keyframes if k <= target), default=0)
+            self.lattice = self.keyframes[start].copy() if start else self.initial.copy()
+            self.iteration = start
+        while self.iteration < target:
+            self.advance()
+        return self.lattice
+
+    def frame(self, iteration, visuals):
+        """
+        Args:
+            iteration (int): number of the iteration
+            visuals (str): 'cooldown', 'heard rumour' or 'got_rumour'
+
+        Returns:
+            ndarray: the values shown for the iteration, as Render.frame_values gives them
+        """
+        if visuals == 'heard rumour':
+            # known without rebuilding the lattice
+            return ((self.first_reached >= 0) & (self.first_reached <= iteration))*1
+        return self.seek(iteration)[visuals]
+
+    def stats(self, iteration):
+        """
+        Returns:
+            float: portion of the population which had heard the rumour after the iteration
+        """
+        return self.metrics['reached'][iteration] / self.population
+
+    def frames(self, visuals, start=0):
+        """
+        Yields:
+            (int, ndarray, float): iteration number, frame values and spread, from start to the last iteration
+        """
+        for i in range(start, self.iterations):
+            yield i, self.frame(i, visuals), self.stats(i)
@@ -1,7 +1,18 @@
+import argparse
+import itertools
+import json
+import os
 import Sim
-import Gui
+import Sweep
+import Strategy
+import Trajectory
+import Export
+import Render
+import Profile
+import Cache
+import Graph
+import Optimize
 import numpy as np
-import matplotlib.pyplot as plt
 
 def check_sum(s1, s2, s3, s4):
         """check if an arbitrary set of distribution values
@@ -23,6 +34,9 @@ def check_sum(s1, s2, s3, s4):
         
 
 def draw_graph(stats_samples, results, labels, title):
+    # imported here so that batch runs never load a plotting backend
+    import matplotlib.pyplot as plt
+
     x = np.arange(stats_samples)
     x = x*5
     colors = []
@@ -38,38 +52,20 @@ def draw_graph(stats_samples, results, labels, title):
     plt.title(title)
     
 
-def strategic_sim(shape=(100,100)):
-    """
-    creates a new lattice graph of people with random assignments according
-    to the given distribution parameters.
+def strategic_sim(shape=(100,100), rng=None):
     """
-    features = np.dtype([('exists', 'bool'), ('sus_level', 'f8'), ('heard_rumour','i4'),('cooldown','i4'),('got_rumour', 'i4')])
-    lattice = np.ndarray(shape=shape, dtype=features)
-    
-    # generate initial lattice, all cells exist and have susceptibilty level of 1
-    lattice['exists'] = np.full(shape, True)
-    lattice['sus_level'] = np.zeros(shape)
-
-    for i in range(0, 100, 5):
-        for j in range(0, 100, 5):
-            lattice[i:i+3, j:j+3]['sus_level'] = 1
-            lattice[i+3, j:j+5]['sus_level'] = 1/3
-            lattice[i:i+5, j+3]['sus_level'] = 1/3
-            lattice[i+4, j:j+5]['sus_level'] = 1/3
-            lattice[i:i+5, j+4]['sus_level'] = 1/3
-
-    # for i in range(5, 100, 6):
-    #     lattice[:, i:i+5]['sus_level'] = np.array([2/3, 2/3, 2/3, 2/3, 2/3])
-
-    lattice['heard_rumour'] = np.zeros(shape)
-    lattice['cooldown'] = np.zeros(shape)
-    lattice['got_rumour'] = np.zeros(shape)
-
-    return lattice
+    creates a lattice where every cell holds a person, arranged in 3x3 blocks
+    of susceptibility level 1 separated by borders of level 1/3, 2 cells wide.
 
+    Args:
+        shape (tuple, optional): shape of the lattice. Defaults to (100,100).
+        rng (Generator, optional): unused, the pattern is fixed.
+    """
+    return Strategy.blocks(size=3, border=2, inner=1, outer=1/3)(shape, rng)
 
 
-def generate_dist_stats(distributions, p, l , iterations=100, repeats = 15, stats_samples = 20):
+def generate_dist_stats(distributions, p, l , iterations=100, repeats = 15, stats_samples = 20, seed=None, workers=None, profile=False, cache=True,
+                        target=None, max_repeats=200):
     """generate graph of spread rate per iteration for all distributions given.
     the sample rate is set by the stats_samples argument divided by the iterations argument.
 
@@ -80,30 +76,35 @@ def generate_dist_stats(distributions, p, l , iterations=100, repeats = 15, stat
         iterations (int, optional): number of iterations. Defaults to 100.
         repeats (int, optional): number of times the simulation is run per parameter value. Defaults to 15.
         stats_samples (int, optional): how many samples should be taken during the simulation. Defaults to 20.
+        seed (int, optional): seed of the whole study, the same seed gives the same graph. Defaults to fresh entropy.
+        workers (int, optional): number of worker processes. Defaults to the number of cores.
+        profile (bool, optional): print where the simulations spent their time. Defaults to False.
+        cache (bool or Cache.ResultCache, optional): reuse and store the replicas' results, True uses
+        the cache in Cache.DIRECTORY. Defaults to True.
+        target (float, optional): keep adding replicas, after the first repeats, until the confidence interval
+        of every final spread is at most this wide on either side, see Sweep.adaptive_sweep. Defaults to None.
+        max_repeats (int, optional): most replicas per parameter value with a target. Defaults to 200.
     """
-    stats_sr = iterations//stats_samples
-    dist_results = np.zeros((len(distributions), stats_samples))
-    dist_labels = []
+    stats_sr = max(1, iterations//stats_samples)
+    param_sets = []
     for dist in range(len(distributions)):
-        average_spread = np.zeros(stats_samples)
         distributions[dist] = check_sum(*distributions[dist])
-        sim_values = [p, l, *distributions[dist], iterations]
-
-        for i in range(repeats):
-            sim = Sim.Simulation(*sim_values)
-            frames, stats = sim.run(preprocess=True, stats_sr=stats_sr)
-            for i in range(0, stats_samples):
-                average_spread[i] += stats[i]
-
-        average_spread = average_spread/repeats
-        dist_results[dist] = average_spread
+        s1, s2, s3, s4 = distributions[dist]
+        param_sets.append(dict(p=p, l=l, s1=s1, s2=s2, s3=s3, s4=s4, iterations=iterations))
 
-        dist_labels.append(f'distribution: {dist+1}; STD: {round(np.std(dist_results[dist]),3)}')
+    table, precision = run_study(param_sets, repeats, seed, workers, stats_sr, profile, cache, target, max_repeats)
+    if profile:
+        print(Profile.format_summary(Sweep.profile_summary(table)))
+    dist_results = Sweep.mean_spread(table)[:, :stats_samples]
+    dist_labels = []
+    for dist in range(len(distributions)):
+        dist_labels.append(f'distribution: {dist+1}; STD: {round(np.std(dist_results[dist]),3)}' + precision_label(precision, dist))
         
     draw_graph(stats_samples, dist_results, dist_labels, "Distributions Spread Rate")
 
 
-def generate_L_stats(upper_limit, p, dist, iterations=100, repeats = 15, stats_samples = 20):
+def generate_L_stats(upper_limit, p, dist, iterations=100, repeats = 15, stats_samples = 20, seed=None, workers=None, profile=False, cache=True,
+                     target=None, max_repeats=200):
     """generate graph of spread rate per iteration for all L values between 2 and the upper limit.
     the sample rate is set by the stats_samples argument divided by the iterations argument.
 
@@ -114,33 +115,414 @@ def generate_L_stats(upper_limit, p, dist, iterations=100, repeats = 15, stats_s
         iterations (int, optional): number of iterations. Defaults to 100.
         repeats (int, optional): number of times the simulation is run per parameter value. Defaults to 15.
         stats_samples (int, optional): how many samples should be taken during the simulation. Defaults to 20.
+        seed (int, optional): seed of the whole study, the same seed gives the same graph. Defaults to fresh entropy.
+        workers (int, optional): number of worker processes. Defaults to the number of cores.
+        profile (bool, optional): print where the simulations spent their time. Defaults to False.
+        cache (bool or Cache.ResultCache, optional): reuse and store the replicas' results, True uses
+        the cache in Cache.DIRECTORY. Defaults to True.
+        target (float, optional): keep adding replicas, after the first repeats, until the confidence interval
+        of every final spread is at most this wide on either side, see Sweep.adaptive_sweep. Defaults to None.
+        max_repeats (int, optional): most replicas per parameter value with a target. Defaults to 200.
     """
-    stats_sr = iterations//stats_samples
-    limit_results = np.zeros((upper_limit - 2, stats_samples))
-    limit_labels = []
-    for l in range(2,upper_limit):
-        average_spread = np.zeros(stats_samples)
-        sim_values = [p, l, *dist, iterations]
-
-        for i in range(repeats):
-            sim = Sim.Simulation(*sim_values)
-            frames, stats = sim.run(preprocess=True, stats_sr=stats_sr)
-            for i in range(0, stats_samples):
-                average_spread[i] += stats[i]
+    stats_sr = max(1, iterations//stats_samples)
+    s1, s2, s3, s4 = dist
+    param_sets = [dict(p=p, l=l, s1=s1, s2=s2, s3=s3, s4=s4, iterations=iterations)
+                  for l in range(2,upper_limit)]
 
-        average_spread = average_spread/repeats
-        limit_results[l-2] = average_spread
-        limit_labels.append(f"L={l}")
+    table, precision = run_study(param_sets, repeats, seed, workers, stats_sr, profile, cache, target, max_repeats)
+    if profile:
+        print(Profile.format_summary(Sweep.profile_summary(table)))
+    limit_results = Sweep.mean_spread(table)[:, :stats_samples]
+    limit_labels = [f"L={l}" + precision_label(precision, index) for index, l in enumerate(range(2,upper_limit))]
 
     draw_graph(stats_samples, limit_results, limit_labels, "L Spread Rates")
 
-     
 
 
-     
+def run_study(param_sets, repeats, seed, workers, stats_sr, profile, cache, target, max_repeats):
+    """
+    runs the replicas of a study's parameter sets, a fixed number of them or, with a target,
+    as many as Sweep.adaptive_sweep needs
+
+    Returns:
+        (ndarray, ndarray): the results of every replica, and the precision reached
+        by every parameter set, None without a target
+    """
+    cache = Cache.get_cache(cache)
+    if target is None:
+        return Sweep.sweep(param_sets, repeats, seed=seed, workers=workers, stats_sr=stats_sr,
+                           profile=profile, cache=cache), None
+    return Sweep.adaptive_sweep(param_sets, target, min_repeats=repeats, max_repeats=max_repeats, seed=seed,
+                                workers=workers, stats_sr=stats_sr, cache=cache, profile=profile)
+
+
+def precision_label(precision, index):
+    """the final spread and the precision reached by a parameter set, for a graph's legend"""
+    if precision is None:
+        return ''
+    row = precision[index]
+    return f"; {round(row['mean']*100, 2)}% ± {round(row['half_width']*100, 2)}% ({row['replicas']} repeats)"
+
+
+# strategies the command line can run, by name
+STRATEGIES = {
+    'strategic': Strategy.blocks,
+    'blocks': Strategy.blocks,
+    'stripes': Strategy.stripes,
+    'clusters': Strategy.random_clusters,
+    'custom': Strategy.custom,
+}
+
+
+def write_table(path, table):
+    """
+    writes a record array to a file, in the format given by its extension:
+    .csv with one column per field (array fields get one column per item),
+    .json as a list of objects, or .npz holding the array itself
+
+    Args:
+        path (str): path of the file to write
+        table (ndarray): a structured array
+    """
+    if path.endswith('.npz'):
+        np.savez_compressed(path, table=table)
+        return
+
+    rows = [{name: table[name][row].tolist() for name in table.dtype.names} for row in range(len(table))]
+    if path.endswith('.json'):
+        with open(path, 'w') as file:
+            json.dump(rows, file, indent=1)
+    elif path.endswith('.csv'):
+        columns = []
+        for name in table.dtype.names:
+            shape = table.dtype[name].shape
+            columns += [f"{name}_{i}" for i in range(shape[0])] if shape else [name]
+        with open(path, 'w') as file:
+            file.write(','.join(columns) + '\n')
+            for row in rows:
+                values = []
+                for value in row.values():
+                    values += value if isinstance(value, list) else [value]
+                file.write(','.join(str(value) for value in values) + '\n')
+    else:
+        raise ValueError(f"unknown output format of '{path}', expected .csv, .json or .npz")
+
+
+def parse_strategy(name, args):
+    """
+    builds a named strategy, passing it key=value arguments
+
+    Args:
+        name (str): one of STRATEGIES, or None for no strategy
+        args (list): 'key=value' strings, values are read as numbers
+
+    Returns:
+        a strategy, or None
+    """
+    if name is None:
+        return None
+    kwargs = {}
+    for arg in args:
+        key, value = arg.split('=', 1)
+        kwargs[key] = json.loads(value)
+    return STRATEGIES[name](**kwargs)
+
+
+def parse_graph(args, seed=None):
+    """
+    reads or generates the contact graph of the run command
+
+    Args:
+        args (Namespace): the parsed arguments
+        seed (SeedSequence, optional): seed of a generated graph. Defaults to None, fresh entropy.
+
+    Returns:
+        csr_matrix: the graph, or None for the grid
+    """
+    if args.graph:
+        return Graph.read_graph(args.graph, args.nodes, args.directed)
+    if args.graph_model:
+        kwargs = {}
+        for arg in args.graph_arg:
+            key, value = arg.split('=', 1)
+            kwargs[key] = json.loads(value)
+        return Graph.MODELS[args.graph_model](args.nodes, rng=seed, **kwargs)
+    return None
+
+
+def add_parameters(parser, many=False):
+    """
+    adds the simulation parameters to a command's parser
+
+    Args:
+        parser (ArgumentParser): the command's parser
+        many (bool, optional): accept several values per parameter, to sweep over. Defaults to False.
+    """
+    nargs = '+' if many else None
+    def default(value):
+        return [value] if many else value
+    parser.add_argument('--p', type=float, nargs=nargs, default=default(0.8), help='portion of existing cells')
+    parser.add_argument('--l', type=int, nargs=nargs, default=default(5), help='cooldown on spreading a rumour')
+    parser.add_argument('--dist', type=float, nargs=4, action='append' if many else 'store',
+                        metavar=('S1', 'S2', 'S3', 'S4'), help='portion of each susceptibility level')
+    parser.add_argument('--iterations', type=int, nargs=nargs, default=default(100), help='number of iterations')
+    parser.add_argument('--shape', type=int, nargs=2, default=(100, 100), metavar=('HEIGHT', 'WIDTH'))
+    parser.add_argument('--strategy', choices=STRATEGIES, help='place people following a strategy')
+    parser.add_argument('--strategy-arg', action='append', default=[], metavar='KEY=VALUE',
+                        help='argument of the strategy, may be repeated')
+    parser.add_argument('--seed', type=int, help='seed, the same seed gives the same results')
+    parser.add_argument('--stats-sr', type=int, default=5, help='iterations between spread samples')
+    parser.add_argument('--output', '-o', help='results file, .csv, .json or .npz')
+    parser.add_argument('--profile', action='store_true', help='print the time spent in each phase of the iterations')
+
+
+def run_command(args):
+    """runs a single simulation and writes its per iteration metrics"""
+    dist = args.dist or (0.7, 0.15, 0.1, 0.05)
+    profiler = Profile.Profiler() if args.profile or args.profile_output else None
+    if args.resume and os.path.exists(args.checkpoint):
+        # the parameters are the checkpoint's, the run carries on from its last saved iteration
+        simulation = Sim.Simulation.load(args.checkpoint, profiler=profiler, directory=args.directory)
+        print(f"resuming after iteration {len(simulation.history)} of {simulation.iterations}")
+    else:
+        seed, graph_seed = args.seed, None
+        if args.graph_model:
+            # seeded alike, the graph's draws would be the population's, and where people are would follow the edges
+            graph_seed, seed = np.random.SeedSequence(args.seed).spawn(2)
+        simulation = Sim.Simulation(args.p, args.l, *check_sum(*dist), args.iterations, tuple(args.shape),
+                                    strategy=parse_strategy(args.strategy, args.strategy_arg),
+                                    engine=args.engine, seed=seed, profiler=profiler,
+                                    tile_budget=args.tile_budget << 20, directory=args.directory, workers=args.workers,
+                                    graph=parse_graph(args, graph_seed))
+    if args.trajectory:
+        Trajectory.record(simulation, args.trajectory, args.stats_sr)
+    else:
+        simulation.run_stats(args.stats_sr, args.checkpoint, args.checkpoint_every)
+
+    metrics = simulation.get_metrics()
+    table = np.zeros(len(metrics), dtype=[('iteration', 'i4'), *Sim.METRICS.descr, ('spread', 'f8')])
+    table['iteration'] = np.arange(len(metrics))
+    for name in Sim.METRICS.names:
+        table[name] = metrics[name]
+    table['spread'] = metrics['reached'] / simulation.population
+
+    print(f"spread: {round(simulation.get_stats()*100, 2)}%, stopped after {simulation.termination} iterations")
+    if args.output:
+        write_table(args.output, table)
+    if profiler:
+        print(profiler.report())
+    if args.profile_output:
+        write_table(args.profile_output, profiler.get_records())
+
+
+def sweep_command(args):
+    """runs every combination of the given parameter values and writes every replica's spread"""
+    dists = args.dist or [(0.7, 0.15, 0.1, 0.05)]
+    strategy = parse_strategy(args.strategy, args.strategy_arg)
+    param_sets = []
+    for p, l, dist, iterations in itertools.product(args.p, args.l, dists, args.iterations):
+        s1, s2, s3, s4 = check_sum(*dist)
+        param_sets.append(dict(p=p, l=l, s1=s1, s2=s2, s3=s3, s4=s4, iterations=iterations,
+                               shape=tuple(args.shape), strategy=strategy))
+
+    cache = None if args.no_cache else Cache.ResultCache(args.cache_dir, args.cache_size << 20)
+    if args.target is None:
+        table = Sweep.sweep(param_sets, args.repeats, seed=args.seed, workers=args.workers, stats_sr=args.stats_sr,
+                            profile=args.profile, cache=cache)
+    else:
+        table, precision = Sweep.adaptive_sweep(param_sets, args.target / 100, args.repeats, args.max_repeats, args.batch,
+                                                seed=args.seed, workers=args.workers, stats_sr=args.stats_sr,
+                                                cache=cache, curve=args.curve, profile=args.profile)
+    for index, params in enumerate(param_sets):
+        spread = table['spread'][table['param_set'] == index, -1]
+        mean, half_width = Sweep.confidence_interval(spread)
+        result = f"{round(mean*100, 2)}% ± {round(half_width*100, 2)}% ({len(spread)} repeats)"
+        if args.target is not None and not precision['converged'][index]:
+            result += ', target not reached'
+        print(f"p={params['p']} l={params['l']} dist={[params[s] for s in ('s1', 's2', 's3', 's4')]} "
+              f"iterations={params['iterations']}: {result}")
+    if args.profile:
+        print(Profile.format_summary(Sweep.profile_summary(table)))
+    if args.output:
+        write_table(args.output, table)
+
+
+def optimize_command(args):
+    """searches for the placement of the susceptibility levels with the least, or the most, final spread"""
+    dist = check_sum(*(args.dist or (0.7, 0.15, 0.1, 0.05)))
+    optimizer = Optimize.Optimizer(dist, args.l, args.iterations, tuple(args.shape), args.p, args.repeats,
+                                   args.race_batch, seed=args.seed, workers=args.workers, maximize=args.maximize)
+    def report(generation, name, spread):
+        print(f"generation {generation}: {name}, {round(spread*100, 2)}%")
+    result = optimizer.search(args.generations, args.mutants, args.swaps, tuple(args.tile), callback=report)
+
+    print(f"best: {result['name']}, {round(result['spread']*100, 2)}% ± {round(result['half_width']*100, 2)}%, "
+          f"{round(result['validated']*100, 2)}% ± {round(result['validated_half_width']*100, 2)}% on new replicas")
+    print(f"{result['simulations']} simulations, {result['pruned']} candidates pruned")
+    tile = json.dumps(result['tile'].tolist())
+    print(f"run it with: --strategy custom --strategy-arg 'tile={tile}'")
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(dict(name=result['name'], tile=result['tile'].tolist(), spread=result['spread'],
+                           half_width=result['half_width'], validated=result['validated'],
+                           validated_half_width=result['validated_half_width'], simulations=result['simulations'],
+                           pruned=result['pruned'], history=result['history']), file, indent=1)
+
+
+def branch_command(args):
+    """runs continuations of saved simulations, each with its own random stream"""
+    snapshots = []
+    for path in args.snapshots:
+        with np.load(path) as file:
+            snapshots.append(dict(file))
+    table = Sweep.branch_sweep(snapshots, args.branches, seed=args.seed, workers=args.workers, stats_sr=args.stats_sr)
+    for index, path in enumerate(args.snapshots):
+        spread = table['spread'][table['param_set'] == index, -1]
+        mean, half_width = Sweep.confidence_interval(spread)
+        print(f"{path}, after iteration {len(snapshots[index]['history'])}: "
+              f"{round(mean*100, 2)}% ± {round(half_width*100, 2)}% ({len(spread)} branches)")
+    if args.output:
+        write_table(args.output, table)
+
+
+def export_command(args):
+    """writes an animation of a new simulation, or of a saved trajectory"""
+    profiler = Profile.Profiler() if args.profile and not args.trajectory else None
+    if args.trajectory:
+        source = args.trajectory
+    else:
+        dist = args.dist or (0.7, 0.15, 0.1, 0.05)
+        source = Sim.Simulation(args.p, args.l, *check_sum(*dist), args.iterations, tuple(args.shape),
+                                strategy=parse_strategy(args.strategy, args.strategy_arg),
+                                engine=args.engine, seed=args.seed, profiler=profiler)
+    size = None if args.native else tuple(args.size)
+    written = Export.export(source, args.output, args.visuals, args.stride, size, args.fps)
+    print(f"wrote {written} frames to {args.output}")
+    if profiler:
+        print(profiler.report())
+
+
+def cli(argv=None):
+    """
+    command line entry point. without a command it starts the GUI, the other
+    commands run headless and never import a GUI toolkit:
+        main.py run       one simulation, per iteration metrics
+        main.py sweep     repeats of every combination of parameter values
+        main.py strategy  repeats of a strategic simulation, as a sweep
+        main.py export    an animation of a simulation or of a saved trajectory
+        main.py branch    continuations of saved simulations
+        main.py optimize  a search for the placement of susceptibility levels with the least spread
+    """
+    parser = argparse.ArgumentParser(prog='main.py', description='Rumour spreading simulator')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('gui', help='start the GUI, the default')
+
+    run = commands.add_parser('run', help='run a single simulation')
+    add_parameters(run)
+    run.add_argument('--engine', choices=Sim.ENGINES, default='vectorized')
+    run.add_argument('--trajectory', metavar='PATH', help='also save the trajectory to a .npz file, for replay in the GUI')
+    run.add_argument('--tile-budget', type=int, default=64, metavar='MB',
+                     help='memory the tiled engine may use for a block of rows')
+    run.add_argument('--directory', help="directory of the tiled engine's lattice files, a resumed run's go in a new subdirectory of it, defaults to a temporary one")
+    run.add_argument('--workers', type=int, help='processes of the parallel engine, defaults to the number of CPUs')
+    run.add_argument('--graph', metavar='PATH', help='run on a contact graph, an edge list .txt or .csv, or a scipy .npz matrix')
+    run.add_argument('--directed', action='store_true', help="the --graph edge list's edges only pass the rumour one way")
+    run.add_argument('--graph-model', choices=Graph.MODELS, help='run on a generated contact graph')
+    run.add_argument('--nodes', type=int, help='number of nodes of a generated graph, or of an edge list')
+    run.add_argument('--graph-arg', action='append', default=[], metavar='KEY=VALUE',
+                     help='argument of the graph model, may be repeated')
+    run.add_argument('--checkpoint', metavar='PATH', help='save the simulation to a .npz file as it runs, to resume or branch from')
+    run.add_argument('--checkpoint-every', type=int, default=50, metavar='N', help='iterations between checkpoints')
+    run.add_argument('--resume', action='store_true', help='carry on from the --checkpoint file if it exists')
+    run.add_argument('--profile-output', metavar='PATH', help='write the profile of every iteration, .csv, .json or .npz')
+
+    export = commands.add_parser('export', help='export a .gif or .mp4 animation')
+    add_parameters(export)
+    export.add_argument('--engine', choices=Sim.ENGINES, default='vectorized')
+    export.add_argument('--trajectory', metavar='PATH', help='animate a saved trajectory instead of a new simulation')
+    export.add_argument('--visuals', choices=Render.VISUALS, default='cooldown', help='visualisation type')
+    export.add_argument('--stride', type=int, default=1, help='iterations between frames')
+    export.add_argument('--size', type=int, nargs=2, default=(500, 500), metavar=('HEIGHT', 'WIDTH'),
+                        help='largest size of a frame in pixels')
+    export.add_argument('--native', action='store_true', help='one pixel per cell, ignoring --size')
+    export.add_argument('--fps', type=float, default=10, help='frames per second')
+
+    for name, help_text in (('sweep', 'sweep over parameter values'), ('strategy', 'repeat a strategic simulation')):
+        command = commands.add_parser(name, help=help_text)
+        add_parameters(command, many=True)
+        command.add_argument('--repeats', type=int, default=15, help='replicas per parameter set, the least number with --target')
+        command.add_argument('--target', type=float, metavar='PERCENT',
+                             help='add replicas until the 95%% confidence interval of every final spread is at most ± this wide')
+        command.add_argument('--curve', action='store_true', help='bound the interval of every sample of the spread curve with --target')
+        command.add_argument('--max-repeats', type=int, default=200, help='most replicas per parameter set with --target')
+        command.add_argument('--batch', type=int, default=10, help='replicas added per round with --target')
+        command.add_argument('--workers', type=int, help='worker processes, defaults to the number of cores')
+        command.add_argument('--no-cache', action='store_true', help='run every replica, without reading or writing the cache')
+        command.add_argument('--cache-dir', default=Cache.DIRECTORY, help='directory of the result cache')
+        command.add_argument('--cache-size', type=int, default=Cache.MAX_BYTES >> 20, metavar='MB',
+                             help='size of the result cache, the least recently used results are removed beyond it')
+    commands.choices['strategy'].set_defaults(strategy='strategic')
+
+    branch = commands.add_parser('branch', help='run continuations of saved simulations')
+    branch.add_argument('snapshots', nargs='+', metavar='SNAPSHOT', help='.npz files saved with run --checkpoint')
+    branch.add_argument('--branches', type=int, default=15, help='continuations of every snapshot')
+    branch.add_argument('--seed', type=int, help='seed, the same seed gives the same results')
+    branch.add_argument('--workers', type=int, help='worker processes, defaults to the number of cores')
+    branch.add_argument('--stats-sr', type=int, default=5, help='iterations between spread samples')
+    branch.add_argument('--output', '-o', help='results file, .csv, .json or .npz')
+
+    optimize = commands.add_parser('optimize', help='search for the placement of susceptibility levels with the least spread')
+    optimize.add_argument('--p', type=float, default=0.8, help='portion of existing cells')
+    optimize.add_argument('--l', type=int, default=5, help='cooldown on spreading a rumour')
+    optimize.add_argument('--dist', type=float, nargs=4, metavar=('S1', 'S2', 'S3', 'S4'),
+                          help='portion of each susceptibility level, the budget of every placement')
+    optimize.add_argument('--iterations', type=int, default=100, help='number of iterations')
+    optimize.add_argument('--shape', type=int, nargs=2, default=(100, 100), metavar=('HEIGHT', 'WIDTH'))
+    optimize.add_argument('--tile', type=int, nargs=2, default=(12, 12), metavar=('HEIGHT', 'WIDTH'),
+                          help='shape of the tile repeated across the lattice')
+    optimize.add_argument('--maximize', action='store_true', help='search for the most spread instead')
+    optimize.add_argument('--repeats', type=int, default=20, help='replicas per candidate, the same ones for every candidate')
+    optimize.add_argument('--race-batch', type=int, default=5, help='replicas run before the clearly worse candidates are pruned')
+    optimize.add_argument('--generations', type=int, default=20, help='generations of mutants of the best placement')
+    optimize.add_argument('--mutants', type=int, default=8, help='mutants per generation')
+    optimize.add_argument('--swaps', type=int, default=3, help='most pairs of cells swapped by a mutation')
+    optimize.add_argument('--seed', type=int, help='seed, the same seed gives the same results')
+    optimize.add_argument('--workers', type=int, help='worker processes, defaults to the number of cores')
+    optimize.add_argument('--output', '-o', help='results file, .json')
+
+    args = parser.parse_args(argv)
+    if args.command in (None, 'gui'):
+        import Gui
+        gui = Gui.Gui(strategic_sim)
+        gui.start()
+    elif args.command == 'run':
+        if args.graph_model and not args.nodes:
+            parser.error('--graph-model needs the number of --nodes')
+        if args.resume and not args.checkpoint:
+            parser.error('--resume needs a --checkpoint file')
+        if args.checkpoint and args.trajectory:
+            parser.error('--checkpoint and --trajectory can not be used together')
+        run_command(args)
+    elif args.command == 'export':
+        if not args.output:
+            parser.error('export needs an --output .gif or .mp4 file')
+        export_command(args)
+    elif args.command == 'branch':
+        try:
+            branch_command(args)
+        except ValueError as error:
+            # snapshots of another version, or sampled less often than --stats-sr
+            parser.error(str(error))
+    elif args.command == 'optimize':
+        optimize_command(args)
+    else:
+        if not 1 <= args.stats_sr <= min(args.iterations):
+            parser.error(f'--stats-sr must be between 1 and the number of --iterations, {min(args.iterations)}')
+        sweep_command(args)
+
+
 if __name__ == '__main__':
-    gui = Gui.Gui(strategic_sim)
-    gui.start()
+    cli()
     
     # # some default parmeters for intial testing
     # # pop density parameter
@@ -181,11 +563,8 @@ if __name__ == '__main__':
     # plt.savefig("L_fig.png")
 
     # # run strategic sim multiple times for statistics
-    # average_spread = 0
-    # for i in range(20):
-    #     sim = Sim.Simulation(*sim_values, strategy=strategic_sim)
-    #     sim.run(preprocess=True)
-    #     average_spread += sim.get_stats()
-    # average_spread = average_spread/20*100
+    # params = dict(zip(('p', 'l', 's1', 's2', 's3', 's4', 'iterations'), sim_values), strategy=strategic_sim)
+    # table = Sweep.sweep([params], repeats=20)
+    # average_spread = table['spread'][:, -1].mean()*100
     # print(average_spread)
 